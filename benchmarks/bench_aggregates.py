@@ -0,0 +1,71 @@
+"""
+Benchmark for aggregate functions over a large range.
+
+Fills a rows x cols block of a sheet with numbers (by default 9999 x 100, about
+1M cells, the most rows a sheet allows), then times recomputing SUM, AVERAGE,
+MIN, MAX and COUNT over the whole block after a single cell in it changes.
+SUM, AVERAGE and COUNT fold the change into a running total (see
+IncrementalAggregate); MIN and MAX re-read the block.
+
+    python benchmarks/bench_aggregates.py [--rows N] [--cols N] [--repeat N]
+
+The workbook is filled in 'lazy' mode, which only marks cells dirty, so that
+setting up a million cells doesn't recalculate the workbook each time.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+from sheets.workbook_utility import index_to_cell_location
+
+FUNCTIONS = ['SUM', 'AVERAGE', 'MIN', 'MAX', 'COUNT']
+
+
+def build_workbook(rows, cols):
+    wb = Workbook(eval_mode='lazy')
+    wb.new_sheet("Data")
+    wb.new_sheet("Results")
+    for col in range(cols):
+        for row in range(rows):
+            wb.set_cell_contents("Data", index_to_cell_location(row, col), str(row * cols + col))
+    wb.recalculate()
+    return wb
+
+
+def time_function(wb, name, block, repeat):
+    wb.set_cell_contents("Results", "A1", f"={name}(Data!{block})")
+    wb.get_cell_value("Results", "A1")     # builds the dependency graph
+    timings = []
+    for i in range(repeat):
+        wb.set_cell_contents("Data", "A1", str(i))
+        start = time.perf_counter()
+        wb.get_cell_value("Results", "A1")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=9999)
+    parser.add_argument('--cols', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    wb = build_workbook(args.rows, args.cols)
+    print(f"filled {args.rows * args.cols} cells in {time.perf_counter() - start:.2f}s")
+
+    block = f"A1:{index_to_cell_location(args.rows - 1, args.cols - 1)}"
+    for name in FUNCTIONS:
+        timings = time_function(wb, name, block, args.repeat)
+        print(f"{name:8} median {statistics.median(timings) * 1000:9.2f} ms"
+              f"   min {min(timings) * 1000:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark for very long and very deeply nested formulas.
+
+Generates formulas of --terms terms in a few shapes, e.g.
+
+    chain     =A1+A2*2-A3/4+A1+A2*2-A3/4+...
+    parens    =((((A1+1)*2+A2)*2+A3)...)
+    unary     =-(-(-(...(A1+1)...)))
+    functions =MIN(A1, MAX(A2, MIN(A3, ...)))
+    concat    =A1&A2&"-"&A3&...
+
+and times entering each one (parsing and compiling it) and recalculating it
+after an input changes.  Every shape is also timed at a tenth of the terms:
+the evaluator runs compiled code on a stack of its own, so the time per term
+should stay about the same however deep the formula is.
+
+    python benchmarks/bench_deep_formulas.py [--terms N] [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+
+
+def chain(terms):
+    pieces = ["+A1", "+A2*2", "-A3/4"]
+    return "=" + "".join(pieces[i % 3] for i in range(terms))[1:]
+
+
+def parens(terms):
+    formula = "A1"
+    for i in range(1, terms):
+        formula = f"({formula}+A{i % 3 + 1})" if i % 2 else f"({formula}*2)"
+    return "=" + formula
+
+
+def unary(terms):
+    return "=" + "-(" * terms + "A1+1" + ")" * terms
+
+
+def functions(terms):
+    names = ["MIN", "MAX"]
+    opening = "".join(f"{names[i % 2]}(A{i % 3 + 1}, " for i in range(terms - 1))
+    return "=" + opening + "A1" + ")" * (terms - 1)
+
+
+def concat(terms):
+    pieces = ["A1", "A2", '"-"', "A3"]
+    return "=" + "&".join(pieces[i % 4] for i in range(terms))
+
+
+SHAPES = {'chain': chain, 'parens': parens, 'unary': unary,
+          'functions': functions, 'concat': concat}
+
+
+def time_formula(text, repeat):
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    for row in range(1, 4):
+        wb.set_cell_contents("Sheet1", f"A{row}", str(row))
+    start = time.perf_counter()
+    wb.set_cell_contents("Sheet1", "B1", text)
+    entered = time.perf_counter() - start
+    value = wb.get_cell_value("Sheet1", "B1")
+    if type(value).__name__ == 'CellError':
+        raise RuntimeError(f"formula evaluated to {value}")
+
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        wb.set_cell_contents("Sheet1", "A1", str(i + 5))
+        timings.append(time.perf_counter() - start)
+    return entered, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--terms', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Python recursion limit: {sys.getrecursionlimit()}")
+    for name, generate in SHAPES.items():
+        for terms in (args.terms // 10, args.terms):
+            entered, recalculated = time_formula(generate(terms), args.repeat)
+            print(f"{name:9} {terms:7} terms   enter {entered * 1000:8.2f} ms"
+                  f"   recalculate {recalculated * 1000:8.2f} ms"
+                  f"   ({recalculated / terms * 1e6:.2f} us/term)")
+
+
+if __name__ == '__main__':
+    main()
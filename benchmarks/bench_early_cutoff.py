@@ -0,0 +1,81 @@
+"""
+Benchmark for stopping recalculation where an edit stops changing values.
+
+Builds a chain of --length formulas on top of a clamp,
+
+    A1: input    B1: =MIN(A1, 10)    C1: =B1+1    C2: =C1+1    ...
+
+and times two kinds of edit to A1: one the clamp absorbs (A1 stays above 10,
+so B1 and everything after it keep their values) and one that goes all the
+way down the chain.  The absorbed edit should only evaluate B1, however long
+the chain is; the cells each edit evaluates are counted with the profiler,
+on an edit of its own so that profiling doesn't slow down the timed ones.
+
+    python benchmarks/bench_early_cutoff.py [--length N] [--repeat N] [--mode eager|lazy]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+
+
+def build_workbook(length, mode):
+    wb = Workbook(mode)
+    wb.new_sheet("Sheet1")
+    wb.set_cell_contents("Sheet1", "A1", "100")
+    wb.set_cell_contents("Sheet1", "B1", "=MIN(A1, 10)")
+    wb.set_cell_contents("Sheet1", "C1", "=B1+1")
+    for row in range(2, length + 1):
+        wb.set_cell_contents("Sheet1", f"C{row}", f"=C{row - 1}+1")
+    wb.recalculate()
+    return wb
+
+
+def time_edits(wb, values, length, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        wb.set_cell_contents("Sheet1", "A1", str(values(i)))
+        wb.get_cell_value("Sheet1", f"C{length}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def count_evaluated(wb, value, length):
+    operations = []
+    wb.enable_profiling(hook=operations.append)
+    wb.set_cell_contents("Sheet1", "A1", str(value))
+    wb.get_cell_value("Sheet1", f"C{length}")
+    wb.disable_profiling()
+    return sum(stats.cells_evaluated for stats in operations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--length', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mode', choices=['eager', 'lazy'], default='eager')
+    args = parser.parse_args()
+
+    edits = {
+        'absorbed': lambda i: 100 + i,          # B1 stays 10
+        'propagated': lambda i: i % 2,          # B1 alternates 0 and 1
+    }
+    medians = dict()
+    for name, values in edits.items():
+        wb = build_workbook(args.length, args.mode)
+        timings = time_edits(wb, values, args.length, args.repeat)
+        evaluated = count_evaluated(wb, values(args.repeat), args.length)
+        medians[name] = statistics.median(timings)
+        print(f"{name:10} {args.mode} chain of {args.length}   median {medians[name] * 1000:8.2f} ms"
+              f"   min {min(timings) * 1000:8.2f} ms   {evaluated:6} cells evaluated")
+    print(f"an absorbed edit is {medians['propagated'] / medians['absorbed']:.0f}x faster")
+
+
+if __name__ == '__main__':
+    main()
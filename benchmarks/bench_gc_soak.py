@@ -0,0 +1,74 @@
+"""
+Soak benchmark for reclaiming graph nodes and cells nothing refers to.
+
+Keeps a pool of --pool formula cells in column A and makes --edits random
+edits to it: each edit either clears a pool cell or sets it to a formula
+referring to a few far-away cells on Sheet1 or Data, e.g.
+
+    A17: =Data!F8123 + C431 * 2 + E5502
+
+Every reference used to leave a graph node and an empty cell behind, so the
+workbook grew with every edit.  Now they are reclaimed as soon as nothing
+refers to them, and the number of nodes, cells and the memory in use should
+stay flat however many edits are made.
+
+    python benchmarks/bench_gc_soak.py [--edits N] [--pool N] [--report-every N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+
+
+def random_formula(rng):
+    refs = [f"{rng.choice(['', 'Data!'])}{rng.choice('BCDEFGH')}{rng.randint(1, 9999)}"
+            for _ in range(rng.randint(2, 3))]
+    return "=" + refs[0] + "".join(f" {rng.choice('+*')} {ref}" for ref in refs[1:])
+
+
+def sizes(wb):
+    cells = sum(len(wb._get_sheet(name).cell_map) for name in wb.list_sheets())
+    return len(wb.graph.graph), cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--edits', type=int, default=1_000_000)
+    parser.add_argument('--pool', type=int, default=100)
+    parser.add_argument('--report-every', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    wb.new_sheet("Data")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for edit in range(1, args.edits + 1):
+        location = f"A{rng.randint(1, args.pool)}"
+        if rng.random() < 0.25:
+            wb.set_cell_contents("Sheet1", location, None)
+        else:
+            wb.set_cell_contents("Sheet1", location, random_formula(rng))
+        if edit % args.report_every == 0 or edit == args.edits:
+            nodes, cells = sizes(wb)
+            current, _ = tracemalloc.get_traced_memory()
+            elapsed = time.perf_counter() - start
+            print(f"{edit:9} edits   {nodes:6} graph nodes   {cells:6} cells"
+                  f"   {current / 2 ** 20:7.2f} MiB   {edit / elapsed:8.0f} edits/s")
+
+    reclaimed = wb.compact()
+    nodes, cells = sizes(wb)
+    print(f"compact() reclaimed {reclaimed} more; {nodes} graph nodes and {cells} cells remain")
+
+
+if __name__ == '__main__':
+    main()
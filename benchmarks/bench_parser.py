@@ -0,0 +1,101 @@
+"""
+Benchmark for formula parsing throughput.
+
+Parses a corpus of formulas of the kind found in real workbooks (arithmetic on
+cells, cross-sheet references, ranges, function calls, string concatenation)
+with FormulaParser (which the workbook uses) and with each parser mode of
+LarkParser, and reports formulas parsed per second.  Every formula is parsed by
+both LarkParser modes first to check that they give the same tree.
+
+    python benchmarks/bench_parser.py [--formulas N] [--repeat N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets.formula_parser import FormulaParser
+from sheets.lark_parser import LarkParser, PARSER_MODES
+from sheets.workbook_utility import index_to_cell_location
+
+# {a}, {b}, ... are filled in with cell locations.
+TEMPLATES = [
+    "={a}",
+    "={a}+1",
+    "={a}*{b}",
+    "={a}-{b}/2",
+    "=({a}+{b})*{c}",
+    "=-{a}",
+    "={a}*1.2+{b}*0.8-{c}",
+    "=Sheet1!{a}+Sheet2!{b}",
+    "='Monthly Totals'!{a}*{b}",
+    "=SUM({a}:{b})",
+    "=AVERAGE(Data!{a}:{b})",
+    "=SUM({a}:{b})/COUNT({a}:{b})",
+    "=MIN({a}, {b}, {c})",
+    "=MAX({a}:{b}, 0)",
+    "=IF({a}, {b}, {c})",
+    "=IFERROR({a}/{b}, 0)",
+    "=IF(EXACT({a}, \"yes\"), {b}*2, {c})",
+    "=AND({a}, OR({b}, NOT({c})))",
+    "=CHOOSE({a}, {b}, {c}, 0)",
+    "=INDIRECT(\"Sheet1!\" & {a})",
+    "={a} & \" \" & {b}",
+    "=\"Total: \" & Sheet1!{a}",
+    "=({a}+{b}+{c})/3",
+    "=ISBLANK({a})",
+    "=ISERROR({a})",
+    "=#REF!",
+    "=VERSION()",
+    "=(({a}*{b})-({c}/2))*(1+{a})",
+]
+
+
+def build_corpus(n, seed=0):
+    rng = random.Random(seed)
+
+    def location():
+        return index_to_cell_location(rng.randrange(1000), rng.randrange(26))
+    return [rng.choice(TEMPLATES).format(a=location(), b=location(), c=location())
+            for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--formulas', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.formulas)
+    parsers = {mode: LarkParser(mode) for mode in PARSER_MODES}
+    for formula in corpus:
+        trees = [parsers[mode].parse_formula(formula)[1] for mode in PARSER_MODES]
+        if any(tree != trees[0] for tree in trees):
+            print(f"trees differ for {formula}")
+            return 1
+
+    print(f"{len(corpus)} formulas, best of {args.repeat}")
+    parse = {mode: parsers[mode].parse_formula for mode in PARSER_MODES}
+    # A fresh FormulaParser per formula, as a Cell makes.
+    parse['native'] = lambda formula: FormulaParser().parse_formula(formula)
+    rates = dict()
+    for mode in parse:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for formula in corpus:
+                parse[mode](formula)
+            timings.append(time.perf_counter() - start)
+        rates[mode] = len(corpus) / min(timings)
+        print(f"{mode:8} {rates[mode]:10.0f} formulas/s   median {statistics.median(timings) * 1000:8.1f} ms")
+    print(f"lalr is {rates['lalr'] / rates['earley']:.1f}x earley, "
+          f"native is {rates['native'] / rates['lalr']:.1f}x lalr")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark for reusing subexpressions that many formulas share.
+
+Builds a model sheet of --rows formulas that all compute the same
+parenthesized group and function call over an inputs sheet, e.g.
+
+    =(Inputs!A1*Inputs!A2+Inputs!A3)*A7 + MAX(Inputs!A1:A100)
+
+and times the recalculation after an input changes, along with the hit rate of
+the workbook's subexpression cache.  The same model with the row's own cell
+mixed into each subexpression, so that nothing is shared, is timed for
+comparison.
+
+    python benchmarks/bench_subexpressions.py [--rows N] [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+
+TEMPLATES = {
+    'shared': "=(Inputs!A1*Inputs!A2+Inputs!A3)*A{row} + MAX(Inputs!A1:A100)",
+    'unshared': "=(Inputs!A1*Inputs!A2+A{row})*A{row} + MAX(Inputs!A1:A100, A{row})",
+}
+
+
+def build_workbook(template, rows):
+    wb = Workbook()
+    wb.new_sheet("Inputs")
+    wb.new_sheet("Model")
+    for row in range(1, 101):
+        wb.set_cell_contents("Inputs", f"A{row}", str(row))
+    for row in range(1, rows + 1):
+        wb.set_cell_contents("Model", f"A{row}", str(row))
+        wb.set_cell_contents("Model", f"B{row}", template.format(row=row))
+    return wb
+
+
+def time_recalculation(wb, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        wb.set_cell_contents("Inputs", "A1", str(i + 2))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    medians = dict()
+    for name, template in TEMPLATES.items():
+        wb = build_workbook(template, args.rows)
+        before = wb.get_subexpression_stats()
+        timings = time_recalculation(wb, args.repeat)
+        stats = wb.get_subexpression_stats()
+        hits = stats['hits'] - before['hits']
+        misses = stats['misses'] - before['misses']
+        rate = hits / (hits + misses) if hits + misses else 0.0
+        medians[name] = statistics.median(timings)
+        print(f"{name:9} {args.rows} formulas   median {medians[name] * 1000:8.2f} ms"
+              f"   min {min(timings) * 1000:8.2f} ms   "
+              f"{stats['shared']} shared, hit rate {rate:.3f}")
+    print(f"shared is {medians['unshared'] / medians['shared']:.2f}x faster per recalculation")
+
+
+if __name__ == '__main__':
+    main()
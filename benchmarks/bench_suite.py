@@ -0,0 +1,319 @@
+"""
+Benchmark suite for the workbook, with regression tracking.
+
+Runs a fixed set of scenarios, prints their timings, and optionally writes
+them as JSON and compares them against a baseline from an earlier run:
+
+    python benchmarks/bench_suite.py [--quick] [--output results.json]
+        [--baseline benchmarks/baseline.json] [--threshold 0.25]
+        [--min-delta 0.001] [--update-baseline] [--only GROUP ...]
+
+A scenario regresses when its median time is more than `threshold` (a
+fraction, 0.25 = 25%) and more than `min-delta` seconds above the baseline's.
+The exit status is 1 if any scenario regressed, so the suite can gate a
+change.  Timings depend on the machine, so a baseline is only meaningful on
+the machine that recorded it; --update-baseline records one.
+
+benchmarks/baseline.json has to be recorded again, in the same commit,
+whenever a change makes a scenario intentionally faster or slower, or adds
+one: a baseline slower than the code it is compared against lets the next
+regression through unnoticed.
+
+Scenarios:
+
+    load_<n>, save_<n>          load_workbook() / save_workbook() of a sheet
+                                with n cells, half of them formulas
+    edit_linear_<n>             editing the head of a chain of n formulas
+    edit_bushy_<n>              editing the root of a tree of n formulas
+    edit_wide_<n>               editing a cell that n formulas refer to
+    edit_wide_error_<n>         the same, switching the cell between two
+                                errors, which every formula then holds
+    edit_cross_sheet_<n>        editing the head of a chain of n formulas that
+                                alternates between two sheets
+    cycle_make_break_<n>        closing a chain of n formulas into a cycle,
+                                then breaking it again
+    rename_sheet_<n>            renaming a sheet that n formulas refer to
+    copy_sheet_<n>              copying a sheet of n formulas
+    del_sheet_<n>               deleting a sheet that n formulas refer to
+    notify_fanout_<k>           an edit changing 100 cells, delivered to k
+                                notify functions
+    memory_per_cell             bytes allocated per literal and per formula
+                                cell (a size, not a time; never regresses)
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sheets import Workbook
+from sheets.workbook_utility import index_to_cell_location
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def timed(repeat, setup, run):
+    '''
+    Calls run(setup()) `repeat` times, timing only run().  Returns the timings
+    in seconds.
+    '''
+    timings = []
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def cell(row, col=0):
+    return index_to_cell_location(row, col)
+
+
+def linear_workbook(n, sheets=("Sheet1",)):
+    # A1 = 1, then each cell refers to the one before it, going round the
+    # sheets in turn.
+    wb = Workbook()
+    for sheet in sheets:
+        wb.new_sheet(sheet)
+    wb.set_cell_contents(sheets[0], "A1", "1")
+    for i in range(1, n):
+        previous = f"{sheets[(i - 1) % len(sheets)]}!{cell(i - 1)}"
+        wb.set_cell_contents(sheets[i % len(sheets)], cell(i), f"={previous}+1")
+    return wb
+
+
+def bushy_workbook(n):
+    # A binary tree: A(i) refers to A((i - 1) // 2), rooted at A1.
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    wb.set_cell_contents("Sheet1", "A1", "1")
+    for i in range(1, n):
+        wb.set_cell_contents("Sheet1", cell(i), f"={cell((i - 1) // 2)}*2")
+    return wb
+
+
+def wide_workbook(n):
+    # n formulas in column B all referring to A1.
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    wb.set_cell_contents("Sheet1", "A1", "1")
+    for i in range(n):
+        wb.set_cell_contents("Sheet1", cell(i, 1), f"=A1+{i}")
+    return wb
+
+
+def referring_workbook(n):
+    # "Data" holds n numbers, and n formulas on "Sheet1" refer to them.
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    wb.new_sheet("Data")
+    for i in range(n):
+        wb.set_cell_contents("Data", cell(i), str(i))
+        wb.set_cell_contents("Sheet1", cell(i), f"=Data!{cell(i)}*2")
+    return wb
+
+
+def mixed_workbook(n):
+    # n cells: literals in column A, formulas on them in column B.
+    wb = Workbook()
+    wb.new_sheet("Sheet1")
+    for i in range(n // 2):
+        wb.set_cell_contents("Sheet1", cell(i), str(i))
+        wb.set_cell_contents("Sheet1", cell(i, 1), f"={cell(i)}*2+{cell(max(i - 1, 0), 1)}")
+    return wb
+
+
+def saved(wb):
+    fp = io.StringIO()
+    wb.save_workbook(fp)
+    return fp.getvalue()
+
+
+def bench_load_save(n, repeat):
+    text = saved(mixed_workbook(n))
+    yield f'load_{n}', timed(repeat, lambda: io.StringIO(text), Workbook.load_workbook)
+    wb = mixed_workbook(n)
+    yield f'save_{n}', timed(repeat, io.StringIO, wb.save_workbook)
+
+
+def bench_edit(name, build, n, repeat, sheet="Sheet1", location="A1", contents=str):
+    # contents(i) is what the i-th edit sets the cell to.
+    wb = build(n)
+    values = iter(range(repeat))
+    yield f'{name}_{n}', timed(repeat, lambda: contents(next(values)),
+                               lambda value: wb.set_cell_contents(sheet, location, value))
+
+
+def bench_cycle(n, repeat):
+    wb = linear_workbook(n)
+    last = cell(n - 1)
+
+    def make_and_break(_):
+        wb.set_cell_contents("Sheet1", "A1", f"={last}+1")
+        wb.set_cell_contents("Sheet1", "A1", "1")
+    yield f'cycle_make_break_{n}', timed(repeat, lambda: None, make_and_break)
+
+
+def bench_sheet_operations(n, repeat):
+    wb = referring_workbook(n)
+    names = iter(f"Data{i}" for i in range(2 * repeat))
+
+    def rename(_):
+        wb.rename_sheet(wb.list_sheets()[1], next(names))
+    yield f'rename_sheet_{n}', timed(repeat, lambda: None, rename)
+
+    wb = linear_workbook(n)
+
+    # Each copy is deleted again (untimed) to keep the workbook the same size.
+    copy_timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        _, name = wb.copy_sheet("Sheet1")
+        copy_timings.append(time.perf_counter() - start)
+        wb.del_sheet(name)
+    yield f'copy_sheet_{n}', copy_timings
+
+    yield f'del_sheet_{n}', timed(repeat, lambda: referring_workbook(n),
+                                  lambda wb: wb.del_sheet("Data"))
+
+
+def bench_notifications(fanout, repeat):
+    wb = wide_workbook(100)
+    for _ in range(fanout):
+        wb.notify_cells_changed(lambda workbook, cells: None)
+    values = iter(range(repeat))
+    yield f'notify_fanout_{fanout}', timed(repeat, lambda: str(next(values)),
+                                           lambda value: wb.set_cell_contents("Sheet1", "A1", value))
+
+
+def memory_per_cell(n):
+    '''
+    Returns (bytes per literal cell, bytes per formula cell), measured with
+    tracemalloc while filling a sheet.
+    '''
+    result = []
+    for contents in (lambda i: str(i), lambda i: f"={cell(i, 1)}+1"):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(n):
+            wb.set_cell_contents("Sheet1", cell(i), contents(i))
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        result.append((after - before) / n)
+    return result
+
+
+def run_suite(quick, only):
+    # Loading recalculates after every cell, so its cost grows quickly with n.
+    if quick:
+        sizes, edit_size, repeat, fanouts = [100, 300], 300, 3, [1, 10]
+    else:
+        sizes, edit_size, repeat, fanouts = [300, 1000], 1000, 5, [1, 10, 100]
+
+    scenarios = []
+    for n in sizes:
+        scenarios.append(('load_save', lambda n=n: bench_load_save(n, repeat)))
+    scenarios.append(('edit', lambda: bench_edit('edit_linear', linear_workbook, edit_size, repeat)))
+    scenarios.append(('edit', lambda: bench_edit('edit_bushy', bushy_workbook, edit_size, repeat)))
+    scenarios.append(('edit', lambda: bench_edit('edit_wide', wide_workbook, edit_size, repeat)))
+    scenarios.append(('edit', lambda: bench_edit('edit_wide_error', wide_workbook, edit_size, repeat,
+                                                 contents=lambda i: ("#REF!", "#DIV/0!")[i % 2])))
+    scenarios.append(('edit', lambda: bench_edit(
+        'edit_cross_sheet', lambda n: linear_workbook(n, ("Sheet1", "Sheet2")), edit_size, repeat)))
+    scenarios.append(('cycle', lambda: bench_cycle(edit_size, repeat)))
+    scenarios.append(('sheets', lambda: bench_sheet_operations(edit_size, repeat)))
+    for fanout in fanouts:
+        scenarios.append(('notify', lambda fanout=fanout: bench_notifications(fanout, repeat)))
+
+    results = dict()
+    for group, scenario in scenarios:
+        if only and group not in only:
+            continue
+        for name, timings in scenario():
+            results[name] = {'median': statistics.median(timings), 'min': min(timings),
+                             'repeat': len(timings)}
+            print(f"{name:28} median {results[name]['median'] * 1000:10.2f} ms"
+                  f"   min {results[name]['min'] * 1000:10.2f} ms")
+
+    if not only or 'memory' in only:
+        literal, formula = memory_per_cell(edit_size)
+        results['memory_per_cell'] = {'literal_bytes': literal, 'formula_bytes': formula}
+        print(f"{'memory_per_cell':28} literal {literal:8.0f} B   formula {formula:8.0f} B")
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    '''
+    Returns [(name, baseline median, median)] of the timed scenarios whose
+    median is more than `threshold` above the baseline's, and more than
+    `min_delta` seconds above it (so that noise on very short timings isn't
+    flagged).
+    '''
+    regressions = []
+    for name, result in results.items():
+        if 'median' not in result or 'median' not in baseline.get(name, {}):
+            continue
+        expected = baseline[name]['median']
+        if result['median'] > expected * (1 + threshold) and result['median'] - expected > min_delta:
+            regressions.append((name, expected, result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, fewer repeats')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown over the baseline, as a fraction')
+    parser.add_argument('--min-delta', type=float, default=0.001,
+                        help='ignore slowdowns of fewer seconds than this')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--only', nargs='+',
+                        choices=['load_save', 'edit', 'cycle', 'sheets', 'notify', 'memory'],
+                        help='run only these groups of scenarios')
+    args = parser.parse_args()
+
+    results = run_suite(args.quick, args.only)
+    report = {'quick': args.quick, 'python': sys.version.split()[0], 'results': results}
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    if baseline.get('quick') != args.quick:
+        print("baseline was recorded with a different --quick setting; not comparing")
+        return 0
+    regressions = compare(results, baseline['results'], args.threshold, args.min_delta)
+    for name, expected, median in regressions:
+        print(f"REGRESSION {name}: {median * 1000:.2f} ms vs {expected * 1000:.2f} ms baseline")
+    if not regressions:
+        print(f"no regressions beyond {args.threshold:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from .workbook import Workbook
 from .cell_error_type import CellErrorType, CellError
+from .notification_filter import NotificationFilter
 
-__all__ = ['Workbook', 'CellError', 'CellErrorType']
+__all__ = ['Workbook', 'CellError', 'CellErrorType', 'NotificationFilter']
 version = "1.1.0"
\ No newline at end of file
@@ -1,30 +1,107 @@
 from decimal import Decimal
-from .lark_parser import LarkParser
+from .formula_table import intern_formula
 from .value_type import ValueType
 from .cell_error_type import CellErrorType, CellError
 
 class Cell:
     def __init__(self, content, loc_tup=None):
-        self.content = None
+        self._content = None
         self.type = None
         self.value = None
-        self.tree = None
-        self.refs = []
+        # The cell's Formula (see formula_table), shared with every cell that
+        # holds the same formula relative to its location.
+        self.formula = None
+        # Graph nodes of `refs` (None for out-of-range references), the
+        # (sheet id, top, left, bottom, right) rectangles of `range_refs` (None
+        # if a corner is out of range), and both keyed by id() of each 'cell'
+        # or 'range' node of `tree`.  Resolved by the workbook, since it
+        # owns the sheet ids.
+        self.ref_nodes = []
+        self.range_nodes = []
+        self.ref_node_map = {}
+        # {id(node) : SharedSubexpression} of the compiled formula's subtrees
+        # that other cells may compute too, or None; see SubexpressionCache.
+        self.shared = None
+        # Running state of a SUM/COUNT/AVERAGE over ranges, set up by the
+        # workbook; see IncrementalAggregate.
+        self.aggregate = None
 
         self.loc = loc_tup
 
         self.update(content)
 
     def update(self, content):
-        self.content = content
+        self._content = content
         self.type = None  # Reset type to None when updating
-        self.tree = None
-        self.refs = []
+        self.formula = None
+        self.ref_nodes = []
+        self.range_nodes = []
+        self.ref_node_map = {}
+        self.aggregate = None
 
         self._format_content()
         self._detect_type()
         self._evaluate_content()
 
+    def copy(self):
+        '''
+        Returns a copy of this cell that shares nothing mutable with it, without
+        reparsing the formula.  The Formula is immutable, so the copy shares
+        it.  A formula's value is left unset for the workbook to compute, as
+        are the reference nodes.
+        '''
+        c = Cell.__new__(Cell)
+        c._content = self._content
+        c.type = self.type
+        c.value = None if self.formula else self.value
+        c.formula = self.formula
+        c.ref_nodes = list(self.ref_nodes)
+        c.range_nodes = list(self.range_nodes)
+        c.ref_node_map = {}
+        c.shared = None
+        c.aggregate = None
+        c.loc = self.loc
+        return c
+
+    # The formula's text, trees and references at this cell, from its Formula.
+
+    @property
+    def content(self):
+        if self.formula is None:
+            return self._content
+        return self.formula.text_at(self._anchor())
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+
+    @property
+    def tree(self):
+        return None if self.formula is None else self.formula.tree
+
+    @property
+    def code(self):
+        return None if self.formula is None else self.formula.code
+
+    @property
+    def single_ref(self):
+        return self.formula is not None and self.formula.single_ref
+
+    @property
+    def refs(self):
+        if self.formula is None:
+            return []
+        return self.formula.refs_at(self._anchor())
+
+    @property
+    def range_refs(self):
+        if self.formula is None:
+            return []
+        return self.formula.range_refs_at(self._anchor())
+
+    def _anchor(self):
+        return (0, 0) if self.loc is None else self.loc
+
     def _format_content(self):
         if self.content:
             self.content = self.content.strip()
@@ -70,19 +147,18 @@ class Cell:
             else:
                 self.value = self.content
         elif self.type == ValueType.FORMULA:
-            parser = LarkParser()
-            ref, tree, error = parser.parse_formula(self.content)
-            if (error):
-                self.value = CellError(CellErrorType.PARSE_ERROR, error)
+            self.formula = intern_formula(self.content, self._anchor())
+            if self.formula is None:
+                self.value = CellError.shared(CellErrorType.PARSE_ERROR, "#ERROR!")
                 self.type = ValueType.ERROR
             else:
-                self.tree = tree
-                self.refs = ref
+                # The Formula gives the text back.
+                self._content = None
         elif self.type == ValueType.NUMBER:
             self.value = Decimal(self._strip_trailing_zeros(self.content))
         elif self.type == ValueType.ERROR:
             self.content = self.content.upper()
-            self.value = CellError(self._get_error_type(), self.content)
+            self.value = CellError.shared(self._get_error_type(), self.content)
 
     def _get_error_type(self):
         if self.content == "#ERROR!":
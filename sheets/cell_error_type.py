@@ -77,12 +77,32 @@ class CellError:
         return cell_error_strings[error_type.value - 1]
     
     def is_error_string(value) -> bool:
-        return value in cell_error_strings
+        return isinstance(value, str) and value in error_types_by_string
 
     def get_error_type_from_string(value) -> str:
-        if value in cell_error_strings:
-            return CellErrorType(cell_error_strings.index(value) + 1)
+        if isinstance(value, str):
+            return error_types_by_string.get(value)
         return None
+
+    def shared(error_type, detail=None) -> 'CellError':
+        '''
+        Returns the one CellError of `error_type` with `detail` (by default the
+        usual detail of the type), so that cells holding the same error share
+        it instead of each allocating their own.  CellErrors are never
+        modified, which makes this safe.
+        '''
+        if detail is None:
+            detail = cell_error_details[error_type.value - 1]
+        error = _shared_errors.get((error_type, detail))
+        if error is None:
+            error = _shared_errors.setdefault((error_type, detail), CellError(error_type, detail))
+        return error
     
     def get_detail_from_error_type(error_type) -> str:
         return cell_error_details[error_type.value - 1]
+
+
+# {error string : CellErrorType}, e.g. "#REF!" -> BAD_REFERENCE
+error_types_by_string = {string: CellErrorType(i + 1) for i, string in enumerate(cell_error_strings)}
+
+_shared_errors = dict()     # {(CellErrorType, detail) : CellError}, see CellError.shared()
@@ -0,0 +1,70 @@
+from decimal import Decimal
+from sheets.cell_error_type import CellError
+
+# Kinds of values, kept one byte per row next to each column's values.
+EMPTY = 0
+NUMBER = 1
+STRING = 2
+ERROR = 3
+
+
+def value_kind(value):
+    if value is None:
+        return EMPTY
+    if isinstance(value, Decimal):
+        return NUMBER
+    if isinstance(value, CellError):
+        return ERROR
+    return STRING
+
+
+class ColumnBuffers:
+    '''
+    A sheet's cell values stored by column: for each column, a list of values
+    indexed by row and a bytearray of their kinds.  A range is read as one list
+    slice per column, and bytearray.count() / find() classify a whole slice
+    without a Python-level loop.  The sheet keeps this in sync with its cells'
+    values.
+    '''
+
+    def __init__(self):
+        self.values = dict()    # {col : list of values, indexed by row}
+        self.kinds = dict()     # {col : bytearray of value kinds, indexed by row}
+
+    def store(self, cell_loc, value):
+        ''' Stores the value at `cell_loc`, returning the value it replaces. '''
+        row, col = cell_loc
+        values = self.values.get(col)
+        if values is None:
+            if value is None:
+                return None
+            values = self.values[col] = []
+            self.kinds[col] = bytearray()
+        kinds = self.kinds[col]
+        if row >= len(values):
+            if value is None:
+                return None
+            padding = row + 1 - len(values)
+            values.extend([None] * padding)
+            kinds.extend(bytes(padding))
+        old_value = values[row]
+        values[row] = value
+        kinds[row] = value_kind(value)
+        return old_value
+
+    def get_slices(self, top, left, bottom, right):
+        '''
+        Returns (values, kinds) slices of rows top..bottom for each column
+        left..right, in order.  A slice is shorter than the range if the
+        column's last values are empty; columns with no values are omitted.
+        '''
+        slices = []
+        if right - left + 1 <= len(self.values):
+            cols = range(left, right + 1)
+        else:
+            cols = sorted(col for col in self.values if left <= col <= right)
+        for col in cols:
+            values = self.values.get(col)
+            if values is not None and top < len(values):
+                slices.append((values[top:bottom + 1], self.kinds[col][top:bottom + 1]))
+        return slices
@@ -0,0 +1,119 @@
+from sheets.cell_error_type import CellErrorType, error_types_by_string
+
+# Compiles a tuple tree (from FormulaParser, optimized or not) into postfix
+# code for FormulaEvaluator, which runs it with a stack of values instead of
+# recursing, so a formula of any depth evaluates in time linear in its size.
+# Compiling is iterative too.
+#
+# An instruction is a tuple whose first item is one of the opcodes below:
+#
+#     (PUSH, value)           push a constant, as FormulaEvaluator holds values
+#     (CELL, node)            push the value of a 'cell' node
+#     (RANGE, node)           push a 'range' node as a function argument
+#     (ADD, op)  (MUL, op)    replace the top two values by left op right
+#     (UNARY, op)             apply a sign to the top value
+#     (NUMBER,)               convert the top value to a number, as () does
+#     (CONCAT, count)         replace the top `count` values by their text
+#     (CALL, name, count)     replace the top `count` values by name(values)
+#     (MEMO, node, end)       start of a group or call that refers to cells;
+#                             if its value is stored (see SubexpressionCache),
+#                             push that and jump to instruction `end`
+#     (STORE, node)           end of the group or call of a MEMO
+#
+# A chain of arithmetic (add_n, mul_n, or nested add and mul nodes) is just
+# its operands and operators in order: applying each operator as soon as its
+# right operand is known is how the tree evaluates too.
+
+PUSH, CELL, RANGE, ADD, MUL, UNARY, NUMBER, CONCAT, CALL, MEMO, STORE = range(11)
+
+
+class Code(tuple):
+    ''' The instructions of a compiled formula. '''
+
+
+def compile_tree(tree):
+    ''' Returns the Code of the tuple tree `tree`. '''
+    code = []
+    references = 0  # CELL and RANGE instructions so far
+    # Work items: (node, whether it is the root) to compile, or an
+    # instruction to emit once the operands before it have been compiled.  A
+    # MEMO is emitted as a list, so its end can be filled in at its STORE, or
+    # left out if the group or call turns out not to refer to cells.
+    work = [(tree, True)]
+    memos = []
+    dropped = False
+    while work:
+        item = work.pop()
+        if item.__class__ is list:
+            memos.append((item[0], len(code), references))
+            code.append(None)
+        elif item[0].__class__ is int:
+            if item[0] == STORE:
+                node, start, before = memos.pop()
+                if references == before:
+                    dropped = True
+                    continue
+                code[start] = (MEMO, node, len(code) + 1)
+            elif item[0] == CELL or item[0] == RANGE:
+                references += 1
+            code.append(item)
+        else:
+            work.extend(reversed(_steps(*item)))
+    if dropped:
+        code = _without_gaps(code)
+    return Code(code)
+
+
+def _without_gaps(code):
+    # `code` without the Nones left by dropped MEMOs, with the ends of the
+    # other MEMOs moved to match.
+    moved = []      # new index of each old one
+    count = 0
+    for instruction in code:
+        moved.append(count)
+        if instruction is not None:
+            count += 1
+    moved.append(count)
+    return [(MEMO, instruction[1], moved[instruction[2]]) if instruction[0] == MEMO else instruction
+            for instruction in code if instruction is not None]
+
+
+def _steps(node, is_root):
+    # What compiling `node` takes, in order: (node, False) for the nodes to
+    # compile, and instructions.
+    kind = node[0]
+    if kind == 'number':
+        return [(PUSH, node[2])]
+    if kind == 'string':
+        return [(PUSH, error_types_by_string.get(node[1], node[1]))]
+    if kind == 'error':
+        return [(PUSH, error_types_by_string[node[1].upper()])]
+    if kind == 'const':
+        return [(PUSH, node[1])]
+    if kind == 'cell':
+        return [(CELL, node)]
+    if kind == 'range':
+        return [(PUSH, CellErrorType.TYPE_ERROR)]
+    if kind == 'add' or kind == 'mul':
+        return [(node[2], False), (node[3], False), (ADD if kind == 'add' else MUL, node[1])]
+    if kind == 'add_n' or kind == 'mul_n':
+        opcode = ADD if kind == 'add_n' else MUL
+        steps = [(node[1], False)]
+        for op, operand in node[2]:
+            steps.append((operand, False))
+            steps.append((opcode, op))
+        return steps
+    if kind == 'unary':
+        return [(node[2], False), (UNARY, node[1])]
+    if kind == 'concat':
+        return [(node[1], False), (node[2], False), (CONCAT, 2)]
+    if kind == 'concat_n':
+        return [(operand, False) for operand in node[1]] + [(CONCAT, len(node[1]))]
+    if kind == 'parens':
+        steps = [(node[1], False), (NUMBER,)]
+    else:   # function
+        steps = [(RANGE, arg) if arg[0] == 'range' else (arg, False) for arg in node[2]]
+        steps.append((CALL, node[1], len(node[2])))
+    if is_root:
+        return steps
+    return [[node]] + steps + [(STORE, node)]
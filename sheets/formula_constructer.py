@@ -1,12 +1,108 @@
 import lark
+from lark import Tree
 from lark.reconstruct import Reconstructor
+from lark.utils import is_id_continue
 
 class FormulaReconstructor():
     def __init__(self): 
-        parser = lark.Lark.open("formulas.lark", start='formula', rel_to=__file__)
+        parser = lark.Lark.open("formulas.lark", start='formula', parser='lalr', rel_to=__file__)
         parser.options.maybe_placeholders = False
 
         self._recon = Reconstructor(parser)
 
     def reconstruct_formula(self, tree):
         return "=" + self._recon.reconstruct(tree)
+
+
+def formula_tree_to_string(tree):
+    """
+    Writes a parse tree of formulas.lark back out as formula text (without the
+    leading "="), producing the same text as FormulaReconstructor but by walking
+    the tokens directly instead of matching the tree against the grammar.
+    """
+    pieces = []
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, Tree):
+            pieces.append(str(item))
+            continue
+
+        children = item.children
+        if item.data == 'concat_expr':
+            sequence = [children[0], '&', children[1]]
+        elif item.data == 'cell' and len(children) == 2:
+            sequence = [children[0], '!', children[1]]
+        elif item.data == 'cell_range':
+            sequence = list(children[:-1]) + [':', children[-1]]
+            if len(children) == 3:
+                sequence.insert(1, '!')
+        elif item.data == 'function':
+            sequence = [children[0], '(']
+            for i, arg in enumerate(children[1:]):
+                if i > 0:
+                    sequence.append(',')
+                sequence.append(arg)
+            sequence.append(')')
+        elif item.data == 'parens':
+            sequence = ['(', children[0], ')']
+        else:
+            sequence = children
+        stack.extend(reversed(sequence))
+    return _join_pieces(pieces)
+
+
+def formula_ast_to_string(tree):
+    """
+    Writes a tuple tree of FormulaParser back out as formula text (without the
+    leading "="), the same text formula_tree_to_string() gives for the lark
+    tree of the formula.
+    """
+    pieces = []
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            pieces.append(item)
+            continue
+        kind = item[0]
+        if kind == 'number' or kind == 'error':
+            sequence = [item[1]]
+        elif kind == 'string':
+            sequence = ['"' + item[1] + '"']
+        elif kind == 'cell':
+            sequence = [item[2]] if item[1] is None else [item[1], '!', item[2]]
+        elif kind == 'range':
+            sequence = [item[2], ':', item[3]]
+            if item[1] is not None:
+                sequence[:0] = [item[1], '!']
+        elif kind == 'function':
+            sequence = [item[1], '(']
+            for i, arg in enumerate(item[2]):
+                if i > 0:
+                    sequence.append(',')
+                sequence.append(arg)
+            sequence.append(')')
+        elif kind == 'parens':
+            sequence = ['(', item[1], ')']
+        elif kind == 'unary':
+            sequence = [item[1], item[2]]
+        elif kind == 'concat':
+            sequence = [item[1], '&', item[2]]
+        else:   # add, mul
+            sequence = [item[2], item[1], item[3]]
+        stack.extend(reversed(sequence))
+    return _join_pieces(pieces)
+
+
+def _join_pieces(pieces):
+    # Same spacing rule as lark's Reconstructor: only separate two pieces that
+    # would otherwise run together into one identifier.
+    output = []
+    prev_piece = ''
+    for piece in pieces:
+        if prev_piece and piece and is_id_continue(prev_piece[-1]) and is_id_continue(piece[0]):
+            output.append(' ')
+        output.append(piece)
+        prev_piece = piece
+    return ''.join(output)
@@ -1,16 +1,49 @@
 import lark
 import decimal
 import sheets
-from sheets.cell_error_type import CellErrorType, CellError
+from sheets.cell_error_type import CellErrorType, CellError, error_types_by_string
+from sheets.functions import RangeArgument, call_function
+from sheets.formula_bytecode import (Code, compile_tree, PUSH, CELL, RANGE, ADD, MUL, UNARY,
+                                     NUMBER, CONCAT, CALL, MEMO)
 import lark
 import decimal
 
+# Evaluates either a lark tree from LarkParser or a tuple tree from
+# FormulaParser, with the same results.  The workbook uses tuple trees, which
+# are compiled by formula_bytecode and run by _run() without recursing, so
+# any depth of nesting works; the lark methods are kept as the reference they
+# are tested against.
+
+_LONGEST_ERROR_STRING = max(len(string) for string in error_types_by_string)
+
+
+def _add_values(op, left, right):
+    return left + right if op == '+' else left - right
+
+
+def _mul_values(op, left, right):
+    if op == '*':
+        return left * right
+    return left / right if right != 0 else CellErrorType.DIVIDE_BY_ZERO
+
+
 class FormulaEvaluator(lark.visitors.Interpreter):
-    def __init__(self, workbook, sheet):
+    def __init__(self, workbook, sheet, ref_nodes=None, shared=None):
         self.workbook = workbook
         self.sheet = sheet
+        # Optional {id(cell subtree) : graph node} of references the workbook
+        # has already resolved; see Cell.ref_node_map.
+        self.ref_nodes = ref_nodes
+        # Optional {id(node) : SharedSubexpression} of subtrees whose values
+        # the workbook's SubexpressionCache may already have; see Cell.shared.
+        self.shared = shared
 
     def evaluate(self, parse_tree):
+        # A tuple tree can be given compiled already, as formula_bytecode.Code.
+        if parse_tree.__class__ is Code:
+            return self._evaluate_code(parse_tree)
+        if isinstance(parse_tree, tuple):
+            return self._evaluate_code(compile_tree(parse_tree))
         values = self.visit(parse_tree)
         if self._is_error(values):
             return self._convert_error(values)
@@ -110,14 +143,12 @@ class FormulaEvaluator(lark.visitors.Interpreter):
         return str(left) + str(right)
     
     def cell(self, tree):
-        values = self.visit_children(tree)
-        sheet = self.sheet if len(values) == 1 else values[0]
-        
-        sheet = self._strip_outer_single_quotes(sheet)
-
         try: 
             # If cell references another cell, then try to get the value of that cell
-            value = self.workbook.get_cell_value(sheet, values[-1])
+            if self.ref_nodes and id(tree) in self.ref_nodes:
+                value = self._get_node_value(self.ref_nodes[id(tree)])
+            else:
+                value = self._get_named_cell_value(tree)
             
             # If the cell is an error, we want the string representation of the erro
             if isinstance(value, CellError):
@@ -126,6 +157,54 @@ class FormulaEvaluator(lark.visitors.Interpreter):
             value = "#REF!"   
         return value 
 
+    def cell_range(self, tree):
+        # A range is only meaningful as a function argument; on its own it
+        # isn't a single value.
+        return "#VALUE!"
+
+    def function(self, tree):
+        args = []
+        for arg in tree.children[1:]:
+            if isinstance(arg, lark.Tree) and arg.data == 'cell_range':
+                args.append(self._get_range_argument(arg))
+                continue
+            value = self.visit(arg)
+            if isinstance(value, list):     # e.g. an error literal
+                value = value[0]
+            if isinstance(value, lark.Token):
+                value = str(value)
+            args.append(value)
+        return call_function(str(tree.children[0]), args)
+
+    def _get_range_argument(self, tree):
+        try:
+            if self.ref_nodes and id(tree) in self.ref_nodes:
+                target = self.ref_nodes[id(tree)]
+                if target is None:
+                    raise ValueError("Range beyond the maximum extent")
+                columns = self.workbook._get_range_columns(target)
+            elif isinstance(tree, tuple):
+                sheet = self._strip_outer_single_quotes(self.sheet if tree[1] is None else tree[1])
+                columns = self.workbook._get_named_range_columns(sheet, tree[2], tree[3])
+            else:
+                sheet = self.sheet if len(tree.children) == 2 else tree.children[0]
+                sheet = self._strip_outer_single_quotes(sheet)
+                columns = self.workbook._get_named_range_columns(sheet, tree.children[-2], tree.children[-1])
+        except (KeyError, ValueError):
+            return "#REF!"
+        return RangeArgument(columns)
+
+    def _get_node_value(self, node):
+        if node is None:
+            raise ValueError("Cell reference beyond the maximum extent")
+        return self.workbook._get_value_by_node(node)
+
+    def _get_named_cell_value(self, tree):
+        values = self.visit_children(tree)
+        sheet = self.sheet if len(values) == 1 else values[0]
+        sheet = self._strip_outer_single_quotes(sheet)
+        return self.workbook.get_cell_value(sheet, values[-1])
+
     def parens(self, tree):
         values = self.visit_children(tree)
         left, right = self.handle_empty_cell_decimal(values)
@@ -139,10 +218,178 @@ class FormulaEvaluator(lark.visitors.Interpreter):
     
     def string(self, tree):
         return tree.children[0][1:-1]
+
+    def error(self, tree):
+        # Error literals are case-insensitive.
+        return tree.children[0].upper()
     
     def base(self, tree):
        return self.visit_children(tree)[0]
     
+    # Tuple trees.  Errors are passed around as CellErrorType members rather
+    # than strings, so they are told apart from other values by their class,
+    # and the two errors of an operator by identity.  Text that reads as an
+    # error (e.g. "#REF!" in a string cell) still counts as one, as it does
+    # for lark trees; it is turned into its CellErrorType where it comes in.
+
+    def _evaluate_code(self, code):
+        value = self._run(code)
+        if value.__class__ is CellErrorType:
+            return CellError.shared(value)
+        return value
+
+    def _value(self, tree):
+        # The value of the tuple tree `tree`, with errors as CellErrorTypes.
+        return self._run(compile_tree(tree))
+
+    def _run(self, code):
+        # Runs `code` (see formula_bytecode) on a stack of values, so it takes
+        # the same Python stack however deeply the formula nests.
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        # The (SharedSubexpression, SubexpressionCache.version) of each MEMO
+        # being evaluated, innermost last, or None if its value isn't shared.
+        memos = []
+        shared = self.shared
+        i = 0
+        end = len(code)
+        while i < end:
+            instruction = code[i]
+            i += 1
+            opcode = instruction[0]
+            if opcode == PUSH:
+                push(instruction[1])
+            elif opcode == CELL:
+                push(self._cell(instruction[1]))
+            elif opcode == ADD:
+                right = pop()
+                push(self._arithmetic(_add_values, instruction[1], pop(), right))
+            elif opcode == MUL:
+                right = pop()
+                push(self._arithmetic(_mul_values, instruction[1], pop(), right))
+            elif opcode == CONCAT:
+                start = len(stack) - instruction[1]
+                value = self._concat_values(stack[start:])
+                del stack[start:]
+                push(value)
+            elif opcode == UNARY:
+                value = pop()
+                if value.__class__ is not CellErrorType:
+                    value = self._to_number(value)
+                    if value.__class__ is not CellErrorType:
+                        value = +value if instruction[1] == '+' else -value
+                push(value)
+            elif opcode == NUMBER:
+                value = pop()
+                push(value if value.__class__ is CellErrorType else self._to_number(value))
+            elif opcode == RANGE:
+                push(self._get_range_argument(instruction[1]))
+            elif opcode == CALL:
+                start = len(stack) - instruction[2]
+                push(self._call(instruction[1], stack[start:]))
+                del stack[start:-1]
+            elif opcode == MEMO:
+                entry = shared.get(id(instruction[1])) if shared else None
+                if entry is None or entry.users < 2:
+                    memos.append(None)
+                    continue
+                cache = self.workbook.subexpressions
+                found, value = cache.lookup(entry)
+                if found:
+                    push(value)
+                    i = instruction[2]
+                else:
+                    memos.append((entry, cache.version))
+            else:   # STORE
+                memo = memos.pop()
+                if memo is not None:
+                    self.workbook.subexpressions.store(memo[0], stack[-1], memo[1])
+        return stack[-1]
+
+    def _first_error(self, left, right):
+        # #CIRCREF! wins over any other error, then the left one.
+        left_error = left.__class__ is CellErrorType
+        right_error = right.__class__ is CellErrorType
+        if not (left_error or right_error):
+            return None
+        if right is CellErrorType.CIRCULAR_REFERENCE or not left_error:
+            return right
+        return left
+
+    def _to_number(self, value):
+        # translate_cell_value_to_decimal() for a value that isn't an error.
+        if value is None:
+            return 0
+        try:
+            return decimal.Decimal(str(float(value)).rstrip('0').rstrip('.'))
+        except:
+            return CellErrorType.TYPE_ERROR
+
+    def _arithmetic(self, apply, op, left, right):
+        error = self._first_error(left, right)
+        if error is not None:
+            return error
+        left = self._to_number(left)
+        if left.__class__ is CellErrorType:
+            return left
+        right = self._to_number(right)
+        if right.__class__ is CellErrorType:
+            return right
+        return apply(op, left, right)
+
+    def _concat_values(self, values):
+        # Like concatenating the values two at a time, left to right, but once
+        # the text is too long to read as an error, the rest is only
+        # collected, and joined once at the end.
+        value = values[0]
+        pieces = None
+        for right in values[1:]:
+            if right.__class__ is CellErrorType:
+                if (pieces is not None or value.__class__ is not CellErrorType
+                        or right is CellErrorType.CIRCULAR_REFERENCE):
+                    value = right
+                    pieces = None
+                continue
+            if value.__class__ is CellErrorType:
+                continue
+            right = '' if right is None else str(right)
+            if pieces is not None:
+                pieces.append(right)
+                continue
+            text = ('' if value is None else str(value)) + right
+            if len(text) > _LONGEST_ERROR_STRING:
+                pieces = [text]
+            else:
+                value = error_types_by_string.get(text, text)
+        if pieces is not None:
+            return ''.join(pieces)
+        return value
+
+    def _cell(self, node):
+        try:
+            if self.ref_nodes and id(node) in self.ref_nodes:
+                value = self._get_node_value(self.ref_nodes[id(node)])
+            else:
+                sheet = self._strip_outer_single_quotes(self.sheet if node[1] is None else node[1])
+                value = self.workbook.get_cell_value(sheet, node[2])
+        except (KeyError, ValueError):
+            return CellErrorType.BAD_REFERENCE
+        if isinstance(value, CellError):
+            return value.get_type()
+        if value.__class__ is str:
+            return error_types_by_string.get(value, value)
+        return value
+
+    def _call(self, name, args):
+        # Functions take and give errors as strings.
+        args = [CellError.get_string_from_error_type(arg) if arg.__class__ is CellErrorType else arg
+                for arg in args]
+        value = call_function(name, args)
+        if value.__class__ is str:
+            return error_types_by_string.get(value, value)
+        return value
+
     def _convert_error(self, values):
         if (isinstance(values, list) and CellError.is_error_string(values[0])):
             error_str = values[0]
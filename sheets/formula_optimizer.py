@@ -0,0 +1,148 @@
+from sheets.formula_evaluator import FormulaEvaluator
+
+# Rewrites a tuple tree of FormulaParser into an equivalent one that is faster
+# to evaluate, for FormulaEvaluator.  The tree it gives is only for evaluating:
+# the cell keeps the parsed tree for everything else (its text, references,
+# renames).  Its 'cell' and 'range' nodes are the parsed tree's own, so the
+# workbook's resolved references (keyed by their id()) apply to both.
+#
+# On top of the parsed nodes it has:
+#
+#     ('const', value)                        a subexpression without references,
+#                                             already evaluated
+#     ('add_n', first, ((op, expr), ...))     a left-deep chain of add (or mul)
+#     ('mul_n', first, ((op, expr), ...))     nodes, evaluated left to right
+#     ('concat_n', (expr, expr, ...))         a chain of concat nodes
+#
+# Every value, including which error wins, is the same as for the parsed tree.
+# Operands are still evaluated in the same order and converted the same way; a
+# chain just does it in a loop instead of recursing down the tree.
+
+_CHAINS = {'add': 'add_n', 'mul': 'mul_n'}
+
+# Evaluates constant subexpressions, which never look at the workbook.
+_constants = FormulaEvaluator(None, None)
+
+
+def optimize(tree):
+    ''' Returns the optimized form of the parsed tuple tree `tree`. '''
+    # Iterative, so any depth of nesting works.  A node goes back on `work`
+    # as [rebuild, count] under its operands, which are optimized onto
+    # `results` first; rebuild() then makes it from the last `count` results.
+    results = []
+    work = [tree]
+    while work:
+        item = work.pop()
+        if item.__class__ is list:
+            rebuild, count = item
+            start = len(results) - count
+            node = rebuild(results[start:])
+            del results[start:]
+            results.append(node)
+            continue
+        kind = item[0]
+        if kind == 'cell' or kind == 'range':
+            results.append(item)
+        elif kind == 'number' or kind == 'string' or kind == 'error':
+            results.append(_fold(item))
+        else:
+            rebuild, operands = _split(item)
+            work.append([rebuild, len(operands)])
+            work.extend(reversed(operands))
+    return results[0]
+
+
+def _split(node):
+    # Returns (rebuild, operands) for optimize(): the operands of `node`, and
+    # a function giving the optimized node from the optimized operands.
+    kind = node[0]
+    if kind in _CHAINS:
+        # A chain of the same operator is walked down its left spine, so
+        # its operands are optimized as one list.
+        steps = []
+        while node[0] == kind:
+            steps.append((node[1], node[3]))
+            node = node[2]
+        steps.reverse()
+        ops = [op for op, _ in steps]
+        return ((lambda operands: _optimize_chain(kind, operands[0], list(zip(ops, operands[1:])))),
+                [node] + [operand for _, operand in steps])
+    if kind == 'concat':
+        operands = []
+        while node[0] == 'concat':
+            operands.append(node[2])
+            node = node[1]
+        operands.append(node)
+        operands.reverse()
+        return _optimize_concat, operands
+    if kind == 'parens':
+        return (lambda operands: _fold_if_constant((kind, operands[0]), operands)), [node[1]]
+    if kind == 'unary':
+        return (lambda operands: _fold_if_constant((kind, node[1], operands[0]), operands)), [node[2]]
+
+    def rebuild(operands):
+        # Range arguments aren't operands; they are kept where they were.
+        operands = iter(operands)
+        args = tuple(arg if arg[0] == 'range' else next(operands) for arg in node[2])
+        return _fold_if_constant((kind, node[1], args), args)
+    return rebuild, [arg for arg in node[2] if arg[0] != 'range']
+
+
+def _is_constant(node):
+    return node[0] == 'const'
+
+
+def _fold(node):
+    # Evaluates `node`, which refers to no cells.  Anything that fails is left
+    # to fail when the cell is evaluated, as it would have.
+    try:
+        return ('const', _constants._value(node))
+    except Exception:
+        return node
+
+
+def _fold_if_constant(node, operands):
+    if all(_is_constant(operand) for operand in operands):
+        return _fold(node)
+    return node
+
+
+def _optimize_chain(kind, first, steps):
+    # The chain `first` op1 e1 op2 e2 ..., with its operands optimized.
+    # The leading constants can be combined: (1 + 2) + A1 is 3 + A1.  Later
+    # ones can't, as (A1 + 1) + 2 isn't A1 + 3 when A1 is text or an error.
+    folded = 0
+    while folded < len(steps) and _is_constant(first) and _is_constant(steps[folded][1]):
+        value = _fold((kind, steps[folded][0], first, steps[folded][1]))
+        if not _is_constant(value):
+            break
+        first = value
+        folded += 1
+    steps = steps[folded:]
+    if not steps:
+        return first
+    return _chain(kind, first, steps)
+
+
+def _chain(kind, first, steps):
+    if len(steps) == 1:
+        return (kind, steps[0][0], first, steps[0][1])
+    return (_CHAINS[kind], first, tuple(steps))
+
+
+def _optimize_concat(operands):
+    # The chain of concat nodes of `operands`, which are optimized.
+    first = operands[0]
+    folded = 1
+    while folded < len(operands) and _is_constant(first) and _is_constant(operands[folded]):
+        value = _fold(('concat', first, operands[folded]))
+        if not _is_constant(value):
+            break
+        first = value
+        folded += 1
+    operands = [first] + operands[folded:]
+    if len(operands) == 1:
+        return operands[0]
+    if len(operands) == 2:
+        return ('concat', operands[0], operands[1])
+    return ('concat_n', tuple(operands))
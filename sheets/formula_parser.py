@@ -0,0 +1,248 @@
+import decimal
+import re
+
+# A parser for the language of formulas.lark.  Rather than lark Trees it
+# produces a tree of plain tuples, and collects the references in the same
+# pass, so nothing has to walk the tree again afterwards.  It keeps its own
+# stack of the groups and calls it is inside, so any depth of nesting parses.
+# A formula fails to parse here exactly when it fails to parse with
+# LarkParser, which is kept as the reference implementation.
+#
+# The nodes are:
+#
+#     ('number', text, Decimal)         ('string', text without the quotes)
+#     ('error', text)                   ('parens', expr)
+#     ('cell', sheet or None, ref)      ('range', sheet or None, start, end)
+#     ('function', name, (expr, ...))   ('unary', op, expr)
+#     ('add', op, left, right)          ('mul', op, left, right)
+#     ('concat', left, right)
+#
+# Names, refs and operators are the text of the formula (so a quoted sheet name
+# keeps its quotes).  Nodes are never modified once built; a change makes new
+# ones.
+
+# The terminals of formulas.lark.  As there, a cell reference, a function name
+# and a sheet name are told apart by what follows them.
+_TOKEN_PATTERN = re.compile(r'''
+      (?P<WS>[ \t\f\r\n]+)
+    | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?|\.[0-9]+)
+    | (?P<STRING>"[^"]*")
+    | (?P<QUOTED_SHEET_NAME>'[^']*')
+    | (?P<ERROR_VALUE>(?i:\#ERROR!|\#CIRCREF!|\#REF!|\#NAME\?|\#VALUE!|\#DIV/0!))
+    | (?P<SHEET_NAME>[A-Za-z_][A-Za-z0-9_]*(?=\s*!))
+    | (?P<FUNCTION_NAME>[A-Za-z][A-Za-z0-9_]*(?=\s*\())
+    | (?P<CELLREF>[A-Za-z]+[1-9][0-9]*(?![A-Za-z0-9_])(?!\s*[(!]))
+    | (?P<ADD_OP>[+-])
+    | (?P<MUL_OP>[*/])
+    | (?P<PUNCT>[=&(),!:])
+''', re.VERBOSE)
+
+
+class FormulaSyntaxError(ValueError):
+    ''' Raised by the parser for a formula that doesn't parse. '''
+
+
+def tokenize(formula):
+    '''
+    Returns the (type, text, start) tokens of `formula`, without whitespace,
+    ending with an 'END' token.  Punctuation has itself as its type.
+    '''
+    tokens = []
+    pos = 0
+    end = len(formula)
+    match = _TOKEN_PATTERN.match
+    while pos < end:
+        m = match(formula, pos)
+        if m is None:
+            raise FormulaSyntaxError(f"Unexpected character at {pos}")
+        kind = m.lastgroup
+        if kind == 'PUNCT':
+            tokens.append((m.group(), m.group(), pos))
+        elif kind != 'WS':
+            tokens.append((kind, m.group(), pos))
+        pos = m.end()
+    tokens.append(('END', '', end))
+    return tokens
+
+
+def parse_number(text):
+    # The same conversion FormulaEvaluator makes for a number token.
+    return decimal.Decimal(str(float(text)).rstrip('0').rstrip('.'))
+
+
+class FormulaParser():
+    def __init__(self):
+        self.refs = []      # (ref,) or (sheet, ref), upper-cased, in formula order
+        self.ranges = []    # ((sheet,) start, end), upper-cased, in formula order
+
+    def parse_formula(self, formula, tokens=None):
+        '''
+        Parses `formula` (with its leading "=").  Returns (refs, tree, None),
+        or (None, None, "#ERROR!") if it doesn't parse, like
+        LarkParser.parse_formula().  `tokens` are those of tokenize(formula),
+        if the caller already has them.
+        '''
+        self.refs = []
+        self.ranges = []
+        try:
+            self._tokens = tokenize(formula) if tokens is None else tokens
+            self._pos = 0
+            self._expect('=')
+            tree = self._expression()
+            self._expect('END')
+        except FormulaSyntaxError:
+            self.refs = []
+            self.ranges = []
+            return None, None, "#ERROR!"
+        finally:
+            self._tokens = None
+        return self.refs, tree, None
+
+    def _peek(self):
+        return self._tokens[self._pos][0]
+
+    def _next(self):
+        token = self._tokens[self._pos]
+        self._pos += 1
+        return token[:2]
+
+    def _expect(self, kind):
+        token = self._next()
+        if token[0] != kind:
+            raise FormulaSyntaxError(f"Expected {kind}, found {token[1]!r}")
+        return token[1]
+
+    def _expression(self):
+        # Reads an expression as a flat list of operands, (sign or None,
+        # base), with the operators between them, and builds its tree once it
+        # ends (see _combine()).  A group or function call inside it starts a
+        # new list; the enclosing ones wait on `stack`, so nesting takes no
+        # Python stack however deep it goes.
+        stack = []      # (function name or None for a group, arguments so far, items, sign)
+        items = []
+        while True:
+            sign = self._next()[1] if self._peek() == 'ADD_OP' else None
+            kind = self._peek()
+            if kind == '(' or kind == 'FUNCTION_NAME':
+                name = self._next()[1] if kind == 'FUNCTION_NAME' else None
+                self._expect('(')
+                stack.append((name, [], items, sign))
+                items = []
+                continue
+            base = self._base()
+            # The base may end any number of groups and calls.
+            while True:
+                items.append((sign, base))
+                kind = self._peek()
+                if kind == 'ADD_OP' or kind == 'MUL_OP' or kind == '&':
+                    items.append(self._next()[1])
+                    break
+                if not stack:
+                    return self._combine(items)
+                name, args, outer, sign = stack[-1]
+                if name is not None and kind == ',':
+                    self._next()
+                    args.append(self._combine(items))
+                    items = []
+                    break
+                self._expect(')')
+                stack.pop()
+                if name is None:
+                    base = ('parens', self._combine(items))
+                else:
+                    args.append(self._combine(items))
+                    base = ('function', name, tuple(args))
+                items = outer
+
+    def _combine(self, items):
+        # The tree of operand, operator, operand, ... from _expression().  As
+        # in the grammar, a concatenation's operands are all bases, so it
+        # can't have signs or mix with arithmetic; arithmetic is left-deep,
+        # with * and / binding tighter than + and -.
+        operands = items[0::2]
+        ops = items[1::2]
+        if '&' in ops:
+            if any(op != '&' for op in ops) or any(sign is not None for sign, _ in operands):
+                raise FormulaSyntaxError("Unexpected '&'")
+            tree = operands[0][1]
+            for _, base in operands[1:]:
+                tree = ('concat', tree, base)
+            return tree
+        terms = [base if sign is None else ('unary', sign, base) for sign, base in operands]
+        left = None
+        add_op = None
+        term = terms[0]
+        for op, operand in zip(ops, terms[1:]):
+            if op == '*' or op == '/':
+                term = ('mul', op, term, operand)
+                continue
+            left = term if left is None else ('add', add_op, left, term)
+            add_op = op
+            term = operand
+        return term if left is None else ('add', add_op, left, term)
+
+    def _base(self):
+        # A base other than a group or function call.
+        kind, text = self._next()
+        if kind == 'NUMBER':
+            return ('number', text, parse_number(text))
+        if kind == 'STRING':
+            return ('string', text[1:-1])
+        if kind == 'ERROR_VALUE':
+            return ('error', text)
+        if kind == 'SHEET_NAME' or kind == 'QUOTED_SHEET_NAME':
+            self._expect('!')
+            return self._reference(text, self._expect('CELLREF'))
+        if kind == 'CELLREF':
+            return self._reference(None, text)
+        raise FormulaSyntaxError(f"Unexpected {text!r}")
+
+    def _reference(self, sheet, ref):
+        prefix = () if sheet is None else (sheet.upper(),)
+        if self._peek() != ':':
+            self.refs.append(prefix + (ref.upper(),))
+            return ('cell', sheet, ref)
+        self._next()
+        end = self._expect('CELLREF')
+        self.ranges.append(prefix + (ref.upper(), end.upper()))
+        return ('range', sheet, ref, end)
+
+
+def iter_references(tree):
+    '''
+    Yields the 'cell' and 'range' nodes of `tree`, in the order they appear in
+    the formula (the order of FormulaParser's refs and ranges).
+    '''
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        kind = node[0]
+        if kind == 'cell' or kind == 'range':
+            yield node
+        elif kind == 'function':
+            stack.extend(reversed(node[2]))
+        elif kind == 'add' or kind == 'mul':
+            stack.append(node[3])
+            stack.append(node[2])
+        elif kind == 'concat':
+            stack.append(node[2])
+            stack.append(node[1])
+        elif kind == 'unary':
+            stack.append(node[2])
+        elif kind == 'parens':
+            stack.append(node[1])
+
+
+def find_references(tree):
+    '''
+    Returns (refs, ranges) of `tree` in the form FormulaParser collects them.
+    '''
+    refs = []
+    ranges = []
+    for node in iter_references(tree):
+        names = tuple(part.upper() for part in node[1:] if part is not None)
+        if node[0] == 'cell':
+            refs.append(names)
+        else:
+            ranges.append(names)
+    return refs, ranges
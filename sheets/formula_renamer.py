@@ -1,6 +1,96 @@
 from lark import Transformer, Token, Tree
+from sheets.formula_constructer import formula_ast_to_string
+from sheets.formula_table import intern_tree
 import re
 
+SHEET_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def needs_quotes(sheetname):
+    return not SHEET_NAME_PATTERN.match(sheetname)
+
+
+def format_sheet_name(sheetname):
+    """ Quotes `sheetname` for use in a formula iff it is necessary. """
+    if needs_quotes(sheetname):
+        return f'\'{sheetname}\''
+    return sheetname
+
+
+def rename_sheet_in_cell(cell, old_name, new_name, renamed=None):
+    """
+    Rewrites the sheet names in a parsed formula cell after a sheet rename,
+    without reparsing it.  References to `old_name` (case-insensitive)
+    become `new_name`; every sheet name in the formula is quoted iff
+    necessary.  The cell's Formula is replaced; the workbook has to map the
+    new tree's references to their nodes again.  `renamed` is an optional
+    {Formula : renamed Formula} shared by the cells of one rename, so that a
+    formula filled into many cells is rewritten once.
+    """
+    formula = cell.formula
+    if renamed is not None and formula in renamed:
+        cell.formula = renamed[formula]
+        return
+    tree = rename_sheet_in_tree(formula.tree, old_name, new_name)
+    cell.formula = intern_tree("=" + formula_ast_to_string(tree), tree, formula.origin)
+    if renamed is not None:
+        renamed[formula] = cell.formula
+
+
+def rename_sheet_in_tree(tree, old_name, new_name):
+    """
+    Returns the tuple tree `tree` (see FormulaParser) with its sheet names
+    renamed as rename_sheet_in_cell() describes.
+    """
+    # Iterative, so any depth of nesting works: a node goes back on `work` as
+    # [node] under its children, and is rebuilt from the renamed children
+    # once they are on `results`.
+    results = []
+    work = [tree]
+    while work:
+        item = work.pop()
+        if item.__class__ is list:
+            node = item[0]
+            start = len(results) - len(_children(node))
+            children = tuple(results[start:])
+            del results[start:]
+            if node[0] == 'function':
+                results.append(node[:2] + (children,))
+            else:
+                results.append(node[:_CHILDREN_START[node[0]]] + children)
+            continue
+        kind = item[0]
+        if kind == 'cell' or kind == 'range':
+            results.append(_rename_reference(item, old_name, new_name))
+        elif kind == 'function' or kind in _CHILDREN_START:
+            work.append([item])
+            work.extend(reversed(_children(item)))
+        else:
+            results.append(item)
+    return results[0]
+
+
+# Where the children of each kind of node start, except 'function', which
+# has them as a tuple in node[2].
+_CHILDREN_START = {'add': 2, 'mul': 2, 'unary': 2, 'concat': 1, 'parens': 1}
+
+
+def _children(node):
+    if node[0] == 'function':
+        return node[2]
+    return node[_CHILDREN_START[node[0]]:]
+
+
+def _rename_reference(node, old_name, new_name):
+    if node[1] is None:
+        return node
+    token = node[1]
+    sheetname = token[1:-1] if token.startswith('\'') else token
+    if sheetname.upper() == old_name.upper():
+        sheetname = new_name
+    return (node[0], format_sheet_name(sheetname)) + node[2:]
+
+
 class FormulaRenamer(Transformer):
     def __init__(self, old_name, new_name):
         super().__init__()
@@ -8,9 +98,7 @@ class FormulaRenamer(Transformer):
         self.new_name = new_name
 
     def needs_quotes(self, sheetname):
-        sheet_name_pattern = r'^[A-Za-z_][A-Za-z0-9_]*$'
-
-        return not re.match(sheet_name_pattern, sheetname)
+        return needs_quotes(sheetname)
 
     def _sheetname(self, sheetname):
 
@@ -30,4 +118,4 @@ class FormulaRenamer(Transformer):
         if len(items) == 2:
             return Tree(Token('RULE', 'cell'), [Token('SHEET_NAME', self._sheetname(items[0])), Token('CELLREF', items[1])])
         else:
-            return Tree(Token('RULE', 'cell'), [Token('CELLREF', items[0])])
\ No newline at end of file
+            return Tree(Token('RULE', 'cell'), [Token('CELLREF', items[0])])
@@ -0,0 +1,152 @@
+import weakref
+from sheets.formula_parser import FormulaParser, FormulaSyntaxError, find_references, tokenize
+from sheets.formula_optimizer import optimize
+from sheets.formula_bytecode import compile_tree
+from sheets.workbook_utility import parse_cell_location_string, index_to_cell_location
+
+# Formulas filled down or across a sheet, like "=A1*2" in B1 and "=A2*2" in B2,
+# are the same formula relative to their cells.  Each distinct formula is
+# parsed and optimized once, into a Formula, and every cell holding it keeps
+# just the Formula and its own location (its anchor).  The text, references
+# and range references of a cell are worked out from the two when asked for.
+#
+# A formula's key is its text with each cell reference replaced by its
+# (row offset, column offset, lower case) from the anchor, so the text at any
+# anchor comes back exactly as it was typed, spacing included.  A reference in
+# mixed case ("aB1") is kept as it is and the formula isn't shared.
+#
+# The tree is the one parsed at the first anchor the formula was seen at (its
+# origin), so the text of its 'cell' and 'range' nodes is only right there.
+# Nothing that evaluates a cell reads it: the workbook resolves a cell's
+# references from its own refs, keyed by the id() of the shared nodes.
+#
+# The table holds formulas weakly, so one goes once no cell uses it.
+
+_formulas = weakref.WeakValueDictionary()
+
+
+class Formula:
+    __slots__ = ('key', 'origin', 'text', 'tree', 'code', 'single_ref', 'refs',
+                 'range_refs', '_pieces', '_ref_offsets', '_range_offsets', '__weakref__')
+
+    def __init__(self, key, pieces, origin, text, tree, refs, range_refs):
+        self.key = key
+        self.origin = origin
+        self.text = text
+        self.tree = tree
+        # `tree` rewritten by formula_optimizer and compiled by
+        # formula_bytecode, which is what gets evaluated, and whether the
+        # formula is just a reference to a cell, e.g. "=A1".
+        self.code = compile_tree(optimize(tree))
+        self.single_ref = tree[0] == 'cell'
+        # As FormulaParser gives them, at the origin.
+        self.refs = refs
+        self.range_refs = range_refs
+        self._pieces = pieces
+        self._ref_offsets = [self._offset(ref[-1]) for ref in refs]
+        self._range_offsets = [(self._offset(ref[-2]), self._offset(ref[-1])) for ref in range_refs]
+
+    def _offset(self, ref):
+        row, col = parse_cell_location_string(ref)
+        return row - self.origin[0], col - self.origin[1]
+
+    def text_at(self, anchor):
+        ''' Returns the text of the formula in the cell at `anchor`. '''
+        if anchor == self.origin:
+            return self.text
+        row, col = anchor
+        parts = []
+        for piece in self._pieces:
+            if piece.__class__ is str:
+                parts.append(piece)
+            else:
+                ref = index_to_cell_location(row + piece[0], col + piece[1])
+                parts.append(ref.lower() if piece[2] else ref)
+        return "".join(parts)
+
+    def refs_at(self, anchor):
+        ''' Returns the refs of the formula in the cell at `anchor`. '''
+        if anchor == self.origin:
+            return self.refs
+        row, col = anchor
+        return [ref[:-1] + (index_to_cell_location(row + dr, col + dc),)
+                for ref, (dr, dc) in zip(self.refs, self._ref_offsets)]
+
+    def range_refs_at(self, anchor):
+        ''' Returns the range refs of the formula in the cell at `anchor`. '''
+        if anchor == self.origin:
+            return self.range_refs
+        row, col = anchor
+        return [ref[:-2] + (index_to_cell_location(row + dr1, col + dc1),
+                            index_to_cell_location(row + dr2, col + dc2))
+                for ref, ((dr1, dc1), (dr2, dc2)) in zip(self.range_refs, self._range_offsets)]
+
+
+def intern_formula(text, anchor):
+    '''
+    Returns the Formula for the formula `text` (with its leading "=") in the
+    cell at `anchor`, (row, col), parsing it only if no cell has it already.
+    Returns None if it doesn't parse.
+    '''
+    try:
+        tokens = tokenize(text)
+    except FormulaSyntaxError:
+        return None
+    pieces, pinned = _relative_pieces(text, tokens, anchor)
+    key = (pieces, anchor if pinned else None)
+    formula = _formulas.get(key)
+    if formula is not None:
+        return formula
+
+    parser = FormulaParser()
+    refs, tree, error = parser.parse_formula(text, tokens)
+    if error:
+        return None
+    formula = Formula(key, pieces, anchor, text, tree, refs, parser.ranges)
+    _formulas[key] = formula
+    return formula
+
+
+def intern_tree(text, tree, anchor):
+    '''
+    Returns the Formula for the formula `text` in the cell at `anchor`, whose
+    tree is already known to be `tree`, e.g. one rewritten by a sheet rename.
+    `text` is only tokenized, never parsed.
+    '''
+    pieces, pinned = _relative_pieces(text, tokenize(text), anchor)
+    key = (pieces, anchor if pinned else None)
+    formula = _formulas.get(key)
+    if formula is not None:
+        return formula
+
+    refs, ranges = find_references(tree)
+    formula = Formula(key, pieces, anchor, text, tree, refs, ranges)
+    _formulas[key] = formula
+    return formula
+
+
+def _relative_pieces(text, tokens, anchor):
+    # Returns (pieces, pinned): the text between cell references, and the
+    # references as offsets from `anchor`, in order; and whether a reference
+    # had to be kept as it is.
+    pieces = []
+    pinned = False
+    last = 0
+    for kind, token, start in tokens:
+        if kind != 'CELLREF':
+            continue
+        pieces.append(text[last:start])
+        last = start + len(token)
+        if not (token.isupper() or token.islower()):
+            pieces.append(token)
+            pinned = True
+            continue
+        row, col = parse_cell_location_string(token)
+        pieces.append((row - anchor[0], col - anchor[1], token.islower()))
+    pieces.append(text[last:])
+    return tuple(pieces), pinned
+
+
+def formula_count():
+    ''' Returns the number of distinct formulas in use. '''
+    return len(_formulas)
@@ -0,0 +1,267 @@
+import decimal
+from collections import Counter
+from decimal import Decimal
+from sheets.cell_error_type import CellError
+from sheets.column_buffers import NUMBER, STRING, ERROR
+
+# Spreadsheet functions, called by FormulaEvaluator with their evaluated
+# arguments.  An argument is either a single value (Decimal, str, None for an
+# empty cell, or an error string such as "#REF!") or a RangeArgument.
+#
+# The aggregates treat their arguments the same way:
+#
+# - If any argument holds an error, the first one wins: arguments are scanned
+#   in order, and a range row by row, left to right.  COUNT is the exception;
+#   it ignores errors.
+#
+# - Empty cells are ignored.  Text is converted to a number the same way as in
+#   arithmetic ("12" -> 12); text that isn't a number gives #VALUE!.
+#
+# - SUM of no numbers is 0, as are MIN and MAX; AVERAGE of no numbers is
+#   #DIV/0!.  COUNT counts the numbers (not text) in its arguments.
+
+
+class RangeArgument:
+    ''' A range passed to a function, as the column slices of its values. '''
+
+    def __init__(self, columns):
+        self.columns = columns  # [(values, kinds)], see ColumnBuffers.get_slices()
+
+    def first_error(self):
+        first = None
+        for values, kinds in self.columns:
+            row = kinds.find(ERROR)
+            # Columns are in order, so on a tie the earlier column wins.
+            if row != -1 and (first is None or row < first[0]):
+                first = (row, values[row])
+        if first is None:
+            return None
+        return CellError.get_string_from_error_type(first[1].get_type())
+
+    def count(self):
+        return sum(kinds.count(NUMBER) for _, kinds in self.columns)
+
+    def numbers(self):
+        ''' Returns the numbers in the range, or "#VALUE!". '''
+        numbers = []
+        for values, kinds in self.columns:
+            if STRING not in kinds:
+                numbers.extend(value for value in values if value is not None)
+                continue
+            for value, kind in zip(values, kinds):
+                if kind == NUMBER:
+                    numbers.append(value)
+                elif kind == STRING:
+                    number = to_number(value)
+                    if number is None:
+                        return "#VALUE!"
+                    numbers.append(number)
+        return numbers
+
+
+def to_number(value):
+    ''' Converts text to a Decimal as arithmetic does, or returns None. '''
+    try:
+        number = Decimal(str(float(value)).rstrip('0').rstrip('.'))
+    except (ValueError, decimal.InvalidOperation):
+        return None
+    if not number.is_finite():
+        return None
+    return number
+
+
+def _first_error(args):
+    for arg in args:
+        if isinstance(arg, RangeArgument):
+            error = arg.first_error()
+            if error is not None:
+                return error
+        elif CellError.is_error_string(arg):
+            return arg
+    return None
+
+
+def _collect_numbers(args):
+    # Returns (error string or None, list of numbers).
+    error = _first_error(args)
+    if error is not None:
+        return error, None
+    numbers = []
+    for arg in args:
+        if isinstance(arg, RangeArgument):
+            range_numbers = arg.numbers()
+            if isinstance(range_numbers, str):
+                return range_numbers, None
+            numbers.extend(range_numbers)
+        elif isinstance(arg, Decimal):
+            numbers.append(arg)
+        elif arg is not None:
+            number = to_number(arg)
+            if number is None:
+                return "#VALUE!", None
+            numbers.append(number)
+    return None, numbers
+
+
+def sum_function(args):
+    error, numbers = _collect_numbers(args)
+    if error is not None:
+        return error
+    return sum(numbers, Decimal(0))
+
+
+def average_function(args):
+    error, numbers = _collect_numbers(args)
+    if error is not None:
+        return error
+    if not numbers:
+        return "#DIV/0!"
+    return sum(numbers, Decimal(0)) / len(numbers)
+
+
+def min_function(args):
+    error, numbers = _collect_numbers(args)
+    if error is not None:
+        return error
+    return min(numbers) if numbers else Decimal(0)
+
+
+def max_function(args):
+    error, numbers = _collect_numbers(args)
+    if error is not None:
+        return error
+    return max(numbers) if numbers else Decimal(0)
+
+
+def count_function(args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, RangeArgument):
+            count += arg.count()
+        elif isinstance(arg, Decimal):
+            count += 1
+    return Decimal(count)
+
+
+FUNCTIONS = {
+    'SUM': sum_function,
+    'AVERAGE': average_function,
+    'MIN': min_function,
+    'MAX': max_function,
+    'COUNT': count_function,
+}
+
+
+def call_function(name, args):
+    ''' Calls the function with the (case-insensitive) name, or gives #NAME?. '''
+    function = FUNCTIONS.get(name.upper())
+    if function is None:
+        return "#NAME?"
+    return function(args)
+
+
+# Functions whose result over ranges can be maintained from single-value
+# changes; see IncrementalAggregate.
+INCREMENTAL_FUNCTIONS = ('SUM', 'COUNT', 'AVERAGE')
+
+
+class IncrementalAggregate:
+    '''
+    Running state of a formula that is just SUM, COUNT or AVERAGE over one or
+    more ranges, e.g. "=SUM(A1:A100000)".  Once reset() has computed it from
+    the ranges, apply() folds each change of a value inside a range into the
+    running total and count in O(1), so the result doesn't have to re-read the
+    ranges.
+
+    The state is only kept while every value in the ranges is a number or
+    empty.  A change from or to an error or text makes it invalid (except for
+    COUNT, which ignores those), and the formula is then computed in full,
+    which resets it.  So does a number with too many digits for the total to
+    stay exact (see _is_exact()), since adding and then subtracting it again
+    would round the total.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.total = Decimal(0)
+        self.count = 0
+        # {exponent : how many numbers in the ranges have it}, and the same
+        # for their adjusted() exponents; see result() and _is_exact().
+        self.exponents = Counter()
+        self.magnitudes = Counter()
+        self.valid = False
+
+    def reset(self, args):
+        '''
+        Recomputes the state from RangeArguments (or error strings for ranges
+        that couldn't be read) and returns the function's result.
+        '''
+        self.valid = False
+        if any(not isinstance(arg, RangeArgument) for arg in args):
+            return call_function(self.name, args)
+        if self.name != 'COUNT':
+            if _first_error(args) is not None:
+                return call_function(self.name, args)
+            if any(STRING in kinds for arg in args for _, kinds in arg.columns):
+                return call_function(self.name, args)
+            numbers = [value for arg in args for values, _ in arg.columns
+                       for value in values if value is not None]
+            self.total = sum(numbers, Decimal(0))
+            self.exponents = Counter(number.as_tuple().exponent for number in numbers)
+            self.magnitudes = Counter(number.adjusted() for number in numbers)
+        self.count = sum(arg.count() for arg in args)
+        if self.name != 'COUNT' and not self._is_exact():
+            return call_function(self.name, args)
+        self.valid = True
+        return self.result()
+
+    def apply(self, old_value, new_value):
+        ''' Folds a value in one of the ranges changing into the state. '''
+        if not self.valid:
+            return
+        for value, sign in ((old_value, -1), (new_value, 1)):
+            if value is None:
+                continue
+            if isinstance(value, Decimal):
+                self.total += sign * value
+                self.count += sign
+                _count(self.exponents, value.as_tuple().exponent, sign)
+                _count(self.magnitudes, value.adjusted(), sign)
+            elif self.name != 'COUNT':
+                self.valid = False
+                return
+        if self.name != 'COUNT' and not self._is_exact():
+            self.valid = False
+
+    def result(self):
+        if self.name == 'SUM':
+            return self._exact_total()
+        if self.name == 'COUNT':
+            return Decimal(self.count)
+        if self.count == 0:
+            return "#DIV/0!"
+        return self._exact_total() / self.count
+
+    def _exact_total(self):
+        # The total as sum() computes it from the current numbers, which has
+        # the smallest exponent among them and Decimal(0).  The running total
+        # may have a smaller one left from numbers that have since changed
+        # (2.5 - 1.5 + 1 is 2.0, while 1 + 1 is 2).
+        exponent = min(min(self.exponents, default=0), 0)
+        return self.total.quantize(Decimal((0, (1,), exponent)))
+
+    def _is_exact(self):
+        # Whether the numbers are close enough in magnitude that no sum of
+        # some of them has more digits than the context keeps.  Then sum()
+        # doesn't round either, and the running total is exactly its result.
+        if not self.magnitudes:
+            return True
+        digits = (max(self.magnitudes) + 1 + len(str(self.count)) -
+                  min(min(self.exponents), 0))
+        return digits <= decimal.getcontext().prec
+
+
+def _count(counter, key, change):
+    counter[key] += change
+    if not counter[key]:
+        del counter[key]
@@ -1,39 +1,59 @@
-class Graph:
-    def __init__(self):
-        self.graph = dict()
-        self.sccs = []  # List to store SCCs
-
-        self.node_to_scc_num = dict()
-        self.scc_dag = dict()
-        self.topo_sort = list()
-
-        self.updated = True
-    
-    def rename_cell(self, old_cell, new_cell):
-        if old_cell not in self.graph:
-            return None
-        
-        if new_cell not in self.graph:
-            self.graph[new_cell] = list(self.graph[old_cell])
-
-        del self.graph[old_cell]
+import time
+from sheets.range_index import RangeIndex
 
-        for node in self.graph:
-            if old_cell in self.graph[node]:
-                self.graph[node].remove(old_cell)
-                self.graph[node].append(new_cell)
 
-        self.updated = False
+class Graph:
+    def __init__(self, group_of=None, locate=None):
+        self.graph = dict()
+        # Parents of each node (nodes with an edge into it), so that a node's
+        # incoming edges can be found without scanning the whole graph.
+        self.reverse = dict()
+        # If `group_of` is given, nodes are also indexed by group_of(node) so
+        # that a whole group can be found (and removed) at once.
+        self.group_of = group_of
+        self.groups = dict()
+        # Range edges: a node can depend on a whole rectangle of a group, which
+        # is stored once in that group's RangeIndex instead of as an edge from
+        # every node inside it.  `locate(node)` must return (group, (row, col)).
+        self.locate = locate
+        self.range_index = dict()   # {group : RangeIndex}
+        self.range_edges = dict()   # {node : list of (group, key)} of its ranges
+        self.next_range_key = 0
+
+        self.on_update = None   # if set, called with the seconds analyze() took
+
+    def get_reachable(self, node):
+        """
+        Returns the set of nodes reachable from `node` (including itself).
+        """
+        if node not in self.graph:
+            return {node}
+        seen = {node}
+        stack = [node]
+        while stack:
+            u = stack.pop()
+            for v in self._children(u):
+                if v not in seen:
+                    seen.add(v)
+                    stack.append(v)
+        return seen
 
     def get_all_nodes(self):
         return list(self.graph.keys())
+
+    def get_group(self, group):
+        """
+        Returns the set of nodes in `group`.  Requires `group_of`.
+        """
+        return set(self.groups.get(group, ()))
     
     def add_node(self, node):
         if node in self.graph:
             return None
         self.graph[node] = list()
-
-        self.updated = False
+        self.reverse[node] = set()
+        if self.group_of is not None:
+            self.groups.setdefault(self.group_of(node), set()).add(node)
 
     def add_edge(self, u, v):
         """
@@ -43,173 +63,159 @@ class Graph:
         self.add_node(v)
             
         self.graph[u].append(v)
+        self.reverse[v].add(u)
 
-        self.updated = False
+    def add_range_edge(self, group, top, left, bottom, right, v):
+        """
+        Adds edges from every node in the rectangle (top, left)-(bottom, right)
+        of `group` to v, including nodes added to it later.  Requires `locate`.
+        """
+        self.add_node(v)
+        key = self.next_range_key
+        self.next_range_key += 1
+        self.range_index.setdefault(group, RangeIndex()).add(key, top, left, bottom, right, v)
+        self.range_edges.setdefault(v, []).append((group, key))
+
+    def add_edges(self, nodes, edges):
+        """
+        Adds all of `nodes` and the edges u ---> v in `edges` in one pass.
+        """
+        for node in nodes:
+            self.add_node(node)
+        for u, v in edges:
+            self.add_node(u)
+            self.add_node(v)
+            self.graph[u].append(v)
+            self.reverse[v].add(u)
 
     def clear_refs(self, node):
         # clears all edges going into node
-        for other_node in self.graph:
-            if node in self.graph[other_node]:
-                self.graph[other_node].remove(node)
-        
-        self.updated = False
-
-    def clear_refs_criterion(self, crit_func):
-        to_clear = list()
-        for node in self.graph:
-            if crit_func(node):
-                to_clear.append(node)
-
-        for node in to_clear:
-            self.clear_refs(node)
-
-    def tarjan(self):
-        index = 0
+        for group, key in self.range_edges.pop(node, ()):
+            index = self.range_index[group]
+            index.remove(key)
+            if not index:
+                del self.range_index[group]
+
+        parents = self.reverse.get(node)
+        if not parents:
+            return
+        for other_node in parents:
+            self.graph[other_node] = [v for v in self.graph[other_node] if v != node]
+        self.reverse[node] = set()
+
+    def remove_nodes(self, nodes):
+        """
+        Removes every node in `nodes`, along with all edges into and out of it.
+        """
+        for node in nodes:
+            if node in self.graph:
+                self._remove_node(node)
+
+    def _remove_node(self, node):
+        self.clear_refs(node)
+        for child in self.graph[node]:
+            if child != node:
+                self.reverse[child].discard(node)
+        del self.graph[node]
+        del self.reverse[node]
+        if self.group_of is not None:
+            group = self.groups[self.group_of(node)]
+            group.discard(node)
+            if not group:
+                del self.groups[self.group_of(node)]
+
+    def analyze(self, nodes):
+        """
+        Tarjan's algorithm over just the subgraph induced by `nodes`, leaving
+        the rest of the graph alone.  `nodes`
+        must be closed under reachability, e.g. a union of get_reachable()
+        sets, so that every cycle through one of them lies inside it; then
+        their SCCs are the same as in the whole graph.
+
+        Returns (the nodes in topological order, {node : list of its SCC} for
+        the nodes that are on a cycle).  A node with an edge to itself is on a
+        cycle of its own.
+        """
+        start = time.perf_counter()
+        nodes = nodes if isinstance(nodes, (set, dict)) else set(nodes)
+        index = dict()
+        low_link = dict()
+        on_stack = set()
         stack = []
-        low_link = {}
-        on_stack = {}
-        result = []
-        curr_index = {}
-
-        call_stack = []
-        for node in self.graph:
-            if low_link.get(node, -1) == -1:
-                call_stack.append((node, 0))
-
-                while call_stack:
-                    u, neighbor_index = call_stack.pop()
-
-                    # First time visiting u
-                    if neighbor_index == 0:
-                        index += 1
-                        curr_index[u] = index
-                        low_link[u] = index
-                        stack.append(u)
-                        on_stack[u] = True
-                    
-                    # We just returned from a neighbor
-                    if neighbor_index > 0:
-                        previous_neighbor = self.graph[u][neighbor_index - 1]
-                        if on_stack[previous_neighbor]:
-                            low_link[u] = min(low_link[u], low_link[previous_neighbor])
-
-                    # Skip all neighbors that have already been visited
-                    while neighbor_index < len(self.graph[u]):
-                        v = self.graph[u][neighbor_index]
-                        if low_link.get(v, -1) == -1:
-                            break
-                        if on_stack[v]:
-                            low_link[u] = min(low_link[u], low_link[v])
-                        neighbor_index += 1
-
-                    # If we still have neighbors to visit
-                    if neighbor_index < len(self.graph[u]):
-                        v = self.graph[u][neighbor_index]
-                        call_stack.append((u, neighbor_index + 1))
-                        call_stack.append((v, 0))
+        sccs = []   # in reverse topological order
+        cycles = dict()
+
+        for root in nodes:
+            if root in index:
+                continue
+            index[root] = low_link[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            call_stack = [(root, iter(self._children(root) if root in self.graph else ()))]
+            while call_stack:
+                u, children = call_stack[-1]
+                for v in children:
+                    if v not in nodes:
                         continue
-                    
-                    # No more neighbors to visit. We can check if we have an SCC
-                    if low_link[u] == curr_index[u]:
+                    if v not in index:
+                        index[v] = low_link[v] = len(index)
+                        stack.append(v)
+                        on_stack.add(v)
+                        call_stack.append((v, iter(self._children(v))))
+                        break
+                    if v in on_stack:
+                        low_link[u] = min(low_link[u], index[v])
+                        if v == u:
+                            cycles[u] = [u]
+                else:
+                    call_stack.pop()
+                    if call_stack:
+                        parent = call_stack[-1][0]
+                        low_link[parent] = min(low_link[parent], low_link[u])
+                    if low_link[u] == index[u]:
                         scc = []
                         while True:
                             node = stack.pop()
-                            on_stack[node] = False
+                            on_stack.discard(node)
                             scc.append(node)
-
-                            self.node_to_scc_num[node] = len(result)
-
                             if node == u:
                                 break
-                            
-                        result.append(set(scc))
-
-        return result
-    def build_scc_dag(self, sccs):
-        scc_dag = dict()
-        for scc_num, scc in enumerate(sccs):
-            scc_dag[scc_num] = set()
-            for node in scc:
-                for neighbor in self.graph[node]:
-                    if neighbor not in scc:
-                        scc_dag[scc_num].add(self.node_to_scc_num.get(neighbor))
-        
-        return scc_dag
-
-    def topological_sort(self, scc_dag):
-        in_degree = {node: 0 for node in scc_dag}
-        for node in scc_dag:
-            for neighbor in scc_dag[node]:
-                in_degree.setdefault(neighbor, 0)
-
-        for node in scc_dag:
-            for neighbor in scc_dag[node]:
-                in_degree[neighbor] += 1
-
-        queue = [node for node in in_degree if in_degree[node] == 0]
-
-        sorted_order = []
-        while queue:
-            node = queue.pop(0)
-            sorted_order.append(node)
-
-            for neighbor in scc_dag.get(node, []):
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
-
-        return sorted_order
-    
-    def get_node_topo_from_scc_topo(self, sccs, scc_topo_sort):
-        ans = list()
-        for scc_num in scc_topo_sort:
-            for node in sccs[scc_num]:
-                ans.append(node)
-        return ans
-    
-    def update(self):
-        self.sccs = self.tarjan()
-        self.scc_dag = self.build_scc_dag(self.sccs)
-        scc_topo_sort = self.topological_sort(self.scc_dag)
-
-        self.topo_sort = self.get_node_topo_from_scc_topo(self.sccs, scc_topo_sort)
+                        if len(scc) > 1:
+                            for node in scc:
+                                cycles[node] = scc
+                        sccs.append(scc)
 
-        self.updated = True
+        order = [node for scc in reversed(sccs) for node in scc]
+        if self.on_update is not None:
+            self.on_update(time.perf_counter() - start)
+        return order, cycles
 
-    def get_sccs(self):
-        if not self.updated:
-            self.update()
-        return self.sccs
-
-    def get_scc_number(self, u):
-        if not self.updated:
-            self.update()
-
-        return self.node_to_scc_num.get(u)
-
-    def get_topo_sort(self):
-        if not self.updated:
-            self.update()
-
-        return self.topo_sort
-    
-    def get_component(self, node):
-        if not self.updated:
-            self.update()
-
-        if self.is_in_graph(node):
-            return self.sccs[self.node_to_scc_num.get(node)]
-        
     def is_in_graph(self, node):
         return node in self.graph
+
+    def is_orphan(self, node):
+        """
+        Returns True if no edge (range edges included) goes into or out of
+        `node`, i.e. nothing depends on it and it depends on nothing.
+        """
+        return not self.graph.get(node) and not self.reverse.get(node) and node not in self.range_edges
     
     def get_children(self, node):
-        return list(self.graph.get(node, []))
+        if node not in self.graph:
+            return []
+        return list(self._children(node))
+
+    def _children(self, node):
+        # Explicit children plus the dependents of ranges containing the node.
+        children = self.graph[node]
+        if self.range_index:
+            group, loc = self.locate(node)
+            index = self.range_index.get(group)
+            if index is not None:
+                range_children = index.query(loc[0], loc[1])
+                if range_children:
+                    return children + range_children
+        return children
 
     def get_adj_list(self):
         return { node : list(children) for node, children in self.graph.items() }
-    
-    def get_scc_dag(self):
-        if not self.updated:
-            self.update()
-        return { scc_num : list(children) for scc_num, children in self.scc_dag.items()}
\ No newline at end of file
@@ -1,14 +1,32 @@
 import lark
 import os
 
+# The formula grammar is LALR(1), which parses much faster than Lark's default
+# Earley parser; 'earley' is kept to check the two against each other.
+PARSER_MODES = ('lalr', 'earley')
+
+_parsers = dict()   # {mode : lark.Lark}, built on first use
+
+def get_lark_parser(mode='lalr'):
+    """
+    Returns the shared Lark parser for formulas.lark in the given mode.
+    """
+    if mode not in PARSER_MODES:
+        raise ValueError(f"unknown parser mode {mode!r}")
+    if mode not in _parsers:
+        _parsers[mode] = lark.Lark.open("formulas.lark", start='formula', parser=mode,
+                                        rel_to=__file__)
+    return _parsers[mode]
+
 class LarkParser():
-    def __init__(self): 
-        self.parser = lark.Lark.open("formulas.lark", start='formula', rel_to=__file__)
+    def __init__(self, mode='lalr'): 
+        self.parser = get_lark_parser(mode)
         self.cell_ref_finder = CellRefFinder()
 
     def parse_formula(self, formula):
         try:
             tree = self.parser.parse(formula)
+            self.cell_ref_finder = CellRefFinder()
             self.cell_ref_finder.visit(tree) # Gather cell references
             
             return self.cell_ref_finder.refs, tree, None
@@ -19,6 +37,10 @@ class LarkParser():
 class CellRefFinder(lark.Visitor):
     def __init__(self):
         self.refs = []
+        self.ranges = []    # ((sheet,) start, end) for each cell_range
+
+    def cell_range(self, tree):
+        self.ranges.append(tuple(str(child).upper() for child in tree.children))
 
     def cell(self, tree):
         if len(tree.children) == 1:
@@ -0,0 +1,218 @@
+import collections
+import threading
+import time
+
+# What `submit` does when the queue already holds `max_queue_size` batches:
+#   'block'       - wait until the background thread makes room
+#   'drop_oldest' - discard the oldest pending batch
+#   'coalesce'    - merge the new change set into the newest pending batch
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+
+class ListenerStats:
+    '''
+    Delivery metrics for a single registered notify function.  Lag is the time
+    between a change set being submitted and this listener being called with it.
+    '''
+
+    def __init__(self):
+        self.delivered = 0      # number of batches delivered
+        self.cells = 0          # number of cells delivered over all batches
+        self.dropped = 0        # batches discarded before delivery
+        self.errors = 0         # calls that raised an exception
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.busy_time = 0.0    # time spent inside the listener itself
+
+    def record(self, lag, busy, num_cells, raised):
+        self.delivered += 1
+        self.cells += num_cells
+        self.errors += 1 if raised else 0
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.busy_time += busy
+
+    def get_mean_lag(self):
+        if self.delivered == 0:
+            return 0.0
+        return self.total_lag / self.delivered
+
+    def __repr__(self):
+        return (f'ListenerStats(delivered={self.delivered}, dropped={self.dropped}, '
+                f'errors={self.errors}, mean_lag={self.get_mean_lag():.6f}, '
+                f'max_lag={self.max_lag:.6f})')
+
+
+class _Batch:
+    def __init__(self, workbook, deliveries):
+        # deliveries: list of (slot, notify_function, changed_cells), ordered by
+        # slot, i.e. by the order in which the functions were registered.
+        self.workbook = workbook
+        self.deliveries = deliveries
+        self.enqueued_at = time.perf_counter()
+
+    def merge(self, other):
+        merged = {slot: (fn, list(cells)) for slot, fn, cells in self.deliveries}
+        for slot, fn, cells in other.deliveries:
+            if slot not in merged:
+                merged[slot] = (fn, list(cells))
+                continue
+            existing = merged[slot][1]
+            seen = set(existing)
+            for cell in cells:
+                if cell not in seen:
+                    seen.add(cell)
+                    existing.append(cell)
+        self.deliveries = [(slot, fn, cells) for slot, (fn, cells) in sorted(merged.items(), key=lambda kv: kv[0])]
+
+
+class NotificationDispatcher:
+    '''
+    Delivers cell-change notifications on a background thread so that slow
+    notify functions don't add to the latency of workbook edits.
+
+    Change sets are queued in the order they are submitted and delivered in that
+    order; within a change set, notify functions are called in registration
+    order.  An exception raised by a notify function is swallowed and does not
+    affect delivery to the other functions.
+    '''
+
+    def __init__(self, max_queue_size=1024, backpressure='block'):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{backpressure}'")
+        if max_queue_size < 1:
+            raise ValueError("Queue size must be at least 1")
+
+        self.max_queue_size = max_queue_size
+        self.backpressure = backpressure
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._running = False
+        self._thread = None
+
+        self._listener_stats = dict()  # {slot : ListenerStats}
+        self.submitted_batches = 0
+        self.dropped_batches = 0
+        self.coalesced_batches = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='sheets-notify', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        if flush:
+            self.flush()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._running
+
+    def submit(self, workbook, deliveries):
+        batch = _Batch(workbook, deliveries)
+        with self._cond:
+            self.submitted_batches += 1
+            if len(self._queue) >= self.max_queue_size:
+                if self.backpressure == 'coalesce':
+                    self._queue[-1].merge(batch)
+                    self.coalesced_batches += 1
+                    return
+                elif self.backpressure == 'drop_oldest':
+                    dropped = self._queue.popleft()
+                    self.dropped_batches += 1
+                    for slot, _, _ in dropped.deliveries:
+                        self._get_stats(slot).dropped += 1
+                else:
+                    while len(self._queue) >= self.max_queue_size and self._running:
+                        self._cond.wait()
+
+            self._queue.append(batch)
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        '''
+        Waits until every submitted change set has been delivered.  Returns
+        False if the timeout expired first.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                if not self._running:
+                    # Nothing will drain the queue, so deliver on this thread.
+                    self._cond.release()
+                    try:
+                        self._drain_inline()
+                    finally:
+                        self._cond.acquire()
+                    continue
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def get_queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def get_listener_stats(self):
+        with self._cond:
+            return dict(self._listener_stats)
+
+    def _get_stats(self, slot):
+        stats = self._listener_stats.get(slot)
+        if stats is None:
+            stats = ListenerStats()
+            self._listener_stats[slot] = stats
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and self._running:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch = self._queue.popleft()
+                self._in_flight += 1
+                self._cond.notify_all()
+
+            try:
+                self._deliver(batch)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _drain_inline(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    return
+                batch = self._queue.popleft()
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        for slot, notify_function, changed_cells in batch.deliveries:
+            start = time.perf_counter()
+            raised = False
+            try:
+                notify_function(batch.workbook, changed_cells)
+            except Exception:
+                raised = True
+            end = time.perf_counter()
+            with self._cond:
+                self._get_stats(slot).record(start - batch.enqueued_at, end - start,
+                                             len(changed_cells), raised)
@@ -0,0 +1,98 @@
+from sheets.range_index import RangeIndex
+from sheets.workbook_utility import parse_cell_location_string, is_valid_location
+
+
+def parse_range_string(range_str):
+    '''
+    Parses a rectangular range like "A1:C10" (corners in either order) into
+    ((top, left), (bottom, right)) zero-indexed row/col tuples.  A single cell
+    location is treated as a 1x1 range.  Raises ValueError if a corner is
+    beyond the maximum extent (ZZZZ9999).
+    '''
+    corners = range_str.split(':')
+    if len(corners) == 1:
+        corners = corners * 2
+    if len(corners) != 2:
+        raise ValueError(f"Invalid range '{range_str}'")
+    (r1, c1), (r2, c2) = locations = [parse_cell_location_string(c.strip()) for c in corners]
+    if not all(is_valid_location(location) for location in locations):
+        raise ValueError(f"Range '{range_str}' is beyond the maximum extent")
+    return (min(r1, r2), min(c1, c2)), (max(r1, r2), max(c1, c2))
+
+
+class NotificationFilter:
+    '''
+    Restricts a notify function to changes it cares about.  A changed cell
+    matches the filter if it is on one of `sheets`, inside one of `ranges`, or
+    is one of `cells`.  Sheet names are matched case-insensitively against the
+    sheet's name at the time of the change.
+
+        sheets: iterable of sheet names
+        ranges: iterable of (sheet name, "A1:C10") tuples
+        cells:  iterable of (sheet name, "B7") tuples
+    '''
+
+    def __init__(self, sheets=None, ranges=None, cells=None):
+        self.sheets = set(s.upper() for s in (sheets or []))
+        self.ranges = [(s.upper(), parse_range_string(r)) for s, r in (ranges or [])]
+        self.cells = set((s.upper(), parse_cell_location_string(loc)) for s, loc in (cells or []))
+
+        if not (self.sheets or self.ranges or self.cells):
+            raise ValueError("A notification filter needs at least one sheet, range or cell")
+
+    def __repr__(self):
+        return f'NotificationFilter(sheets={self.sheets}, ranges={self.ranges}, cells={self.cells})'
+
+
+class NotificationRouter:
+    '''
+    Index over the filters of all registered notify functions, used to find the
+    listeners interested in each changed cell without testing every filter.
+    '''
+
+    def __init__(self):
+        self.sheet_subscribers = dict()   # {SHEET : set of slots}
+        self.cell_subscribers = dict()    # {(SHEET, (row, col)) : set of slots}
+        self.cell_sheets = set()          # sheets with at least one cell subscription
+        self.range_index = dict()         # {SHEET : RangeIndex of slots}
+        self.next_range_key = 0
+        self.filtered_slots = set()
+
+    def add(self, slot, notification_filter):
+        self.filtered_slots.add(slot)
+        for sheet in notification_filter.sheets:
+            self.sheet_subscribers.setdefault(sheet, set()).add(slot)
+        for cell in notification_filter.cells:
+            self.cell_subscribers.setdefault(cell, set()).add(slot)
+            self.cell_sheets.add(cell[0])
+        for sheet, ((top, left), (bottom, right)) in notification_filter.ranges:
+            self.range_index.setdefault(sheet, RangeIndex()).add(
+                self.next_range_key, top, left, bottom, right, slot)
+            self.next_range_key += 1
+
+    def is_filtered(self, slot):
+        return slot in self.filtered_slots
+
+    def route(self, changed_cells):
+        '''
+        Takes standardized (sheet name, "A1") tuples and returns
+        {slot : list of matching cells} for the filtered listeners, preserving
+        the order of `changed_cells`.  Listeners with no matches are omitted.
+        '''
+        routed = dict()
+        if not self.filtered_slots:
+            return routed
+
+        for cell in changed_cells:
+            sheet, location = cell
+            sheet = sheet.upper()
+            slots = set(self.sheet_subscribers.get(sheet, ()))
+            if sheet in self.cell_sheets or sheet in self.range_index:
+                loc = parse_cell_location_string(location)
+                slots.update(self.cell_subscribers.get((sheet, loc), ()))
+                index = self.range_index.get(sheet)
+                if index is not None:
+                    slots.update(index.query(loc[0], loc[1]))
+            for slot in slots:
+                routed.setdefault(slot, []).append(cell)
+        return routed
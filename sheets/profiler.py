@@ -0,0 +1,155 @@
+import contextlib
+import threading
+import time
+
+# Fields of OperationStats that hold seconds spent in one phase of an
+# operation; see Profiler.timing().
+PHASES = ('parse_time', 'graph_time', 'sort_time', 'eval_time', 'notify_time')
+
+# Returned by Workbook._timing() while profiling is disabled.
+NO_TIMING = contextlib.nullcontext()
+
+
+class OperationStats:
+    '''
+    Where the time of a workbook operation went, or the totals over every call
+    of one operation.  `eval_time` only covers the sampled cells; multiply it by
+    Profiler.sample_every for an estimate of the time spent evaluating.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0
+        self.parse_time = 0.0       # parsing formulas
+        self.graph_time = 0.0       # adding and removing dependency edges
+        self.sort_time = 0.0        # Tarjan's SCCs and the topological sort
+        self.eval_time = 0.0        # evaluating the sampled cells
+        self.notify_time = 0.0      # calling notify functions
+        self.cells_evaluated = 0
+        self.cells_sampled = 0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.total_time += other.total_time
+        for phase in PHASES:
+            setattr(self, phase, getattr(self, phase) + getattr(other, phase))
+        self.cells_evaluated += other.cells_evaluated
+        self.cells_sampled += other.cells_sampled
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return (f'OperationStats(name={self.name!r}, calls={self.calls}, '
+                f'total_time={self.total_time:.6f}, '
+                f'cells_evaluated={self.cells_evaluated})')
+
+
+class _ThreadState(threading.local):
+    # The operation a thread is in, and how deeply it is nested.
+    def __init__(self):
+        self.current = None
+        self.depth = 0
+
+
+class Profiler:
+    '''
+    Collects OperationStats for the workbook's public operations.  An operation
+    called from inside another one (e.g. new_sheet() while loading a workbook)
+    counts towards the outer one.  Every `sample_every`-th evaluated cell is
+    timed, and the times are kept per cell to find hot cells.
+
+    Operations are tracked per thread, so that a notify function running on
+    the dispatcher thread (see NotificationDispatcher) which calls back into
+    the workbook records operations of its own rather than adding to the one
+    the main thread is in.
+    '''
+
+    def __init__(self, hook=None, sample_every=1):
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self.hook = hook    # called with the OperationStats of each operation
+        self.sample_every = sample_every
+        self.operations = dict()    # {name : OperationStats totals}
+        self.cell_times = dict()    # {node : [sampled evaluations, seconds]}
+        self.countdown = sample_every
+        self._state = _ThreadState()
+        self._lock = threading.Lock()   # guards the totals across threads
+
+    @property
+    def current(self):
+        ''' The OperationStats of the calling thread's operation, or None. '''
+        return self._state.current
+
+    @contextlib.contextmanager
+    def operation(self, name):
+        state = self._state
+        state.depth += 1
+        if state.depth == 1:
+            state.current = OperationStats(name)
+            state.current.calls = 1
+            start = time.perf_counter()
+        try:
+            yield
+        finally:
+            state.depth -= 1
+            if state.depth == 0:
+                self._finish(time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def timing(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        current = self.current
+        if current is not None:
+            setattr(current, phase, getattr(current, phase) + seconds)
+
+    def should_sample(self):
+        self.countdown -= 1
+        if self.countdown:
+            return False
+        self.countdown = self.sample_every
+        return True
+
+    def record_cell(self, node, seconds):
+        with self._lock:
+            entry = self.cell_times.get(node)
+            if entry is None:
+                entry = self.cell_times[node] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+        current = self.current
+        if current is not None:
+            current.cells_sampled += 1
+            current.eval_time += seconds
+
+    def count_cells(self, num_cells):
+        current = self.current
+        if current is not None:
+            current.cells_evaluated += num_cells
+
+    def get_hot_cells(self, limit):
+        ''' Returns up to `limit` (node, evaluations, seconds), slowest first. '''
+        with self._lock:
+            ranked = sorted(self.cell_times.items(), key=lambda item: item[1][1], reverse=True)
+        return [(node, count, seconds) for node, (count, seconds) in ranked[:limit]]
+
+    def _finish(self, total_time):
+        current, self._state.current = self._state.current, None
+        current.total_time = total_time
+        with self._lock:
+            totals = self.operations.get(current.name)
+            if totals is None:
+                totals = self.operations[current.name] = OperationStats(current.name)
+            totals.add(current)
+        if self.hook is not None:
+            try:
+                self.hook(current)
+            except Exception:
+                pass
@@ -0,0 +1,68 @@
+class RangeIndex:
+    '''
+    Rectangles of (row, col) locations, each stored under a unique key with a
+    payload, answering "which rectangles contain this location?".
+
+    The index is a segment tree over the rows (which is_valid_location() bounds
+    to fewer than 2**14): a rectangle is stored in the O(log rows) tree nodes
+    whose row spans exactly cover its rows, so adding and removing one is
+    O(log rows) no matter how many cells it covers.  A point query visits the
+    log(rows) nodes on the path to its row and checks the columns of the
+    rectangles stored there.
+    '''
+
+    def __init__(self, num_rows=1 << 14):
+        self.num_rows = num_rows
+        self.tree = dict()      # {segment tree node : {key : (left, right, payload)}}
+        self.rects = dict()     # {key : (top, left, bottom, right)}
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def add(self, key, top, left, bottom, right, payload):
+        if key in self.rects:
+            raise ValueError(f"Key {key} is already in the range index")
+        self.rects[key] = (top, left, bottom, right)
+        entry = (left, right, payload)
+        for tree_node in self._cover(top, bottom):
+            self.tree.setdefault(tree_node, dict())[key] = entry
+
+    def remove(self, key):
+        top, _, bottom, _ = self.rects.pop(key)
+        for tree_node in self._cover(top, bottom):
+            entries = self.tree[tree_node]
+            del entries[key]
+            if not entries:
+                del self.tree[tree_node]
+
+    def query(self, row, col):
+        ''' Returns the payloads of all rectangles containing (row, col). '''
+        found = []
+        tree_node = row + self.num_rows
+        while tree_node >= 1:
+            entries = self.tree.get(tree_node)
+            if entries:
+                for left, right, payload in entries.values():
+                    if left <= col <= right:
+                        found.append(payload)
+            tree_node >>= 1
+        return found
+
+    def _cover(self, top, bottom):
+        # The canonical segment tree nodes covering rows top..bottom, inclusive.
+        nodes = []
+        lo = top + self.num_rows
+        hi = bottom + 1 + self.num_rows
+        while lo < hi:
+            if lo & 1:
+                nodes.append(lo)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                nodes.append(hi)
+            lo >>= 1
+            hi >>= 1
+        return nodes
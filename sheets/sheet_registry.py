@@ -0,0 +1,77 @@
+from sheets.tab_order import TabOrder
+
+
+class SheetRegistry:
+    '''
+    Assigns every sheet name the workbook sees a stable integer id, and maps ids
+    to Worksheet objects.  Names are case-insensitive.  Also keeps the tab order
+    of the existing sheets, in which sheets can be found, moved and removed in
+    O(log n).
+
+    A sheet keeps its id when it is renamed.  Names that formulas refer to but
+    that don't exist (yet) also get an id, so that references can be resolved
+    once when a formula is set; a sheet created with that name later takes the
+    id over, and a deleted sheet's id stays reserved for its name.
+    '''
+
+    def __init__(self):
+        self.ids = dict()       # {uppercase sheet name : sheet id}
+        self.sheets = dict()    # {sheet id : WS object}, existing sheets only
+        self.next_id = 0
+        self.order = TabOrder()  # sheet ids -> WS objects, in tab order
+
+    def get_id(self, sheet_name):
+        ''' Returns the id for the name, assigning a new one if necessary. '''
+        key = sheet_name.upper()
+        sheet_id = self.ids.get(key)
+        if sheet_id is None:
+            sheet_id = self.next_id
+            self.next_id += 1
+            self.ids[key] = sheet_id
+        return sheet_id
+
+    def find_sheet(self, sheet_name):
+        ''' Returns the WS object with the name, or None if there is none. '''
+        sheet_id = self.ids.get(sheet_name.upper())
+        if sheet_id is None:
+            return None
+        return self.sheets.get(sheet_id)
+
+    def get_sheet(self, sheet_id):
+        ''' Returns the WS object with the id, or None if there is none. '''
+        return self.sheets.get(sheet_id)
+
+    def add(self, worksheet):
+        ''' Adds the sheet at the end of the tab order. '''
+        worksheet.sheet_id = self.get_id(worksheet.sheet_name)
+        self.sheets[worksheet.sheet_id] = worksheet
+        self.order.append(worksheet.sheet_id, worksheet)
+
+    def remove(self, sheet_id):
+        del self.sheets[sheet_id]
+        self.order.remove(sheet_id)
+
+    def num_sheets(self):
+        return len(self.order)
+
+    def ordered_sheets(self):
+        ''' Returns the WS objects in tab order. '''
+        return list(self.order)
+
+    def index_of(self, sheet_id):
+        ''' Returns the sheet's 0-based position in the tab order. '''
+        return self.order.index_of(sheet_id)
+
+    def move(self, sheet_id, index):
+        self.order.move(sheet_id, index)
+
+    def rename(self, sheet_id, old_name, new_name):
+        '''
+        Points `new_name` at `sheet_id` and forgets `old_name`.  If `new_name`
+        had a reserved id, that id is retired and returned so that references
+        using it can be moved over; otherwise returns None.
+        '''
+        del self.ids[old_name.upper()]
+        placeholder_id = self.ids.get(new_name.upper())
+        self.ids[new_name.upper()] = sheet_id
+        return placeholder_id
@@ -0,0 +1,199 @@
+import weakref
+from sheets.range_index import RangeIndex
+from sheets.workbook_utility import pack_node
+from sheets.formula_bytecode import PUSH, CELL, RANGE, MEMO, STORE
+
+# Formulas in different cells often compute the same thing, like the
+# (Inputs!B2*Inputs!B3) of "=(Inputs!B2*Inputs!B3)+A1" in hundreds of rows.
+# Every parenthesized group and function call of a formula that refers to
+# cells (its candidates) is keyed by its shape, its compiled instructions with
+# the references left out, and by the graph nodes and resolved ranges they
+# refer to, so the same key means the same value.  Once two or more cells hold
+# a key it is shared: the first of them to be evaluated stores the value and
+# the others reuse it, until a value it reads changes.
+#
+# Every function is pure, so only the values read matter.  Those change
+# through Worksheet.value_listener, except when a sheet is added or deleted,
+# which invalidates everything.
+
+# The most instructions a candidate can have, MEMO and STORE included.
+_LARGEST_CANDIDATE = 128
+
+
+class SubexpressionStats:
+    ''' How well the shared subexpressions of a workbook are reused. '''
+
+    def __init__(self):
+        self.hits = 0           # evaluations answered from a stored value
+        self.misses = 0         # evaluations that stored a value
+        self.invalidations = 0  # stored values dropped because an input changed
+
+    def get_hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def as_dict(self):
+        stats = dict(vars(self))
+        stats['hit_rate'] = self.get_hit_rate()
+        return stats
+
+    def __repr__(self):
+        return (f'SubexpressionStats(hits={self.hits}, misses={self.misses}, '
+                f'invalidations={self.invalidations}, hit_rate={self.get_hit_rate():.3f})')
+
+
+class SharedSubexpression:
+    __slots__ = ('key', 'inputs', 'users', 'generation', 'value')
+
+    def __init__(self, key, inputs):
+        self.key = key
+        self.inputs = inputs    # graph nodes and resolved ranges, or None
+        self.users = 0          # cells holding it
+        self.generation = -1    # SubexpressionCache.generation when `value` was stored
+        self.value = None
+
+
+class SubexpressionCache:
+    def __init__(self):
+        self.stats = SubexpressionStats()
+        self.entries = dict()       # {key : SharedSubexpression}
+        # Inputs of the shared entries: {graph node : set of entries} and
+        # {sheet id : RangeIndex of the ranges}.
+        self.by_node = dict()
+        self.by_range = dict()
+        # Bumped to invalidate every stored value at once.
+        self.generation = 0
+        # Bumped whenever an input of a shared entry changes; see store().
+        self.version = 0
+        # {Formula : [(candidate node, shape, its 'cell' and 'range' nodes)]}
+        self._candidates = weakref.WeakKeyDictionary()
+
+    def shared_count(self):
+        ''' Returns the number of keys held by two or more cells. '''
+        return sum(1 for entry in self.entries.values() if entry.users > 1)
+
+    def register(self, cell):
+        '''
+        Sets cell.shared to {id(candidate node) : SharedSubexpression} for the
+        candidates of its formula, from its resolved references
+        (Cell.ref_node_map).  The cell must not hold any already.
+        '''
+        cell.shared = None
+        if cell.formula is None:
+            return
+        candidates = self._candidates.get(cell.formula)
+        if candidates is None:
+            candidates = self._candidates[cell.formula] = _find_candidates(cell.code)
+        if not candidates:
+            return
+        shared = dict()
+        ref_node_map = cell.ref_node_map
+        for node, shape, references in candidates:
+            inputs = tuple(ref_node_map.get(id(reference)) for reference in references)
+            entry = self.entries.get((shape, inputs))
+            if entry is None:
+                entry = self.entries[(shape, inputs)] = SharedSubexpression((shape, inputs), inputs)
+            entry.users += 1
+            if entry.users == 2:
+                self._index(entry)
+            shared[id(node)] = entry
+        cell.shared = shared
+
+    def release(self, cell):
+        ''' Undoes register(cell). '''
+        shared = cell.shared
+        cell.shared = None
+        if not shared:
+            return
+        for entry in shared.values():
+            entry.users -= 1
+            if entry.users == 1:
+                self._unindex(entry)
+                entry.generation = -1
+            elif entry.users == 0:
+                del self.entries[entry.key]
+
+    def lookup(self, entry):
+        ''' Returns (True, value) if `entry` has a value stored, or (False, None). '''
+        if entry.generation == self.generation:
+            self.stats.hits += 1
+            return True, entry.value
+        return False, None
+
+    def store(self, entry, value, version):
+        '''
+        Stores the value of `entry`, computed starting at `version`.  It isn't
+        kept if an input changed in the meantime.
+        '''
+        self.stats.misses += 1
+        if version == self.version:
+            entry.value = value
+            entry.generation = self.generation
+
+    def value_changed(self, sheet_id, loc):
+        ''' Invalidates the values that read the cell at `loc`. '''
+        entries = self.by_node.get(pack_node(sheet_id, loc))
+        if entries:
+            for entry in entries:
+                self._invalidate(entry)
+        index = self.by_range.get(sheet_id)
+        if index:
+            for entry in index.query(loc[0], loc[1]):
+                self._invalidate(entry)
+
+    def invalidate_all(self):
+        self.generation += 1
+        self.version += 1
+
+    def _invalidate(self, entry):
+        self.version += 1
+        if entry.generation == self.generation:
+            entry.generation = -1
+            self.stats.invalidations += 1
+
+    def _index(self, entry):
+        for i, target in enumerate(entry.inputs):
+            if target.__class__ is int:
+                self.by_node.setdefault(target, set()).add(entry)
+            elif target is not None:
+                self.by_range.setdefault(target[0], RangeIndex()).add((id(entry), i), *target[1:], entry)
+
+    def _unindex(self, entry):
+        for i, target in enumerate(entry.inputs):
+            if target.__class__ is int:
+                entries = self.by_node[target]
+                entries.discard(entry)
+                if not entries:
+                    del self.by_node[target]
+            elif target is not None:
+                index = self.by_range[target[0]]
+                index.remove((id(entry), i))
+                if not index:
+                    del self.by_range[target[0]]
+
+
+def _find_candidates(code):
+    # The parenthesized groups and function calls of the formula's compiled
+    # `code` that refer to cells: its MEMO regions, each with the shape of
+    # its instructions (see formula_bytecode) and its 'cell' and 'range'
+    # nodes.  Bigger regions are left out, so that deeply nested formulas
+    # take time linear in their size; what they compute is still shared
+    # through the regions inside them.
+    candidates = []
+    for start, instruction in enumerate(code):
+        if instruction[0] != MEMO or instruction[2] - start > _LARGEST_CANDIDATE:
+            continue
+        shape = []
+        references = []
+        for step in code[start + 1:instruction[2] - 1]:
+            opcode = step[0]
+            if opcode == CELL or opcode == RANGE:
+                shape.append(opcode)
+                references.append(step[1])
+            elif opcode == PUSH:
+                shape.append((PUSH, step[1].__class__, str(step[1])))
+            elif opcode != MEMO and opcode != STORE:
+                shape.append(step)
+        candidates.append((instruction[1], tuple(shape), tuple(references)))
+    return candidates
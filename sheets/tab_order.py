@@ -0,0 +1,152 @@
+import random
+
+
+class _TabNode:
+    __slots__ = ('key', 'value', 'priority', 'size', 'left', 'right', 'parent')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _pull(node):
+    # Recomputes `node`'s size and claims its children.
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left is not None:
+        node.left.parent = node
+    if node.right is not None:
+        node.right.parent = node
+
+
+def _split(node, k):
+    # Splits the tree into its first `k` nodes and the rest.
+    if node is None:
+        return None, None
+    if _size(node.left) >= k:
+        left, node.left = _split(node.left, k)
+        _pull(node)
+        if left is not None:
+            left.parent = None
+        node.parent = None
+        return left, node
+    node.right, right = _split(node.right, k - _size(node.left) - 1)
+    _pull(node)
+    if right is not None:
+        right.parent = None
+    node.parent = None
+    return node, right
+
+
+def _merge(a, b):
+    # Concatenates two trees, `a` first.
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        _pull(a)
+        return a
+    b.left = _merge(a, b.left)
+    _pull(b)
+    return b
+
+
+class TabOrder:
+    '''
+    Ordered sequence of (key, value) pairs, kept in an implicit treap (a
+    randomized balanced tree ordered by position, with subtree sizes).  Looking
+    a pair up by key is O(1); appending, removing, moving and position queries
+    are O(log n) expected.  Keys must be unique.
+    '''
+
+    def __init__(self):
+        self.root = None
+        self.nodes = dict()     # {key : _TabNode}
+
+    def __len__(self):
+        return _size(self.root)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def __iter__(self):
+        # In-order traversal of the values.
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.value
+            node = node.right
+
+    def append(self, key, value):
+        self.insert(len(self), key, value)
+
+    def insert(self, index, key, value):
+        if key in self.nodes:
+            raise ValueError(f"Key {key} is already in the tab order")
+        if not 0 <= index <= len(self):
+            raise IndexError(f"Index {index} out of range")
+        node = _TabNode(key, value)
+        self.nodes[key] = node
+        left, right = _split(self.root, index)
+        self.root = _merge(_merge(left, node), right)
+        self.root.parent = None
+
+    def remove(self, key):
+        ''' Removes the pair with the key, returning its value. '''
+        index = self.index_of(key)
+        left, rest = _split(self.root, index)
+        node, right = _split(rest, 1)
+        self.root = _merge(left, right)
+        if self.root is not None:
+            self.root.parent = None
+        del self.nodes[key]
+        return node.value
+
+    def move(self, key, index):
+        '''
+        Moves the pair with the key so that it ends up at `index`, as if it were
+        removed and then re-inserted there.
+        '''
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range")
+        value = self.remove(key)
+        self.insert(index, key, value)
+
+    def index_of(self, key):
+        ''' Returns the position of the pair with the key. '''
+        node = self.nodes[key]
+        index = _size(node.left)
+        while node.parent is not None:
+            if node is node.parent.right:
+                index += _size(node.parent.left) + 1
+            node = node.parent
+        return index
+
+    def get(self, index):
+        ''' Returns the value at `index`. '''
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range")
+        node = self.root
+        while True:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.value
+            else:
+                index -= left_size + 1
+                node = node.right
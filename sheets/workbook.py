@@ -1,119 +1,277 @@
+import functools
 import re
 import string
-from typing import Callable, Iterable, List, Optional, TextIO, Tuple, Any
+import time
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple, Any
 
-from lark import Token
 from sheets.cell_error_type import CellErrorType, CellError
 from sheets.worksheet import Worksheet
 from sheets.graph import Graph
 from sheets.cell import Cell
 from sheets.formula_evaluator import FormulaEvaluator
-from sheets.formula_renamer import FormulaRenamer
-from sheets.formula_constructer import FormulaReconstructor
-from sheets.graph import Graph
-from sheets.workbook_utility import parse_cell_location_string, index_to_cell_location, is_valid_location
+from sheets.formula_parser import iter_references
+from sheets.functions import RangeArgument, IncrementalAggregate, INCREMENTAL_FUNCTIONS
+from sheets.formula_renamer import rename_sheet_in_cell
+from sheets.notification_dispatcher import NotificationDispatcher, ListenerStats
+from sheets.notification_filter import NotificationFilter, NotificationRouter
+from sheets.profiler import Profiler, OperationStats, NO_TIMING
+from sheets.sheet_registry import SheetRegistry
+from sheets.subexpression_cache import SubexpressionCache
+from sheets.workbook_utility import parse_cell_location_string, index_to_cell_location, is_valid_location, \
+    pack_node, unpack_node, node_sheet_id
 import decimal
 import json
 
+# How formula values are kept up to date:
+#   'eager' - every edit recalculates all affected cells before returning
+#   'lazy'  - edits only mark affected cells dirty; a dirty cell is computed
+#             (along with the dirty cells it depends on) when its value is read
+EVAL_MODES = ('eager', 'lazy')
+
+
+def _profiled(method):
+    # Records the method as an operation while profiling is enabled.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        with self.profiler.operation(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Workbook:
     # A workbook containing zero or more named spreadsheets.
     #
     # Any and all operations on a workbook that may affect calculated cell
     # values should cause the workbook's contents to be updated properly.
 
-    def __init__(self):
+    def __init__(self, eval_mode: str = 'eager'):
         # Initialize a new empty workbook.
-        self.worksheet_order = list()   # ordered list of WS objects
-        self.sheet_to_tab = dict() # {uppercase sheet name : index of tab order}
+        #
+        # In 'lazy' mode, formula values are only computed when they are read
+        # with get_cell_value() (or when recalculate() is called):
+        #
+        # - Cells that are part of a cycle evaluate to #CIRCREF!, and cells that
+        #   depend on them propagate the error, exactly as in 'eager' mode.
+        #
+        # - Setting a cell to a literal notifies that cell immediately, as in
+        #   'eager' mode.  A formula cell is notified when it is recomputed and
+        #   its value differs from the last computed value, i.e. from within
+        #   the get_cell_value() or recalculate() call that computed it.
+        #
+        # If eval_mode is not one of EVAL_MODES, a ValueError is raised.
+        if eval_mode not in EVAL_MODES:
+            raise ValueError(f"Unknown evaluation mode '{eval_mode}'")
+        self.eval_mode = eval_mode
+        self.dirty = set()  # lazy mode: graph nodes whose value is stale
+        # Lazy mode: the dirty nodes to recompute whatever their precedents
+        # turn out to be; the rest of self.dirty only needs recomputing if a
+        # precedent's value changes (see _evaluate_nodes()).
+        self.dirty_sources = set()
+        # {node : frozenset of its SCC} for the cells holding #CIRCREF! because
+        # they are on a cycle.  Members of an SCC share one frozenset.
+        self.circular = dict()
+        # Nodes of blank cells that formulas referred to before their sheet
+        # existed.  Other referenced blank cells are written as the empty cell
+        # they stand for, which the extent doesn't count until it has a value;
+        # these are written like cells nothing referred to.
+        self.blanks_before_sheet = set()
+
+        # Graph nodes are (sheet id, row, col) packed into an int by pack_node;
+        # sheet names are only resolved to ids at the API boundary.  The
+        # registry also keeps the tab order of the sheets.
+        self.sheet_registry = SheetRegistry()
 
-        self.graph = Graph()
+        # {sheet id : set of nodes whose formula names that sheet explicitly}
+        self.sheet_references = dict()
+
+        # Nodes grouped by sheet id; range references are indexed per sheet.
+        self.graph = Graph(group_of=node_sheet_id, locate=unpack_node)
         self.notify_functions = []  # all registered functions (order matters)
+        self.notification_router = NotificationRouter()  # filters of registered functions
+        self.notification_dispatcher = None  # set while async notifications are enabled
+        self.profiler = None    # set while profiling is enabled
+        self.profile = None     # the most recent Profiler, kept for stats()
+        # Values of subexpressions that several formulas compute.
+        self.subexpressions = SubexpressionCache()
+
+    @property
+    def worksheet_order(self) -> List[Worksheet]:
+        # The WS objects in tab order, as a new list.
+        return self.sheet_registry.ordered_sheets()
 
     def num_sheets(self) -> int:
-        return len(self.worksheet_order)
+        return self.sheet_registry.num_sheets()
 
     def list_sheets(self) -> List[str]:
-        return [s.sheet_name for s in self.worksheet_order]
+        return [s.sheet_name for s in self.sheet_registry.ordered_sheets()]
 
+    @_profiled
     def new_sheet(self, sheet_name: Optional[str] = None) -> Tuple[int, str]:
         if sheet_name is None:
             sheet_name = self._gen_new_sheetname()
         
         self._validate_sheet_name(sheet_name)
         
-        self.sheet_to_tab[sheet_name.upper()] = len(self.worksheet_order)
-        self.worksheet_order.append(Worksheet(sheet_name))
-        self._evaluate()
-        return (self.sheet_to_tab[sheet_name.upper()], sheet_name)
+        sheet_object = self._add_sheet(sheet_name)
+        # The new sheet is empty, so only formulas that referred to it before
+        # it existed can change.
+        self._evaluate_affected(list(self.sheet_references.get(sheet_object.sheet_id, ())))
+        return (self.sheet_registry.index_of(sheet_object.sheet_id), sheet_name)
 
+    @_profiled
     def del_sheet(self, sheet_name: str) -> None:
-        if sheet_name.upper() not in self.sheet_to_tab:
+        if not self._get_sheet_exists(sheet_name):
             raise KeyError(f"Sheet '{sheet_name}' not found")
         
-        # delete all nodes in sheet from graph
+        # Drop the sheet's formulas from the graph.  Its cells that formulas on
+        # other sheets refer to keep their nodes, just like references to a
+        # sheet that never existed, so the id stays reserved for the name and
+        # those formulas pick it up again if the sheet is re-created.
         sheet_object = self._get_sheet(sheet_name)
-        self.graph.clear_refs_criterion(lambda node_tuple: node_tuple[0].upper() == sheet_object.sheet_name.upper())
-
-        # update sheet_to_tab to represent post-deletion indexes
-        sheet_ind = self.sheet_to_tab[sheet_name.upper()]
-        for i in range(sheet_ind + 1, len(self.worksheet_order)):
-            self.sheet_to_tab[
-                self.worksheet_order[i].sheet_name.upper()
-            ] -= 1
-
-        del self.worksheet_order[sheet_ind]
-        del self.sheet_to_tab[sheet_name.upper()]
+        sheet_id = sheet_object.sheet_id
+        sheet_nodes = self.graph.get_group(sheet_id)
+        with self._timing('graph_time'):
+            for node in sheet_nodes:
+                self.graph.clear_refs(node)
+            self.graph.remove_nodes([node for node in sheet_nodes if not self.graph.get_children(node)])
+        self.dirty.difference_update(sheet_nodes)
+        self.dirty_sources.difference_update(sheet_nodes)
+        self.blanks_before_sheet.difference_update(sheet_nodes)
+        for node in sheet_nodes:
+            self.circular.pop(node, None)
+        released = []
+        for loc, cell in sheet_object.cell_map.items():
+            self._unindex_sheet_references(cell, pack_node(sheet_id, loc))
+            self.subexpressions.release(cell)
+            released.extend(cell.ref_nodes)
+        self.sheet_registry.remove(sheet_id)
+        self.subexpressions.invalidate_all()
+        self._collect(released)
 
-        self._evaluate()
+        # Only formulas on other sheets that referred to this one change; they
+        # become #REF! errors.  The sheet's values vanish without being
+        # reported to the incremental aggregates, so their state is dropped.
+        referencers = list(self.sheet_references.get(sheet_id, ()))
+        for node in referencers:
+            c = self._get_cell_by_node(node)
+            if c is not None and c.aggregate is not None:
+                c.aggregate.valid = False
+        self._evaluate_affected(referencers)
 
     def get_sheet_extent(self, sheet_name: str) -> Tuple[int, int]:
         sheet_object = self._get_sheet(sheet_name)
         return sheet_object.get_extent()
 
+    @_profiled
     def set_cell_contents(self, sheet_name: str, location: str,
                           contents: Optional[str] = None) -> None:
         sheet_object = self._get_sheet(sheet_name)
-        curr_sheet_name = sheet_object.sheet_name
         curr_loc = parse_cell_location_string(location) # curr_loc = (row, col)
-        curr_cell_node = (curr_sheet_name.upper(), curr_loc)
+        curr_cell_node = pack_node(sheet_object.sheet_id, curr_loc)
         cell_exists = sheet_object.get_cell_exist(curr_loc)
+        if (not cell_exists and self.graph.is_in_graph(curr_cell_node) and
+                curr_cell_node not in self.blanks_before_sheet):
+            # A blank cell that formulas refer to has no Cell of its own (see
+            # _update_cell_dependencies()).  It is written as the empty cell it
+            # stands for, which the extent doesn't count until it has a value.
+            sheet_object.add_cell(curr_loc, Cell(None, curr_loc), is_implicit=True)
+            cell_exists = True
+        self.blanks_before_sheet.discard(curr_cell_node)
         all_cells_changed = []
+        # What the cell stops referring to, and the cell itself, may be left
+        # with nothing referring to them; see _collect().
+        released = [curr_cell_node]
 
         if cell_exists:
             # Remove the existent cell's edges since they'll be recreated later.
             new_cell = sheet_object.get_cell(curr_loc)
             old_value = new_cell.value
-            sheet_object.update_cell(curr_loc, new_cell, contents)
-            self.graph.clear_refs(curr_cell_node)
+            released.extend(new_cell.ref_nodes)
+            self._unindex_sheet_references(new_cell, curr_cell_node)
+            self.subexpressions.release(new_cell)
+            with self._timing('parse_time'):
+                sheet_object.update_cell(curr_loc, new_cell, contents)
+            with self._timing('graph_time'):
+                self.graph.clear_refs(curr_cell_node)
             
             if not new_cell.is_formula():
                 if new_cell.value != old_value:
-                    all_cells_changed.append((sheet_name, location))         
+                    all_cells_changed.append(curr_cell_node)
         else:
-            new_cell = Cell(contents, curr_loc)
+            with self._timing('parse_time'):
+                new_cell = Cell(contents, curr_loc)
             sheet_object.add_cell(curr_loc, new_cell)
             self.graph.add_node(curr_cell_node)
 
             if not new_cell.is_formula():
-                all_cells_changed.append((sheet_name, location))
+                all_cells_changed.append(curr_cell_node)
 
-        self._update_cell_dependencies(new_cell, sheet_name, curr_cell_node)
-        self._detect_cycle_and_propagate(curr_cell_node)
+        with self._timing('graph_time'):
+            self._update_cell_dependencies(new_cell, curr_cell_node)
+        if self.eval_mode == 'lazy':
+            self._notify(all_cells_changed)
+            self.dirty.update(self.graph.get_reachable(curr_cell_node))
+            self.dirty_sources.add(curr_cell_node)
+            self._collect(released)
+            return
+
+        # Only what the cell reaches can change, including whether cells are
+        # on a cycle: the edit changed the edges into this cell alone, so a
+        # cycle it made or broke runs through it.
+        order, cycles = self.graph.analyze(self.graph.get_reachable(curr_cell_node))
+        cycle_changed = self._mark_cycle(cycles.get(curr_cell_node, ()))
+        if cycle_changed:
+            self._notify(cycle_changed)
         self._notify(all_cells_changed)
-        self._evaluate()
-        
+        self._evaluate_nodes(order, cycles, (curr_cell_node,))
+        self._collect(released)
+
     def get_cell_contents(self, sheet_name: str, location: str) -> Optional[str]:
         cell = self._get_cell(sheet_name, location)
         if cell == None:
             return None
         return cell.content
 
+    @_profiled
     def get_cell_value(self, sheet_name: str, location: str) -> Any:
-        cell = self._get_cell(sheet_name, location)
+        sheet_object = self._get_sheet(sheet_name)
+        location_tuple = parse_cell_location_string(location)
+        cell = sheet_object.get_cell(location_tuple)
         if cell == None:
             return None
+        if self.dirty:
+            node = pack_node(sheet_object.sheet_id, location_tuple)
+            if node in self.dirty:
+                self._evaluate_on_demand(node)
         return cell.value
-    
+
+    @_profiled
+    def recalculate(self) -> None:
+        # Compute every stale cell value now.  Only has an effect in 'lazy'
+        # mode, where it emits the notifications for all cells whose values
+        # changed since they were last computed.
+        if not self.dirty:
+            return
+        order, cycles = self.graph.analyze(self.dirty)
+        sources = self.dirty_sources
+        self.dirty = set()
+        self.dirty_sources = set()
+        self._evaluate_nodes(order, cycles, sources)
+
+    @_profiled
+    def compact(self) -> int:
+        # Reclaims every empty cell and graph node that nothing refers to.
+        # Edits reclaim what they leave behind as they go, so this is only an
+        # explicit sweep of the whole workbook, e.g. before measuring memory.
+        # Returns the number of cells and nodes reclaimed (a cell and its node
+        # count once).
+        nodes = self.graph.get_all_nodes()
+        for sheet_object in self.sheet_registry.ordered_sheets():
+            nodes.extend(pack_node(sheet_object.sheet_id, loc) for loc in sheet_object.cell_map)
+        return self._collect(nodes)
+
     
     @staticmethod
     def load_workbook(fp: TextIO):
@@ -164,6 +322,7 @@ class Workbook:
                 wb.set_cell_contents(sn, cell_location, cell_contents)
         return wb
 
+    @_profiled
     def save_workbook(self, fp: TextIO) -> None:
         # Instance method (not a static/class method) to save a workbook to a
         # text file or file-like object in JSON format.  Note that the _caller_
@@ -175,7 +334,7 @@ class Workbook:
         
         # Serialize the workbook to a JSON string.
         sheets = list()
-        for ws in self.worksheet_order:
+        for ws in self.sheet_registry.ordered_sheets():
             ws_dict = {
                 "name": ws.sheet_name,
                 "cell-contents": ws.serialize()
@@ -189,22 +348,23 @@ class Workbook:
     def _gen_new_sheetname_based_on_original(self, original_name: str) -> str:
         i = 1
         new_name = f"{original_name}_{i}"
-        while new_name.upper() in self.sheet_to_tab:
+        while self._get_sheet_exists(new_name):
             i += 1
             new_name = f"{original_name}_{i}"
         return new_name
 
     def _standardize_changed_cells_for_notifs(self, changed_cells):
-        for i, (sheet_name, location) in enumerate(changed_cells):
-            original_sheetname = self._get_original_sheetname(sheet_name)
-            if type(location) == tuple:
-                row, col = location
-                location = index_to_cell_location(row, col)
-            changed_cells[i] = (original_sheetname, location.upper())
-        return changed_cells
+        # pack_node(0, (0, 0)) -> ("Sheet1", "A1")
+        standardized = []
+        for node in changed_cells:
+            sheet_id, (row, col) = unpack_node(node)
+            standardized.append((self.sheet_registry.get_sheet(sheet_id).sheet_name,
+                                 index_to_cell_location(row, col)))
+        return standardized
     
     def notify_cells_changed(self,
-            notify_function: Callable[["Workbook", Iterable[Tuple[str, str]]], None]) -> None:
+            notify_function: Callable[["Workbook", Iterable[Tuple[str, str]]], None],
+            cell_filter: Optional[NotificationFilter] = None) -> None:
         # Request that all changes to cell values in the workbook are reported
         # to the specified notify_function.  The values passed to the notify
         # function are the workbook, and an iterable of 2-tuples of strings,
@@ -224,8 +384,124 @@ class Workbook:
         # A notification function is expected to not mutate the workbook or
         # iterable that it is passed to it.  If a notification function violates
         # this requirement, the behavior is undefined.
+        #
+        # If cell_filter is given, the notify_function is only called when at
+        # least one changed cell matches the filter, and it only receives the
+        # matching cells.
+        if cell_filter is not None:
+            self.notification_router.add(len(self.notify_functions), cell_filter)
         self.notify_functions.append(notify_function)
     
+    def enable_async_notifications(self, max_queue_size: int = 1024,
+            backpressure: str = 'block') -> NotificationDispatcher:
+        # Deliver notifications on a background thread instead of inline
+        # inside the call that changed the cells.  Change sets are put on a
+        # queue holding at most max_queue_size batches; when it is full,
+        # `backpressure` decides what happens:
+        #   'block'       - the editing call waits until there is room
+        #   'drop_oldest' - the oldest undelivered batch is discarded
+        #   'coalesce'    - the change set is merged into the newest batch
+        #
+        # Delivery order and exception isolation are the same as for inline
+        # notifications.  Notify functions see the workbook as it is when they
+        # run, which may be after later edits have been made.
+        #
+        # If async notifications are already enabled, a ValueError is raised.
+        # If backpressure is not one of the above, a ValueError is raised.
+        if self.notification_dispatcher is not None:
+            raise ValueError("Async notifications are already enabled")
+        dispatcher = NotificationDispatcher(max_queue_size, backpressure)
+        dispatcher.start()
+        self.notification_dispatcher = dispatcher
+        return dispatcher
+
+    def disable_async_notifications(self) -> None:
+        # Deliver every pending notification, stop the background thread and
+        # return to inline notifications.  Does nothing if async notifications
+        # are not enabled.
+        dispatcher = self.notification_dispatcher
+        if dispatcher is None:
+            return
+        self.notification_dispatcher = None
+        dispatcher.stop(flush=True)
+
+    def flush_notifications(self, timeout: Optional[float] = None) -> bool:
+        # Wait until every pending notification has been delivered.  Returns
+        # False if the timeout (in seconds) expired first.  With inline
+        # notifications there is never anything pending, so this returns True.
+        if self.notification_dispatcher is None:
+            return True
+        return self.notification_dispatcher.flush(timeout)
+
+    def get_subexpression_stats(self) -> Dict[str, Any]:
+        # How often formulas reused the value of a subexpression that another
+        # formula computed (the same parenthesized group or function call over
+        # the same cells), as a dict with 'hits', 'misses', 'invalidations',
+        # 'hit_rate' and 'shared', the number of subexpressions currently
+        # shared by two or more cells.
+        stats = self.subexpressions.stats.as_dict()
+        stats['shared'] = self.subexpressions.shared_count()
+        return stats
+
+    def get_notification_stats(self) -> Dict[int, ListenerStats]:
+        # Per-listener delivery metrics for async notifications, keyed by the
+        # 0-based registration index of the notify function.
+        if self.notification_dispatcher is None:
+            return {}
+        return self.notification_dispatcher.get_listener_stats()
+
+    def enable_profiling(self,
+            hook: Optional[Callable[[OperationStats], None]] = None,
+            sample_every: int = 1) -> None:
+        # Start recording where the time of each workbook operation goes (see
+        # OperationStats): parsing, dependency graph updates, the SCC and
+        # topological sort, cell evaluation and notifications.  Operations
+        # called by other operations count towards the outer one.
+        #
+        # If hook is given, it is called with the OperationStats of every
+        # operation when it finishes; exceptions it raises are ignored.  Only
+        # every sample_every-th evaluated cell is timed, to keep the overhead
+        # down on large recalculations.
+        #
+        # Enabling profiling again starts over with new statistics.  While
+        # profiling is disabled (the default), operations only pay for a
+        # check of self.profiler.
+        profiler = Profiler(hook, sample_every)
+        self.profiler = self.profile = profiler
+        self.graph.on_update = functools.partial(profiler.add_time, 'sort_time')
+
+    def disable_profiling(self) -> None:
+        # Stop recording.  The statistics collected so far remain available
+        # from stats().
+        self.profiler = None
+        self.graph.on_update = None
+
+    def stats(self, hot_cells: int = 10) -> Dict[str, Any]:
+        # Statistics of the most recent profiling session, as plain data:
+        #
+        #   'operations' - {operation name : OperationStats.as_dict()}, the
+        #                  totals over every call of that operation
+        #   'hot_cells'  - the `hot_cells` cells with the most sampled
+        #                  evaluation time, slowest first, as dicts with
+        #                  'sheet', 'location', 'evaluations' and 'time'
+        #   'sample_every' - see enable_profiling()
+        #
+        # Before profiling has been enabled, both are empty.
+        if self.profile is None:
+            return {'operations': {}, 'hot_cells': [], 'sample_every': 1}
+        hot = []
+        for node, evaluations, seconds in self.profile.get_hot_cells(hot_cells):
+            sheet_id, (row, col) = unpack_node(node)
+            sheet_object = self.sheet_registry.get_sheet(sheet_id)
+            hot.append({'sheet': sheet_object.sheet_name if sheet_object is not None else None,
+                        'location': index_to_cell_location(row, col),
+                        'evaluations': evaluations,
+                        'time': seconds})
+        return {'operations': {name: totals.as_dict() for name, totals in self.profile.operations.items()},
+                'hot_cells': hot,
+                'sample_every': self.profile.sample_every}
+
+    @_profiled
     def move_sheet(self, sheet_name: str, index: int) -> None:
         # Move the specified sheet to the specified index in the workbook's
         # ordered sequence of sheets. The index can range from 0 to
@@ -244,13 +520,9 @@ class Workbook:
         if index < 0 or index >= self.num_sheets():
             raise IndexError(f"Index '{index}' not in bounds of workbook")
 
-        original_index = self.sheet_to_tab[sheet_name.upper()]
-        sheet = self.worksheet_order.pop(original_index)
-        self.worksheet_order.insert(index, sheet)
-
-        for i, sheet in enumerate(self.worksheet_order):
-            self.sheet_to_tab[sheet.sheet_name.upper()] = i
+        self.sheet_registry.move(self._get_sheet(sheet_name).sheet_id, index)
 
+    @_profiled
     def copy_sheet(self, sheet_name: str) -> Tuple[int, str]:
         # Make a copy of the specified sheet, storing the copy at the end of the
         # workbook's sequence of sheets.  The copy's name is generated by
@@ -276,14 +548,38 @@ class Workbook:
 
         # 1. Create a new sheet with a unique name
         copied_sheet_name = self._gen_new_sheetname_based_on_original(original_name)
-        idx, _ = self.new_sheet(copied_sheet_name)
+        copied_sheet_obj = self._add_sheet(copied_sheet_name)
+        copied_sheet_id = copied_sheet_obj.sheet_id
+
+        # 2. Clone the cells (parse trees included) and add all of their edges
+        # at once.  Unqualified references move over to the copy.
+        copied_sheet_obj.copy_cells_from(original_sheet_obj)
+        copied_nodes = []
+        edges = []
+        all_cells_changed = []
+        with self._timing('graph_time'):
+            for location_tup, cell_obj in copied_sheet_obj.cell_map.items():
+                node = pack_node(copied_sheet_id, location_tup)
+                copied_nodes.append(node)
+                self._copy_cell_dependencies(cell_obj, node, edges)
+                if not cell_obj.is_formula() and cell_obj.value is not None:
+                    all_cells_changed.append(node)
+            self.graph.add_edges(copied_nodes, edges)
+            self._copy_blank_cells(original_sheet_obj, copied_sheet_obj)
+
+        # 3. Compute the copy's formulas, along with everything that referred
+        # to the copy's name before it existed, and notify about it all at once.
+        affected = copied_nodes + list(self.sheet_references.get(copied_sheet_id, ()))
+        if self.eval_mode == 'lazy':
+            self._notify(all_cells_changed)
+            self._evaluate_affected(affected)
+            return self.sheet_registry.index_of(copied_sheet_id), copied_sheet_name
 
-        # 2. Iterate through old sheet and set new cells and their contents        
-        for location_tup in original_sheet_obj.cell_map: #not using k,v iteration because weird behavior with the k already being a tuple, which unpacks weirdly during iteration.
-            cell_obj = original_sheet_obj.cell_map[location_tup]
-            self.set_cell_contents(copied_sheet_name, index_to_cell_location(location_tup[0], location_tup[1]), cell_obj.content)
-        return idx, copied_sheet_name
+        all_cells_changed.extend(self._evaluate_affected(affected, notify=False, mark_cycles=True))
+        self._notify(all_cells_changed)
+        return self.sheet_registry.index_of(copied_sheet_id), copied_sheet_name
     
+    @_profiled
     def rename_sheet(self, sheet_name: str, new_sheet_name: str) -> None:
         # Rename the specified sheet to the new sheet name.  Additionally, all
         # cell formulas that referenced the original sheet name are updated to
@@ -300,182 +596,585 @@ class Workbook:
         #
         # If the new_sheet_name is an empty string or is otherwise invalid, a
         # ValueError is raised.
-        renamed_sheet_obj = self._rename_sheet(sheet_name, new_sheet_name)
-        
-        # update cell loc tups
-        for loc, cell in renamed_sheet_obj.cell_map.items():
-            # rename cell
-            cell.loc = (new_sheet_name, loc)
-
-        # Change graph
-        for cell_sheet_name, cell_loc in self.graph.get_all_nodes():
-            if cell_sheet_name.upper() == sheet_name.upper():
-                curr_cell_node = (cell_sheet_name.upper(), cell_loc)
-                self.graph.rename_cell(curr_cell_node, (new_sheet_name.upper(), cell_loc))
-        
-        # Change formulas
-        renamer = FormulaRenamer(sheet_name, new_sheet_name)
-        for sheet_obj in self.worksheet_order:
-            for loc, cell in sheet_obj.cell_map.items():
-                if cell.is_formula() and self._sheet_name_in_cell_ref(sheet_name, cell.get_refs()):
-                    new_tree = renamer.transform(cell.tree)
-                    new_content = FormulaReconstructor().reconstruct_formula(new_tree)
-                    cell.update(new_content)
-        
-        # Update cell dependencies if needed and detect cycles and propagate
-        for cell_sheet_name, cell_loc in self.graph.get_all_nodes():
-            # if cell belongs to the renamed sheet
-            if cell_sheet_name.upper() == new_sheet_name.upper():   
-                curr_cell_node = (cell_sheet_name.upper(), cell_loc)
-                cell = self._get_cell_loc_tup(cell_sheet_name, cell_loc)
-                # If the cell is not part of the renamed sheet, then it was implicitly referenced by another cell
-                # And now that it's part of the renamed sheet, it needs to be updated in the sheet object.
-                if not cell:
-                    sheet_object = self._get_sheet(new_sheet_name.upper())
-                    sheet_object.add_cell(cell_loc, Cell(None, cell_loc), is_implicit=True)
-                    cell = self._get_cell_loc_tup(cell_sheet_name, cell_loc)
-
-                # Update cell dependencies
-                self._update_cell_dependencies(cell, cell_sheet_name, curr_cell_node)
-                self._detect_cycle_and_propagate(curr_cell_node)
-        self._evaluate()
-
-
-    def _update_cell_dependencies(self, new_cell, sheet_name, curr_cell_node):
-        children = new_cell.refs    # empty if not a formula
-        for child_loc in children:
-            (child_sheet, child_loc_str) = child_loc if len(child_loc) == 2 else (sheet_name, child_loc[0])
-            child_loc = parse_cell_location_string(child_loc_str)
-            self.graph.add_edge((child_sheet.upper(), child_loc), curr_cell_node)
-
-    def _sheet_name_in_cell_ref(self, sheet_name, cell_ref):
-        for ref in cell_ref:
-            (cell_sheet_name, loc_str) = ref if len(ref) == 2 else (sheet_name, ref[0])
-            if sheet_name.upper() == cell_sheet_name.upper() or f"'{sheet_name.upper()}'" == cell_sheet_name.upper():
-                return True
-        return False
-            
-    def _evaluate(self):
-        topo_sort = self.graph.get_topo_sort()
-        all_cells_changed = []
-        for (cell_sheet_name, cell_loc) in topo_sort:
-            # If referring to a cell in a sheet that DNE, skip evaluation
-            # because that invalid cell object wouldn't have even been created.
-            if not self._get_sheet_exists(cell_sheet_name) or not is_valid_location(cell_loc):
+        if not self._get_sheet_exists(sheet_name):
+            raise KeyError(f"Sheet '{sheet_name}' not found")
+        self._validate_sheet_name(new_sheet_name)
+
+        sheet_obj = self._get_sheet(sheet_name)
+        old_sheet_name = sheet_obj.sheet_name
+        sheet_id = sheet_obj.sheet_id
+
+        sheet_obj.sheet_name = new_sheet_name
+
+        # The graph is keyed on sheet ids, so it doesn't change; only the names
+        # that map to the id do.
+        placeholder_id = self.sheet_registry.rename(sheet_id, old_sheet_name, new_sheet_name)
+
+        # Rewrite only the formulas that mention the sheet.  Their references
+        # keep pointing at the same nodes, so their values don't change.
+        renamed = dict()
+        for node in self.sheet_references.get(sheet_id, ()):
+            cell = self._get_cell_by_node(node)
+            aggregate = cell.aggregate
+            rename_sheet_in_cell(cell, old_sheet_name, new_sheet_name, renamed)
+            self._map_ref_nodes(cell)
+            cell.aggregate = aggregate
+
+        if placeholder_id is None:
+            return
+
+        # Formulas that referred to the new name before it existed now refer
+        # to this sheet, so they need their edges rebuilt and recalculating.
+        referencing_nodes = self.sheet_references.pop(placeholder_id, set())
+        for node in referencing_nodes:
+            cell = self._get_cell_by_node(node)
+            self.graph.clear_refs(node)
+            self._update_cell_dependencies(cell, node)
+        self.graph.remove_nodes(self.graph.get_group(placeholder_id))
+
+        self._evaluate_affected(referencing_nodes, mark_cycles=True)
+
+    def _update_cell_dependencies(self, new_cell, curr_cell_node):
+        # Resolves the cell's references to graph nodes once, so that nothing
+        # downstream has to look sheet names up again.
+        sheet_id = node_sheet_id(curr_cell_node)
+        new_cell.ref_nodes = []
+        for ref in new_cell.refs:   # empty if not a formula
+            ref_sheet_id = self._ref_sheet_id(ref, sheet_id)
+            ref_loc = parse_cell_location_string(ref[-1])
+            # References beyond the maximum extent can never be set, so they
+            # don't need a node; they evaluate to #REF!.
+            child_node = pack_node(ref_sheet_id, ref_loc) if is_valid_location(ref_loc) else None
+            new_cell.ref_nodes.append(child_node)
+            # A blank cell only gets a node: it reads as None, and its edges
+            # are all that is needed to recompute this cell once it is set.
+            if child_node is not None:
+                self.graph.add_edge(child_node, curr_cell_node)
+                if self.blanks_before_sheet:
+                    self.blanks_before_sheet.discard(child_node)
+            if len(ref) == 2:
+                self.sheet_references.setdefault(ref_sheet_id, set()).add(curr_cell_node)
+
+        # A range is a single entry in the graph's range index, however many
+        # cells it covers.
+        new_cell.range_nodes = []
+        for range_ref in new_cell.range_refs:
+            # The sheet of ('A1', 'B2') or ('SHEET1', 'A1', 'B2') is found like
+            # that of the reference to its start corner.
+            ref_sheet_id = self._ref_sheet_id(range_ref[:-1], sheet_id)
+            target = self._resolve_range(ref_sheet_id, range_ref[-2], range_ref[-1])
+            new_cell.range_nodes.append(target)
+            if target is not None:
+                self.graph.add_range_edge(*target, curr_cell_node)
+            if len(range_ref) == 3:
+                self.sheet_references.setdefault(ref_sheet_id, set()).add(curr_cell_node)
+
+        self._map_ref_nodes(new_cell)
+
+    def _collect(self, nodes):
+        # Reclaims those of `nodes` that nothing refers to any more and that
+        # refer to nothing, along with their cells, which must be empty (see
+        # Worksheet.discard_empty_cell()).  Returns how many were reclaimed.
+        orphans = []
+        reclaimed = 0
+        for node in set(nodes):
+            if node is None or not self.graph.is_orphan(node):
+                continue
+            sheet_id, loc = unpack_node(node)
+            sheet_object = self.sheet_registry.get_sheet(sheet_id)
+            if sheet_object is not None and loc in sheet_object.cell_map:
+                if not sheet_object.discard_empty_cell(loc):
+                    continue
+            elif not self.graph.is_in_graph(node):
                 continue
+            orphans.append(node)
+            reclaimed += 1
+        if orphans:
+            # An edited cell that is dropped before lazy evaluation gets to it
+            # leaves its dependents (through ranges) as the edit's sources.
+            for node in self.dirty_sources.intersection(orphans):
+                self.dirty_sources.update(self.graph.get_children(node))
+            self.graph.remove_nodes(orphans)
+            self.dirty.difference_update(orphans)
+            self.dirty_sources.difference_update(orphans)
+            self.blanks_before_sheet.difference_update(orphans)
+        return reclaimed
+
+    def _resolve_range(self, sheet_id, start, end):
+        # Returns (sheet id, top, left, bottom, right), or None if a corner is
+        # beyond the maximum extent.
+        (r1, c1), (r2, c2) = parse_cell_location_string(start), parse_cell_location_string(end)
+        if not (is_valid_location((r1, c1)) and is_valid_location((r2, c2))):
+            return None
+        return sheet_id, min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2)
+
+    def _copy_cell_dependencies(self, new_cell, curr_cell_node, edges):
+        # Like _update_cell_dependencies(), for a cell cloned from another
+        # sheet: its resolved references are reused rather than looked up
+        # again, except that unqualified ones now point into the copy.  Edges
+        # are appended to `edges` for the caller to add.
+        sheet_id = node_sheet_id(curr_cell_node)
+        ref_nodes = []
+        for ref, child_node in zip(new_cell.refs, new_cell.ref_nodes):
+            if len(ref) == 2:
+                self.sheet_references.setdefault(self._ref_sheet_id(ref, sheet_id), set()).add(curr_cell_node)
+            elif child_node is not None:
+                child_node = pack_node(sheet_id, unpack_node(child_node)[1])
+            if child_node is not None:
+                edges.append((child_node, curr_cell_node))
+            ref_nodes.append(child_node)
+        new_cell.ref_nodes = ref_nodes
+
+        range_nodes = []
+        for range_ref, target in zip(new_cell.range_refs, new_cell.range_nodes):
+            if len(range_ref) == 3:
+                self.sheet_references.setdefault(self._ref_sheet_id(range_ref[:-1], sheet_id), set()).add(curr_cell_node)
+            elif target is not None:
+                target = (sheet_id,) + target[1:]
+            if target is not None:
+                self.graph.add_range_edge(*target, curr_cell_node)
+            range_nodes.append(target)
+        new_cell.range_nodes = range_nodes
+        self._map_ref_nodes(new_cell)
+
+    def _copy_blank_cells(self, original, copy):
+        # The blank cells of `original` that formulas refer to are written as
+        # empty cells (see self.blanks_before_sheet), and so are those of
+        # `copy`; a node of its own keeps that, even where nothing in the copy
+        # refers to the cell.  Its other blank cells are written like cells
+        # nothing referred to.
+        referenced = set()
+        for node in self.graph.get_group(original.sheet_id):
+            loc = unpack_node(node)[1]
+            if loc not in original.cell_map and node not in self.blanks_before_sheet:
+                referenced.add(loc)
+        for node in self.graph.get_group(copy.sheet_id):
+            loc = unpack_node(node)[1]
+            if loc in referenced:
+                self.blanks_before_sheet.discard(node)
+            elif loc not in copy.cell_map:
+                self.blanks_before_sheet.add(node)
+        for loc in referenced:
+            self.graph.add_node(pack_node(copy.sheet_id, loc))
+
+    def _map_ref_nodes(self, cell):
+        self.subexpressions.release(cell)
+        cell.ref_node_map = dict()
+        if cell.tree:
+            ref_nodes = iter(cell.ref_nodes)
+            range_nodes = iter(cell.range_nodes)
+            for reference in iter_references(cell.tree):
+                nodes = ref_nodes if reference[0] == 'cell' else range_nodes
+                cell.ref_node_map[id(reference)] = next(nodes, None)
+        cell.aggregate = None
+        if self._is_incremental_aggregate(cell.tree):
+            cell.aggregate = IncrementalAggregate(cell.tree[1].upper())
+        self.subexpressions.register(cell)
+
+    def _is_incremental_aggregate(self, tree):
+        # True for formulas like "=SUM(A1:A10, C1:C10)": one SUM, COUNT or
+        # AVERAGE call whose arguments are all ranges.
+        if tree is None or tree[0] != 'function':
+            return False
+        if tree[1].upper() not in INCREMENTAL_FUNCTIONS:
+            return False
+        return all(arg[0] == 'range' for arg in tree[2])
+
+    def _value_changed(self, sheet_id, cell_loc, old_value, new_value):
+        # Worksheet.value_listener.
+        self.subexpressions.value_changed(sheet_id, cell_loc)
+        self._apply_aggregate_deltas(sheet_id, cell_loc, old_value, new_value)
+
+    def _apply_aggregate_deltas(self, sheet_id, cell_loc, old_value, new_value):
+        # Folds the change into the running state of
+        # every incremental aggregate whose ranges contain the cell.  A range
+        # listed twice sees the change twice, as it counts the cell twice.
+        index = self.graph.range_index.get(sheet_id)
+        if not index:
+            return
+        for consumer in index.query(cell_loc[0], cell_loc[1]):
+            c = self._get_cell_by_node(consumer)
+            if c is not None and c.aggregate is not None:
+                c.aggregate.apply(old_value, new_value)
+
+    def _evaluate_aggregate(self, c):
+        # O(1) from the running state while it is valid; otherwise the ranges
+        # are read in full, which resets the state.
+        if c.aggregate.valid:
+            return c.aggregate.result()
+        args = []
+        for range_tree in c.tree[2]:
+            target = c.ref_node_map.get(id(range_tree))
             try:
-                c = self._get_cell_loc_tup(cell_sheet_name, cell_loc)
-                if c == None:
-                    c = Cell(None, cell_loc)
-                    self._get_sheet(cell_sheet_name).add_cell(cell_loc, c, is_implicit=True)
-                    # Should cell notify as you had to create a cell for an implicitly referenced cell that is unset
-            except ValueError:
-                return
-            old_value = c.value
-            e = FormulaEvaluator(self, cell_sheet_name)
-            if c.tree:
-                if self._refers_to_self(c, cell_sheet_name, cell_loc):
-                    c.value = CellError(CellErrorType.CIRCULAR_REFERENCE, "Self circular reference")
-                elif self._refers_to_single_none_cell(c, cell_sheet_name):
-                    c.value = decimal.Decimal('0')
+                if target is None:
+                    raise ValueError("Range beyond the maximum extent")
+                args.append(RangeArgument(self._get_range_columns(target)))
+            except (KeyError, ValueError):
+                args.append("#REF!")
+        return c.aggregate.reset(args)
+
+    def _unindex_sheet_references(self, cell, node):
+        qualified = [ref for ref in cell.refs if len(ref) == 2]
+        qualified.extend(range_ref[:-1] for range_ref in cell.range_refs if len(range_ref) == 3)
+        for ref in qualified:
+            referencing = self.sheet_references.get(self._ref_sheet_id(ref, node_sheet_id(node)))
+            if referencing is not None:
+                referencing.discard(node)
+
+    def _ref_sheet_id(self, ref, sheet_id):
+        # ('A1',) -> sheet_id; ('SHEET1', 'A1') or ("'MY SHEET'", 'A1') -> that sheet's id
+        if len(ref) == 1:
+            return sheet_id
+        ref_sheet = ref[0]
+        if ref_sheet.startswith("'") and ref_sheet.endswith("'"):
+            ref_sheet = ref_sheet[1:-1]
+        return self.sheet_registry.get_id(ref_sheet)
+
+    def _get_cell_by_node(self, node):
+        sheet_id, loc = unpack_node(node)
+        sheet_object = self.sheet_registry.get_sheet(sheet_id)
+        if sheet_object is None:
+            return None
+        return sheet_object.cell_map.get(loc)
+
+    def _get_value_by_node(self, node):
+        # Internal counterpart of get_cell_value() for resolved references.
+        sheet_id, loc = unpack_node(node)
+        sheet_object = self.sheet_registry.get_sheet(sheet_id)
+        if sheet_object is None:
+            raise KeyError(f"Sheet with id {sheet_id} not found.")
+        if node in self.dirty:
+            self._evaluate_on_demand(node)
+        cell = sheet_object.cell_map.get(loc)
+        return None if cell is None else cell.value
+
+    def _get_range_columns(self, target):
+        # Values of a resolved range, as ColumnBuffers slices.
+        sheet_id, top, left, bottom, right = target
+        sheet_object = self.sheet_registry.get_sheet(sheet_id)
+        if sheet_object is None:
+            raise KeyError(f"Sheet with id {sheet_id} not found.")
+        return sheet_object.columns.get_slices(top, left, bottom, right)
+
+    def _get_named_range_columns(self, sheet_name, start, end):
+        # Counterpart of _get_range_columns() for an unresolved range.
+        target = self._resolve_range(self._get_sheet(sheet_name).sheet_id, start, end)
+        if target is None:
+            raise ValueError("Range beyond the maximum extent")
+        return self._get_range_columns(target)
+
+    def _get_dirty_precedents(self, node):
+        # The precedents of `node` that are in self.dirty.  A large range is
+        # matched against the dirty set instead of enumerating its cells.
+        c = self._get_cell_by_node(node)
+        if c == None:
+            return []
+        precedents = [ref_node for ref_node in c.ref_nodes if ref_node in self.dirty]
+        for target in c.range_nodes:
+            if target is None:
+                continue
+            sheet_id, top, left, bottom, right = target
+            if len(self.dirty) < (bottom - top + 1) * (right - left + 1):
+                for dirty_node in self.dirty:
+                    dirty_sheet_id, (row, col) = unpack_node(dirty_node)
+                    if dirty_sheet_id == sheet_id and top <= row <= bottom and left <= col <= right:
+                        precedents.append(dirty_node)
+            else:
+                precedents.extend(n for n in self._get_range_nodes(target) if n in self.dirty)
+        return precedents
+
+    def _get_range_nodes(self, target):
+        # Nodes of the cells that exist inside a resolved range, found through
+        # whichever is smaller: the range or the sheet's cells.
+        sheet_id, top, left, bottom, right = target
+        sheet_object = self.sheet_registry.get_sheet(sheet_id)
+        if sheet_object is None:
+            return []
+        cell_map = sheet_object.cell_map
+        if (bottom - top + 1) * (right - left + 1) <= len(cell_map):
+            return [pack_node(sheet_id, (row, col))
+                    for row in range(top, bottom + 1)
+                    for col in range(left, right + 1)
+                    if (row, col) in cell_map]
+        return [pack_node(sheet_id, (row, col)) for row, col in cell_map
+                if top <= row <= bottom and left <= col <= right]
+
+    def _evaluate_on_demand(self, target):
+        # Collects the dirty cells `target` depends on.  Everything reachable
+        # from a dirty cell is dirty too, so a cycle through one of them lies
+        # entirely inside this set and analyze() can order it on its own.
+        visited = {target}
+        stack = [target]
+        while stack:
+            for precedent in self._get_dirty_precedents(stack.pop()):
+                if precedent not in visited:
+                    visited.add(precedent)
+                    stack.append(precedent)
+
+        self.dirty.difference_update(visited)
+        sources = self.dirty_sources & visited
+        self.dirty_sources.difference_update(sources)
+        order, cycles = self.graph.analyze(visited)
+        self._evaluate_nodes(order, cycles, sources)
+
+    def _evaluate_affected(self, nodes, notify=True, mark_cycles=False):
+        # Recalculates `nodes` and everything downstream of them, which is
+        # also the only part of the graph that is analyzed for cycles.  If
+        # mark_cycles is True, cells on a cycle are set to #CIRCREF! first, so
+        # that they are notified ahead of the rest.  Returns the nodes whose
+        # values changed (none in 'lazy' mode, where they are only marked
+        # dirty).
+        affected = set()
+        for node in nodes:
+            affected.update(self.graph.get_reachable(node))
+        if self.eval_mode == 'lazy':
+            self.dirty.update(affected)
+            self.dirty_sources.update(nodes)
+            return []
+        order, cycles = self.graph.analyze(affected)
+        all_cells_changed = []
+        if mark_cycles:
+            marked = set()
+            for node in order:
+                if node in cycles and node not in marked:
+                    marked.update(cycles[node])
+                    all_cells_changed.extend(self._mark_cycle(cycles[node]))
+        all_cells_changed.extend(self._evaluate_nodes(order, cycles, nodes, notify=False))
+        if notify:
+            self._notify(all_cells_changed)
+        return all_cells_changed
+
+    def _evaluate_nodes(self, nodes, cycles, sources, notify=True):
+        # Evaluates `nodes` in order; `cycles` holds those on a cycle, as
+        # returned by Graph.analyze().  Only `sources` (the cells whose
+        # contents or references changed) and cycle members are sure to be
+        # recomputed, and their dependents after them.  Any other node is
+        # skipped unless a precedent's value changed, so an edit stops
+        # spreading where it stops making a difference.
+        sources = set(sources)
+        needed = set(sources)
+        if cycles:
+            remaining = self._skip_known_cycles(nodes, cycles)
+            if len(remaining) != len(nodes):
+                # A known cycle may only just have been set to #CIRCREF! (see
+                # _mark_cycle()), so its dependents are recomputed anyway.
+                for node in set(nodes).difference(remaining):
+                    needed.update(self.graph.get_children(node))
+            nodes = remaining
+        if self.circular:
+            # Cells that were on a cycle and aren't any more get their values
+            # back below, and are notified like any other change.
+            for node in nodes:
+                if node not in cycles and self.circular.pop(node, None) is not None:
+                    needed.add(node)
+        all_cells_changed = []
+        get_children = self.graph.get_children
+        dirty = self.dirty
+        profiler = self.profiler
+        evaluated = 0
+        for node in nodes:
+            if node not in needed and node not in cycles:
+                continue
+            evaluated += 1
+            if profiler is not None and profiler.should_sample():
+                start = time.perf_counter()
+                changed, visible = self._evaluate_cell(node, node in cycles)
+                profiler.record_cell(node, time.perf_counter() - start)
+            else:
+                changed, visible = self._evaluate_cell(node, node in cycles)
+            if changed:
+                all_cells_changed.append(node)
+            # A cycle's members may have been set to #CIRCREF! before this
+            # (see _mark_cycle()), so their change isn't seen here.
+            if visible or node in cycles or node in sources:
+                children = get_children(node)
+                needed.update(children)
+                if dirty:
+                    # A dirty dependent outside `nodes` is left for a later
+                    # evaluation, which has to recompute it.
+                    self.dirty_sources.update(dirty.intersection(children))
+        if profiler is not None:
+            profiler.count_cells(evaluated)
+        if notify:
+            self._notify(all_cells_changed)
+        return all_cells_changed
+
+    def _skip_known_cycles(self, nodes, cycles):
+        # Returns `nodes` without the members of SCCs that were already cycles
+        # with exactly the same members: they still hold #CIRCREF!, so there
+        # is nothing to recompute or notify.  Records the other cycles.
+        known = set()
+        seen = set()    # ids of the SCC lists handled so far
+        for scc in cycles.values():
+            if id(scc) in seen:
+                continue
+            seen.add(id(scc))
+            recorded = self.circular.get(scc[0])
+            if (recorded is not None and len(recorded) == len(scc) and
+                    all(self.circular.get(node) is recorded and self._holds_circref(node) for node in scc)):
+                known.update(scc)
+                continue
+            members = frozenset(scc)
+            for node in scc:
+                self.circular[node] = members
+        if not known:
+            return nodes
+        return [node for node in nodes if node not in known]
+
+    def _holds_circref(self, node):
+        c = self._get_cell_by_node(node)
+        return (c is not None and isinstance(c.value, CellError) and
+                c.value.get_type() == CellErrorType.CIRCULAR_REFERENCE)
+
+    def _evaluate_cell(self, node, in_cycle):
+        # Recomputes the value of the cell at `node`, which is on a cycle if
+        # in_cycle is True.  Returns (changed, visible): whether the value
+        # changed, as notifications count it, and whether its dependents could
+        # tell the difference.  They can for more than notifications: 5 and
+        # 5.0 are equal, but concatenate differently.
+        (sheet_id, cell_loc) = unpack_node(node)
+        sheet_object = self.sheet_registry.get_sheet(sheet_id)
+        # If referring to a cell in a sheet that DNE, skip evaluation
+        # because that invalid cell object wouldn't have even been created.
+        if sheet_object is None:
+            return False, False
+        c = sheet_object.get_cell(cell_loc)
+        if c == None:
+            # A blank cell that is only referred to; it has no formula.
+            return False, False
+        old_value = c.value
+        if c.tree:
+            if self._refers_to_self(c, node):
+                value = CellError.shared(CellErrorType.CIRCULAR_REFERENCE, "Self circular reference")
+            elif in_cycle:
+                # Cycle members can't rely on reading #CIRCREF! from each other:
+                # they aren't marked up front in lazy mode, and a range argument
+                # doesn't necessarily pass errors on.
+                value = CellError.shared(CellErrorType.CIRCULAR_REFERENCE)
+            elif self._refers_to_single_none_cell(c):
+                value = decimal.Decimal('0')
+            else:
+                if c.aggregate is not None:
+                    v = self._evaluate_aggregate(c)
                 else:
-                    v = e.evaluate(c.tree)
-                    if CellError.is_error_string(v):
-                        error_type = CellError.get_error_type_from_string(v)
-                        c.value = CellError(error_type, CellError.get_detail_from_error_type(error_type))
-                    else:
-                        c.value = v
-            if c.value != old_value and not self._is_same_error(c.value, old_value):
-                all_cells_changed.append((cell_sheet_name, cell_loc))
+                    v = FormulaEvaluator(self, sheet_object.sheet_name, c.ref_node_map,
+                                         c.shared).evaluate(c.code)
+                if CellError.is_error_string(v):
+                    error_type = CellError.get_error_type_from_string(v)
+                    value = CellError.shared(error_type)
+                else:
+                    value = v
+            sheet_object.set_cell_value(cell_loc, c, value)
+        else:
+            return False, False
+        changed = c.value != old_value and not self._is_same_error(c.value, old_value)
+        return changed, changed or not self._is_same_value(c.value, old_value)
 
-        self._notify(all_cells_changed)
+    def _is_same_value(self, v1, v2):
+        # Whether formulas reading v1 and v2 get the same results.
+        if v1.__class__ is not v2.__class__:
+            return False
+        if isinstance(v1, CellError):
+            return v1.get_type() == v2.get_type()
+        return v1 == v2 and (v1.__class__ is not decimal.Decimal or str(v1) == str(v2))
     
     def _is_same_error(self, e1, e2):
         if isinstance(e1, CellError) and isinstance(e2, CellError):
             return e1.get_type() == e2.get_type()
         return False
     
-    def _refers_to_single_cell(self, c):   
-        # Ex, this cell's reference is 'A1'
-        if c.content == None:
-            return False
-        if (len(c.tree.children) == 1 and isinstance(c.tree.children[0], Token) and len(c.get_refs()) == 1):
-            return True
-    
-        # Ex, this cell's reference is `Sheet1!A1`
-        if (len(c.tree.children) == 2 and isinstance(c.tree.children[0], Token) and isinstance(c.tree.children[1], Token) and len(c.get_refs()) == 1):
-            return True
-        return False
-
-    def _refers_to_self(self, c, cell_sheet_name, cell_loc):
-        if not self._refers_to_single_cell(c):
+    def _refers_to_self(self, c, node):
+        sheet_id, (row, col) = unpack_node(node)
+        for target in c.range_nodes:
+            if (target is not None and target[0] == sheet_id and
+                    target[1] <= row <= target[3] and target[2] <= col <= target[4]):
+                return True
+        # Ex, this cell's formula is just 'A1' or `Sheet1!A1`
+        if not c.single_ref:
             return False
-        ref_sheet_name = c.get_refs()[0][0] if len(c.get_refs()[0]) == 2 else cell_sheet_name
-        ref_loc_str = c.get_refs()[0][1] if len(c.get_refs()[0]) == 2 else c.get_refs()[0][0]
-        return (cell_sheet_name, cell_loc) == (ref_sheet_name, parse_cell_location_string(ref_loc_str))
+        return c.ref_nodes[0] == node
     
-    def _refers_to_single_none_cell(self, c, sheetname):
-        if not self._refers_to_single_cell(c):
+    def _refers_to_single_none_cell(self, c):
+        if not c.single_ref:
             return False
-        ref_sheetname = c.get_refs()[0][0] if len(c.get_refs()[0]) == 2 else sheetname
-        location = c.get_refs()[0][1] if len(c.get_refs()[0]) == 2 else c.get_refs()[0][0]
-        location = parse_cell_location_string(location)
-        
-        try:
-            sheet_obj = self._get_sheet(ref_sheetname)
-            cell_obj = sheet_obj.get_cell(location)
-            if cell_obj.content == None:
-                return True
+        ref_node = c.ref_nodes[0]
+        # A reference to a missing sheet or beyond the maximum extent is a bad
+        # reference, not a None cell.
+        if ref_node is None:
             return False
-        except:
-            # Cell ref doesn't even exist yet, so can't possibly be a None cell.
+        sheet_id, location = unpack_node(ref_node)
+        sheet_obj = self.sheet_registry.get_sheet(sheet_id)
+        if sheet_obj is None:
             return False
-        
-    def _is_immediately_evaluatable(self, c):
-        # either single number, string, or cell
-        is_single_node = len(c.tree.children) == 1
-        return len(c.tree.children) == 1 and len(c.refs) == 1
-
-    def _detect_cycle_and_propagate(self, curr_cell_node):
-        # Cycle detection with Tarjan's algorithm
-        component = self.graph.get_component(curr_cell_node)
-
-        assert len(component) > 0
-        if len(component) != 1:
-            # Keep track of cells that have been changed so that we can notify them.
-            all_cells_changed = []
-            # Cycle detected, so set every cell in the cycle to a CIRCULAR_REFERENCE error.
-            for cell_sheet_name, cell_loc in component:
-                c = self._get_cell_loc_tup(cell_sheet_name, cell_loc)
-                if (c.value == None or not isinstance(c.value, CellError) or c.value.get_type() != CellErrorType.CIRCULAR_REFERENCE):
-                    all_cells_changed.append((cell_sheet_name, cell_loc))
-                c.value = CellError(CellErrorType.CIRCULAR_REFERENCE, "Circular reference detected")
-            self._notify(all_cells_changed)
-            return True
-        return False
+        cell_obj = sheet_obj.get_cell(location)
+        return cell_obj is None or cell_obj.content == None
+
+    def _mark_cycle(self, cycle):
+        # Sets every cell in `cycle` (e.g. from Graph.analyze()) to a
+        # CIRCULAR_REFERENCE error.  Returns the cells whose values changed.
+        all_cells_changed = []
+        members = frozenset(cycle)
+        for node in cycle:
+            self.circular[node] = members
+            sheet_id, loc = unpack_node(node)
+            sheet_object = self.sheet_registry.get_sheet(sheet_id)
+            c = sheet_object.get_cell(loc)
+            if (c.value == None or not isinstance(c.value, CellError) or c.value.get_type() != CellErrorType.CIRCULAR_REFERENCE):
+                all_cells_changed.append(node)
+            sheet_object.set_cell_value(loc, c, CellError.shared(CellErrorType.CIRCULAR_REFERENCE, "Circular reference detected"))
+        return all_cells_changed
 
     def _notify(self, changed_cells: Iterable[Tuple[str, str]]) -> None:
+        if self.profiler is not None:
+            with self.profiler.timing('notify_time'):
+                self._deliver(changed_cells)
+        else:
+            self._deliver(changed_cells)
+
+    def _deliver(self, changed_cells):
         # ("SHEET1", "A1") -> ("Sheet1", (0, 0))
         changed_cells = self._standardize_changed_cells_for_notifs(changed_cells)
-    
-        for notify_function in self.notify_functions:
+
+        routed = self.notification_router.route(changed_cells)
+        deliveries = []
+        for slot, notify_function in enumerate(self.notify_functions):
+            if not self.notification_router.is_filtered(slot):
+                deliveries.append((slot, notify_function, changed_cells))
+            elif slot in routed:
+                deliveries.append((slot, notify_function, routed[slot]))
+
+        if self.notification_dispatcher is not None:
+            self.notification_dispatcher.submit(self, deliveries)
+            return
+
+        for _, notify_function, cells in deliveries:
             try:
-                notify_function(self, changed_cells)
+                notify_function(self, cells)
             except Exception as e:
                 pass
 
-    # Given a cell's sheetname (case insensitive), retrieve the actual sheetname
-    # with the case preserved.
-    def _get_original_sheetname(self, name):
-        sheet_object = self._get_sheet(name)
-        return sheet_object.sheet_name
+    def _timing(self, phase):
+        # Context manager adding the time spent inside it to `phase` of the
+        # current operation (see OperationStats), while profiling is enabled.
+        if self.profiler is None:
+            return NO_TIMING
+        return self.profiler.timing(phase)
+
+    def _add_sheet(self, sheet_name):
+        # Creates an empty sheet at the end of the workbook.
+        sheet_object = Worksheet(sheet_name)
+        sheet_object.value_listener = self._value_changed
+        self.sheet_registry.add(sheet_object)
+        # A sheet id that formulas already refer to may now have values.
+        self.subexpressions.invalidate_all()
+        self.blanks_before_sheet.update(self.graph.get_group(sheet_object.sheet_id))
+        return sheet_object
 
     def _get_sheet(self, sheet_name):
-        if not self._get_sheet_exists(sheet_name):
+        sheet_object = self.sheet_registry.find_sheet(sheet_name)
+        if sheet_object is None:
             raise KeyError(f"Sheet '{sheet_name}' not found.")
-        
-        sheet_idx = self.sheet_to_tab[sheet_name.upper()]
-        return self.worksheet_order[sheet_idx]
+        return sheet_object
     
     def _validate_sheet_name(self, sheet_name):
         # Technically shouldn't get to here because of the above check.
@@ -495,42 +1194,25 @@ class Workbook:
         if any(char not in allowed_chars for char in sheet_name):
             raise ValueError("Sheet name contains invalid characters")
         
-        if sheet_name.upper() in self.sheet_to_tab:
+        if self._get_sheet_exists(sheet_name):
             raise ValueError("Sheet name must be unique")
         
 
-    def _rename_sheet(self, sheet_name, new_sheet_name):
-        self._validate_sheet_name(new_sheet_name)
-        
-        sheet_idx = self.sheet_to_tab[sheet_name.upper()]
-        sheet_obj = self._get_sheet(sheet_name)
-
-        sheet_obj.sheet_name = new_sheet_name
-        del self.sheet_to_tab[sheet_name.upper()]
-        self.sheet_to_tab[new_sheet_name.upper()] = sheet_idx 
-
-        return sheet_obj 
-    
     def _get_sheet_exists(self, sheet_name):
-        return sheet_name.upper() in self.sheet_to_tab
+        return self.sheet_registry.find_sheet(sheet_name) is not None
 
     def _get_cell(self, sheet_name, location_str):
         sheet_object = self._get_sheet(sheet_name)
         location_tuple = parse_cell_location_string(location_str)
         return sheet_object.get_cell(location_tuple)
     
-    def _get_cell_loc_tup(self, sheet_name, location_tuple):
-        sheet_object = self._get_sheet(sheet_name)
-        c = sheet_object.get_cell(location_tuple)
-        return c
-
     def _get_notify_functions(self):
         return self.notify_functions
         
     def _gen_new_sheetname(self):
         i = 1
         sheet_name = f"Sheet{i}"
-        while sheet_name.upper() in self.sheet_to_tab:
+        while self._get_sheet_exists(sheet_name):
             i += 1
             sheet_name = f"Sheet{i}"
         return sheet_name
@@ -541,7 +1223,6 @@ class Workbook:
         including their cell map. This will be helpful for debugging.
         """
         output = ""
-        for i in range(len(self.worksheet_order)):
-            sheet_obj = self.worksheet_order[i]
+        for sheet_obj in self.sheet_registry.ordered_sheets():
             output += sheet_obj._pretty_print_cell_map()
         return output
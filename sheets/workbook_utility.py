@@ -39,4 +39,24 @@ def is_valid_location(cell_loc):
     """ Returns if a cell's location is within A1 and ZZZZ9999, inclusive. """
     row, col = cell_loc
     # Assuming ZZZZ maps to 475253
-    return 0 <= row < 9999 and 0 <= col <= 475253 
\ No newline at end of file
+    return 0 <= row < 9999 and 0 <= col <= 475253 
+
+# Graph nodes pack (sheet id, row, col) into a single int.  The column takes the
+# low 19 bits (ZZZZ is 475253 < 2**19) and the row the next 14 bits (9999 < 2**14),
+# so only locations that pass is_valid_location() can be packed.
+_COL_BITS = 19
+_ROW_BITS = 14
+_SHEET_SHIFT = _COL_BITS + _ROW_BITS
+_COL_MASK = (1 << _COL_BITS) - 1
+_ROW_MASK = (1 << _ROW_BITS) - 1
+
+def pack_node(sheet_id, cell_loc):
+    row, col = cell_loc
+    return (sheet_id << _SHEET_SHIFT) | (row << _COL_BITS) | col
+
+def unpack_node(node):
+    """ Inverse of pack_node: returns (sheet_id, (row, col)). """
+    return node >> _SHEET_SHIFT, ((node >> _COL_BITS) & _ROW_MASK, node & _COL_MASK)
+
+def node_sheet_id(node):
+    return node >> _SHEET_SHIFT
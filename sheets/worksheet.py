@@ -1,17 +1,26 @@
 import heapq
+from sheets.column_buffers import ColumnBuffers
 from sheets.workbook_utility import index_to_cell_location, is_valid_location
 
 class Worksheet:
-    def __init__(self, sheet_name):
+    def __init__(self, sheet_name, sheet_id=None):
         # max heap to track extent
         self.row_heap = list()
         self.col_heap = list()
+        # {location : number of entries it has in the heaps}, so that an empty
+        # cell the extent still counts can be told apart from one it doesn't.
+        self.extent_entries = dict()
 
         if not sheet_name.strip():
             raise ValueError("Sheet name cannot be empty or whitespace")
         self.sheet_name = sheet_name
+        self.sheet_id = sheet_id    # stable across renames; see Workbook
 
         self.cell_map = dict()  # {location : Cell object}
+        self.columns = ColumnBuffers()  # cell values by column, for ranges
+        # Called as value_listener(sheet_id, location, old value, new value)
+        # when a cell's value changes, except in copy_cells_from().
+        self.value_listener = None
        
     def get_extent(self):
         if len(self.row_heap) == 0 or len(self.col_heap) == 0:
@@ -25,30 +34,29 @@ class Worksheet:
         if cell_loc in self.cell_map:
             raise ValueError("Adding cell that already exists")
         
-        row, col = cell_loc
         if not is_valid_location(cell_loc):
             raise ValueError("Invalid cell location")
         
         self.cell_map[cell_loc] = cell_obj
+        if cell_obj is not None:
+            self._store_value(cell_loc, cell_obj.value)
         
         # If a cell is implicitly created it's value is None, so don't count
         # it towards the extent.
         if is_implicit:
             return
-        heapq.heappush(self.row_heap, -row)
-        heapq.heappush(self.col_heap, -col)
+        self._push_to_heap(cell_loc)
     
     def update_cell(self, cell_loc, cell_obj, contents):
         if cell_loc not in self.cell_map:
             raise ValueError("Cell does not exist")
         
         old_value = cell_obj.value
-        row, col = cell_loc
         cell_obj.update(contents)   # this evaluates the cell's value
+        self._store_value(cell_loc, cell_obj.value)
 
         if not old_value and cell_obj.value:
-            heapq.heappush(self.row_heap, -row)
-            heapq.heappush(self.col_heap, -col)
+            self._push_to_heap(cell_loc)
         
         elif old_value and not cell_obj.value:
             # Keep the cell in `cell_map` but remove it from the heaps since
@@ -61,8 +69,41 @@ class Worksheet:
 
         self._remove_from_heap_and_heapify(cell_loc)
         del self.cell_map[cell_loc]
+        self._store_value(cell_loc, None)
     
 
+    def discard_empty_cell(self, cell_loc):
+        """
+        Removes the cell at `cell_loc` if it is empty: it has no content and
+        the extent doesn't count it.  Returns True if it was removed.
+        """
+        cell_obj = self.cell_map.get(cell_loc)
+        if cell_obj is None or cell_obj.content is not None or cell_loc in self.extent_entries:
+            return False
+        del self.cell_map[cell_loc]
+        self._store_value(cell_loc, None)
+        return True
+
+    def copy_cells_from(self, other):
+        """ Replaces this sheet's cells and extent with copies of `other`'s. """
+        self.cell_map = {loc: cell.copy() for loc, cell in other.cell_map.items()}
+        self.row_heap = list(other.row_heap)
+        self.col_heap = list(other.col_heap)
+        self.extent_entries = dict(other.extent_entries)
+        self.columns = ColumnBuffers()
+        for loc, cell in self.cell_map.items():
+            self.columns.store(loc, cell.value)
+
+    def set_cell_value(self, cell_loc, cell_obj, value):
+        """ Sets the computed value of the cell at `cell_loc`. """
+        cell_obj.value = value
+        self._store_value(cell_loc, value)
+
+    def _store_value(self, cell_loc, value):
+        old_value = self.columns.store(cell_loc, value)
+        if self.value_listener is not None and old_value is not value:
+            self.value_listener(self.sheet_id, cell_loc, old_value, value)
+
     def get_cell(self, cell_loc):
         if cell_loc not in self.cell_map:
             # If the cell is unset, then we check if it's a valid cell location
@@ -88,12 +129,21 @@ class Worksheet:
                 cells[fmt_location] = cell_contents
         return cells
 
+    def _push_to_heap(self, cell_loc):
+        row, col = cell_loc
+        heapq.heappush(self.row_heap, -row)
+        heapq.heappush(self.col_heap, -col)
+        self.extent_entries[cell_loc] = self.extent_entries.get(cell_loc, 0) + 1
+
     def _remove_from_heap_and_heapify(self, cell_loc):
         """ Removes cell from row and col heaps and heapifies them """
         row, col = cell_loc
         
         self.row_heap.remove(-row)
         self.col_heap.remove(-col)
+        count = self.extent_entries.pop(cell_loc, 0) - 1
+        if count > 0:
+            self.extent_entries[cell_loc] = count
 
         # Re-heapify after removal
         heapq.heapify(self.row_heap)  
@@ -0,0 +1,72 @@
+import context
+import unittest
+from decimal import Decimal
+from sheets import Workbook
+
+
+class TestBlankReferences(unittest.TestCase):
+    def test_blank_references_make_no_cells(self):
+        for mode in ('eager', 'lazy'):
+            wb = Workbook(mode)
+            wb.new_sheet("Sheet1")
+            formula = "=" + " + ".join(f"B{row}" for row in range(1, 1001))
+            wb.set_cell_contents("Sheet1", "A1", formula)
+            self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(0))
+            self.assertEqual(len(wb._get_sheet("Sheet1").cell_map), 1)
+            self.assertIsNone(wb.get_cell_value("Sheet1", "B500"))
+            self.assertIsNone(wb.get_cell_contents("Sheet1", "B500"))
+
+            # Writing to one of them still recomputes the formula.
+            wb.set_cell_contents("Sheet1", "B500", "7")
+            self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(7), mode)
+            wb.set_cell_contents("Sheet1", "B500", None)
+            self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(0), mode)
+
+    def test_extent_and_saved_contents_are_unchanged(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "=C5 & D9")
+        self.assertEqual(wb.get_sheet_extent("Sheet1"), (1, 1))
+        # A referenced blank cell set to nothing isn't counted, unlike one that
+        # nothing refers to.
+        wb.set_cell_contents("Sheet1", "C5", None)
+        self.assertEqual(wb.get_sheet_extent("Sheet1"), (1, 1))
+        wb.set_cell_contents("Sheet1", "D9", "x")
+        self.assertEqual(wb.get_sheet_extent("Sheet1"), (4, 9))
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), "x")
+        self.assertEqual(wb._get_sheet("Sheet1").serialize(), {"A1": "=C5 & D9", "D9": "x"})
+
+    def test_extent_of_cells_referred_to_before_their_sheet_existed(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "C1", "='My Sheet'!A2 + 'My Sheet'!B3")
+        wb.new_sheet("My Sheet")
+        wb.set_cell_contents("My Sheet", "C1", "2")
+        wb.set_cell_contents("My Sheet", "A2", "=1")
+        self.assertEqual(wb.get_sheet_extent("My Sheet"), (3, 2))
+        self.assertEqual(wb.get_cell_value("Sheet1", "C1"), Decimal(1))
+
+        # Once a formula refers to it with its sheet in place, it is like any
+        # other referenced blank cell.
+        wb.set_cell_contents("Sheet1", "D1", "='My Sheet'!B3")
+        wb.set_cell_contents("My Sheet", "B3", "=0")
+        self.assertEqual(wb.get_sheet_extent("My Sheet"), (3, 2))
+
+    def test_extent_of_copied_blank_cells(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("Data")
+        wb.set_cell_contents("Sheet1", "A1", "=C5")
+        wb.set_cell_contents("Data", "A1", "=Sheet1!D9 + 'Copy'!B7")
+        wb.copy_sheet("Sheet1")
+        wb.rename_sheet("Sheet1_1", "Copy")
+        wb.set_cell_contents("Copy", "C5", "=0")
+        wb.set_cell_contents("Copy", "D9", None)
+        self.assertEqual(wb.get_sheet_extent("Copy"), (1, 1))
+        # The rename makes Data!A1 refer to B7 with its sheet in place.
+        wb.set_cell_contents("Copy", "B7", None)
+        self.assertEqual(wb.get_sheet_extent("Copy"), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
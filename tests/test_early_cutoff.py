@@ -0,0 +1,77 @@
+import context
+import unittest
+import unittest.mock
+from decimal import Decimal
+from sheets import Workbook
+
+
+class TestEarlyCutoff(unittest.TestCase):
+    def make_chain(self, mode='eager'):
+        # A1 is clamped by B1, which a chain of 50 cells builds on.
+        wb = Workbook(mode)
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "30")
+        wb.set_cell_contents("Sheet1", "B1", "=MIN(A1, 10)")
+        wb.set_cell_contents("Sheet1", "C1", "=B1 + 1")
+        for row in range(2, 51):
+            wb.set_cell_contents("Sheet1", f"C{row}", f"=C{row - 1} + 1")
+        wb.get_cell_value("Sheet1", "C50")
+        return wb
+
+    def test_unchanged_value_stops_propagation(self):
+        for mode in ('eager', 'lazy'):
+            wb = self.make_chain(mode)
+            changed = []
+            wb.notify_cells_changed(lambda _, cells: changed.extend(cells))
+            with unittest.mock.patch.object(wb, '_evaluate_cell', wraps=wb._evaluate_cell) as evaluate:
+                wb.set_cell_contents("Sheet1", "A1", "20")
+                self.assertEqual(wb.get_cell_value("Sheet1", "C50"), Decimal(60))
+            self.assertEqual(evaluate.call_count, 2, mode)
+            self.assertEqual(changed, [("Sheet1", "A1")])
+
+            wb.set_cell_contents("Sheet1", "A1", "5")
+            self.assertEqual(wb.get_cell_value("Sheet1", "C50"), Decimal(55))
+            self.assertEqual(wb.get_cell_value("Sheet1", "C7"), Decimal(12))
+
+    def test_profiler_counts_evaluated_cells(self):
+        for mode in ('eager', 'lazy'):
+            wb = self.make_chain(mode)
+            operations = []
+            wb.enable_profiling(hook=operations.append)
+            wb.set_cell_contents("Sheet1", "A1", "20")
+            wb.get_cell_value("Sheet1", "C50")
+            self.assertEqual(sum(stats.cells_evaluated for stats in operations), 2, mode)
+
+    def test_equal_values_that_read_differently(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "C1", "2.5")
+        wb.set_cell_contents("Sheet1", "C2", "=5-C1")
+        wb.set_cell_contents("Sheet1", "B1", "=C1+C2")
+        wb.set_cell_contents("Sheet1", "D1", "=B1&\"\"")
+        self.assertEqual(wb.get_cell_value("Sheet1", "D1"), "5.0")
+        # B1 goes from 5.0 to 5: the same value, but not the same text.
+        wb.set_cell_contents("Sheet1", "C1", "2")
+        self.assertEqual(wb.get_cell_value("Sheet1", "D1"), "5")
+
+    def test_lazy_evaluation_in_parts(self):
+        wb = Workbook('lazy')
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "1")
+        wb.set_cell_contents("Sheet1", "B1", "=A1*2")
+        wb.set_cell_contents("Sheet1", "C1", "=B1+1")
+        wb.set_cell_contents("Sheet1", "D1", "=C1+1")
+        self.assertEqual(wb.get_cell_value("Sheet1", "D1"), Decimal(4))
+
+        # B1 is computed on its own first; C1 and D1 still have to see it.
+        wb.set_cell_contents("Sheet1", "A1", "2")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(4))
+        self.assertEqual(wb.get_cell_value("Sheet1", "C1"), Decimal(5))
+        wb.set_cell_contents("Sheet1", "A1", "3")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(6))
+        wb.recalculate()
+        self.assertEqual(wb.get_cell_value("Sheet1", "D1"), Decimal(8))
+
+
+if __name__ == '__main__':
+    unittest.main()
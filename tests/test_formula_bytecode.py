@@ -0,0 +1,65 @@
+import context
+import unittest
+from decimal import Decimal
+from sheets import Workbook
+from sheets.formula_parser import FormulaParser
+from sheets.formula_optimizer import optimize
+from sheets.formula_bytecode import (compile_tree, PUSH, CELL, RANGE, ADD, MUL, NUMBER, CALL,
+                                     MEMO, STORE)
+
+
+def compile_formula(formula):
+    return compile_tree(optimize(FormulaParser().parse_formula(formula)[1]))
+
+
+class TestFormulaBytecode(unittest.TestCase):
+    def test_compiled_code(self):
+        code = compile_formula("=(A1*2)+SUM(B1:B2, 3)")
+        self.assertEqual([instruction[0] for instruction in code],
+                         [MEMO, CELL, PUSH, MUL, NUMBER, STORE, MEMO, RANGE, PUSH, CALL, STORE, ADD])
+        self.assertEqual(code[0][2], 6)
+        self.assertEqual(code[6][2], 11)
+        self.assertEqual(code[9][1:], ('SUM', 2))
+
+        # Groups and calls that refer to no cells aren't memoized.
+        code = compile_formula("=(A1+1)*MAX(1, 2*A2)+MIN(4, 1+(2))")
+        self.assertEqual([instruction[0] for instruction in code].count(MEMO), 2)
+        self.assertEqual([i for i, instruction in enumerate(code) if instruction[0] == MEMO],
+                         [0, 6])
+        self.assertEqual(code[6][2], 13)
+
+    def test_deep_formulas_in_a_workbook(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("Data")
+        wb.set_cell_contents("Data", "A1", "2")
+        n = 3000    # well past the recursion limit
+        formulas = {
+            "B1": "=" + "+".join(["Data!A1"] * n),
+            "B2": "=" + "(Data!A1+" * n + "1" + ")" * n,
+            "B3": "=" + "MIN(Data!A1, " * n + "7" + ")" * n,
+            "B4": "=" + "-(" * n + "Data!A1" + ")" * n,
+            "B5": "=" + "&".join(["Data!A1"] * n),
+        }
+        for location, formula in formulas.items():
+            wb.set_cell_contents("Sheet1", location, formula)
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(2 * n))
+        self.assertEqual(wb.get_cell_value("Sheet1", "B2"), Decimal(2 * n + 1))
+        self.assertEqual(wb.get_cell_value("Sheet1", "B3"), Decimal(2))
+        self.assertEqual(wb.get_cell_value("Sheet1", "B4"), Decimal(2))
+        self.assertEqual(wb.get_cell_value("Sheet1", "B5"), "2" * n)
+
+        wb.set_cell_contents("Data", "A1", "'x")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B2").get_type().name, 'TYPE_ERROR')
+        self.assertEqual(wb.get_cell_value("Sheet1", "B5"), "x" * n)
+
+        wb.rename_sheet("Data", "My Data")
+        self.assertEqual(wb.get_cell_contents("Sheet1", "B2"),
+                         "=" + "('My Data'!A1+" * n + "1" + ")" * n)
+        wb.set_cell_contents("My Data", "A1", "-3")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B2"), Decimal(-3 * n + 1))
+        self.assertEqual(wb.get_cell_value("Sheet1", "B3"), Decimal(-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -125,6 +125,53 @@ class TestFormulaEvaluator(unittest.TestCase):
 
 
     # empty cell tests are in workbook because they depend on get_cell_value
-    
+
+
+class TestErrorPropagation(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+
+    def error_type(self, location):
+        value = self.wb.get_cell_value("Sheet1", location)
+        self.assertIsInstance(value, CellError)
+        return value.get_type()
+
+    def test_errors_are_shared(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "#REF!")
+        for i in range(2, 6):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", f"=A{i - 1} + 1")
+        errors = [self.wb.get_cell_value("Sheet1", f"A{i}") for i in range(2, 6)]
+        self.assertTrue(all(error is errors[0] for error in errors))
+        self.assertIs(errors[0], CellError.shared(CellErrorType.BAD_REFERENCE))
+        self.assertEqual(errors[0].get_detail(), "Invalid reference")
+        self.assertIsNot(CellError.shared(CellErrorType.BAD_REFERENCE, "other"), errors[0])
+
+    def test_error_precedence(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "#REF!")
+        self.wb.set_cell_contents("Sheet1", "A2", "#CIRCREF!")
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1 * 1/0")
+        self.wb.set_cell_contents("Sheet1", "B2", "=1/0 + A1")
+        self.wb.set_cell_contents("Sheet1", "B3", "=A1 + A2")
+        self.wb.set_cell_contents("Sheet1", "B4", "=-(A1 & A2)")
+        self.assertEqual(self.error_type("B1"), CellErrorType.BAD_REFERENCE)
+        self.assertEqual(self.error_type("B2"), CellErrorType.DIVIDE_BY_ZERO)
+        self.assertEqual(self.error_type("B3"), CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(self.error_type("B4"), CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_error_literals_and_error_text(self):
+        # Error literals are case-insensitive, and text that reads as an
+        # error is one.
+        self.wb.set_cell_contents("Sheet1", "A1", "'#VALUE!")
+        self.wb.set_cell_contents("Sheet1", "B1", "=\"a\" & #div/0!")
+        self.wb.set_cell_contents("Sheet1", "B2", "=A1 * 2")
+        self.wb.set_cell_contents("Sheet1", "B3", "=\"#RE\" & \"F!\"")
+        self.wb.set_cell_contents("Sheet1", "B4", "=MIN(2, #ref!)")
+        self.assertEqual(self.error_type("B1"), CellErrorType.DIVIDE_BY_ZERO)
+        self.assertEqual(self.error_type("B2"), CellErrorType.TYPE_ERROR)
+        self.assertEqual(self.error_type("B3"), CellErrorType.BAD_REFERENCE)
+        self.assertEqual(self.error_type("B4"), CellErrorType.BAD_REFERENCE)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import context
+import unittest
+import random
+from decimal import Decimal
+from sheets import Workbook
+from sheets.cell_error_type import CellError, CellErrorType
+from sheets.formula_evaluator import FormulaEvaluator
+from sheets.formula_optimizer import optimize
+from sheets.formula_parser import FormulaParser
+from test_formula_parser import random_formulas
+
+
+def parse(formula):
+    refs, tree, error = FormulaParser().parse_formula(formula)
+    assert error is None, formula
+    return tree
+
+
+def chain_formulas(count, seed=0):
+    # Chains of one operator over a mix of constants and cells holding
+    # numbers, text, errors or nothing.
+    operands = ["1", "2.5", "0", "\"x\"", "\"#RE\"", "\"F!\"", "\"\"", "#REF!", "#CIRCREF!",
+                "#DIV/0!", "A1", "A2", "A3", "A4", "A5", "A6", "(A1+1)", "SUM(A1, 2)"]
+    rng = random.Random(seed)
+    formulas = []
+    for _ in range(count):
+        ops = rng.choice([["+", "-"], ["*", "/"], ["&"]])
+        terms = [rng.choice(operands) for _ in range(rng.randint(2, 6))]
+        formula = terms[0]
+        for term in terms[1:]:
+            formula += rng.choice(ops) + term
+        formulas.append("=" + formula)
+    return formulas
+
+
+class TestFormulaOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("My Sheet")
+        for location, contents in [("A1", "5"), ("A2", "'text"), ("A3", "#REF!"),
+                                   ("A4", "=1/0"), ("A5", "'12"), ("B2", "'#VALUE!")]:
+            self.wb.set_cell_contents("Sheet1", location, contents)
+        self.evaluator = FormulaEvaluator(self.wb, "Sheet1")
+
+    def result(self, tree):
+        value = self.evaluator.evaluate(tree)
+        if isinstance(value, CellError):
+            return value.get_type()
+        return value
+
+    def test_same_values(self):
+        formulas = chain_formulas(3000) + random_formulas(3000, seed=2)
+        for formula in formulas:
+            refs, tree, error = FormulaParser().parse_formula(formula)
+            if error:
+                continue
+            self.assertEqual(self.result(optimize(tree)), self.result(tree), formula)
+
+    def test_constant_folding(self):
+        self.assertEqual(optimize(parse("=(1+2)*-3")), ('const', Decimal('-9')))
+        self.assertEqual(optimize(parse("=SUM(1, 2) & \"x\"")), ('const', '3x'))
+        self.assertEqual(optimize(parse("=\"#RE\" & \"F!\"")), ('const', CellErrorType.BAD_REFERENCE))
+        self.assertEqual(optimize(parse("=FOO(1)")), ('const', CellErrorType.BAD_NAME))
+        # Only a leading run of constants is combined.
+        tree = parse("=1 + 2 + A1 + 3 + 4")
+        cell = tree[2][2][3]
+        self.assertEqual(optimize(tree),
+                         ('add_n', ('const', Decimal('3')),
+                          (('+', cell), ('+', ('const', Decimal('3'))), ('+', ('const', Decimal('4'))))))
+
+    def test_chains_are_flattened(self):
+        tree = optimize(parse("=" + "+".join(f"A{i}" for i in range(1, 3001))))
+        self.assertEqual(tree[0], 'add_n')
+        self.assertEqual(len(tree[2]), 2999)
+        tree = optimize(parse("=" + "&".join(["\"a\""] + [f"C{i}" for i in range(1, 3001)])))
+        self.assertEqual(tree[0], 'concat_n')
+
+    def test_long_chains_evaluate(self):
+        for i in range(1, 2001):
+            self.wb.set_cell_contents("My Sheet", f"A{i}", str(i))
+        self.wb.set_cell_contents("Sheet1", "C1", "=" + "+".join(f"'My Sheet'!A{i}" for i in range(1, 2001)))
+        self.wb.set_cell_contents("Sheet1", "C2", "=" + "&".join(f"'My Sheet'!A{i}" for i in range(1, 2001)))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "C1"), Decimal(2001000))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "C2"), "".join(str(i) for i in range(1, 2001)))
+
+    def test_single_reference_flag(self):
+        for formula, single in [("=A1", True), ("='My Sheet'!A1", True), ("=(A1)", False),
+                                ("=A1:A2", False), ("=1", False)]:
+            self.wb.set_cell_contents("Sheet1", "D1", formula)
+            self.assertEqual(self.wb._get_cell("Sheet1", "D1").single_ref, single, formula)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import context
+import unittest
+import random
+from collections import Counter
+from decimal import Decimal
+from sheets import Workbook
+from sheets.lark_parser import LarkParser
+from sheets.formula_parser import FormulaParser, parse_number, find_references
+from sheets.formula_constructer import formula_tree_to_string, formula_ast_to_string
+from sheets.formula_evaluator import FormulaEvaluator
+from sheets.cell_error_type import CellError
+import test_lark_parser
+
+
+def tuple_tree(tree):
+    # The tuple tree FormulaParser should give for a lark tree of LarkParser.
+    children = tree.children
+    if tree.data == 'number':
+        return ('number', str(children[0]), parse_number(children[0]))
+    if tree.data == 'string':
+        return ('string', str(children[0])[1:-1])
+    if tree.data == 'error':
+        return ('error', str(children[0]))
+    if tree.data == 'parens':
+        return ('parens', tuple_tree(children[0]))
+    if tree.data == 'cell':
+        return ('cell', str(children[0]) if len(children) == 2 else None, str(children[-1]))
+    if tree.data == 'cell_range':
+        return ('range', str(children[0]) if len(children) == 3 else None,
+                str(children[-2]), str(children[-1]))
+    if tree.data == 'function':
+        return ('function', str(children[0]), tuple(tuple_tree(arg) for arg in children[1:]))
+    if tree.data == 'unary_op':
+        return ('unary', str(children[0]), tuple_tree(children[1]))
+    if tree.data == 'concat_expr':
+        return ('concat', tuple_tree(children[0]), tuple_tree(children[1]))
+    name = {'add_expr': 'add', 'mul_expr': 'mul'}[tree.data]
+    return (name, str(children[1]), tuple_tree(children[0]), tuple_tree(children[2]))
+
+
+def random_formulas(count, seed=0):
+    pieces = ["A1", "b2", "Sheet1!", "_s!", "'My Sheet'!", "SUM(", "IF(", "A1(", ":", "1",
+              "2.5", ".5", "\"s\"", "#REF!", "#div/0!", "(", ")", "+", "-", "*", "/", "&",
+              ",", " ", "!", "x", "="]
+    rng = random.Random(seed)
+    return ["=" + "".join(rng.choice(pieces) for _ in range(rng.randint(1, 8)))
+            for _ in range(count)]
+
+
+class TestFormulaParser(unittest.TestCase):
+    """
+    FormulaParser is checked against LarkParser, the reference implementation.
+    """
+
+    def setUp(self):
+        self.parser = FormulaParser()
+        self.reference = LarkParser()
+
+    def assertSameParse(self, formula):
+        refs, tree, error = self.parser.parse_formula(formula)
+        reference_refs, reference_tree, reference_error = self.reference.parse_formula(formula)
+        self.assertEqual(error, reference_error, formula)
+        if error:
+            self.assertIsNone(tree)
+            return
+        self.assertEqual(tree, tuple_tree(reference_tree), formula)
+        # The lark visitor finds references in a different order.
+        self.assertEqual(Counter(refs), Counter(reference_refs), formula)
+        self.assertEqual(Counter(self.parser.ranges),
+                         Counter(self.reference.cell_ref_finder.ranges), formula)
+        self.assertEqual((refs, self.parser.ranges), find_references(tree), formula)
+        self.assertEqual(formula_ast_to_string(tree), formula_tree_to_string(reference_tree))
+
+    def test_same_as_lark(self):
+        for formula in test_lark_parser.TestParserModes.FORMULAS:
+            self.assertSameParse(formula)
+
+    def test_same_as_lark_on_random_formulas(self):
+        for formula in random_formulas(5000):
+            self.assertSameParse(formula)
+
+    def test_tree_and_references(self):
+        refs, tree, error = self.parser.parse_formula("=SUM(A1:b2, 'S 2'!C3) & -x1")
+        self.assertEqual(error, "#ERROR!")
+        self.assertEqual((refs, self.parser.ranges), (None, []))
+
+        refs, tree, error = self.parser.parse_formula("=Sheet1!A1 * -(2 + b2:C3)")
+        self.assertIsNone(error)
+        self.assertEqual(tree, ('mul', '*', ('cell', 'Sheet1', 'A1'),
+                                ('unary', '-', ('parens', ('add', '+', ('number', '2', Decimal('2')),
+                                                           ('range', None, 'b2', 'C3'))))))
+        self.assertEqual(refs, [('SHEET1', 'A1')])
+        self.assertEqual(self.parser.ranges, [('B2', 'C3')])
+
+    def test_deep_nesting(self):
+        # Far deeper than Python's recursion limit.
+        evaluator = FormulaEvaluator(None, "Sheet1")
+        refs, tree, error = self.parser.parse_formula("=" + "(" * 10000 + "1" + ")" * 10000)
+        self.assertIsNone(error)
+        self.assertEqual(evaluator.evaluate(tree), Decimal(1))
+        refs, tree, error = self.parser.parse_formula("=" + "-(" * 5001 + "2" + ")" * 5001)
+        self.assertIsNone(error)
+        self.assertEqual(evaluator.evaluate(tree), Decimal(-2))
+        refs, tree, error = self.parser.parse_formula("=" + "MIN(1, " * 5000 + "3" + ")" * 5000)
+        self.assertIsNone(error)
+        self.assertEqual(evaluator.evaluate(tree), Decimal(1))
+
+    def test_evaluates_like_lark(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("My Sheet")
+        for location, contents in [("A1", "5"), ("B2", "'text"), ("C3", "#REF!"), ("A2", "=1/0")]:
+            wb.set_cell_contents("Sheet1", location, contents)
+        wb.set_cell_contents("My Sheet", "A1", "2")
+
+        def result(value):
+            if isinstance(value, CellError):
+                return value.get_type()
+            return value
+
+        for formula in test_lark_parser.TestParserModes.FORMULAS + random_formulas(2000, seed=1):
+            _, tree, error = self.parser.parse_formula(formula)
+            if error:
+                continue
+            _, reference_tree, _ = self.reference.parse_formula(formula)
+            evaluator = FormulaEvaluator(wb, "Sheet1")
+            self.assertEqual(result(evaluator.evaluate(tree)),
+                             result(evaluator.evaluate(reference_tree)), formula)
+
+
+if __name__ == '__main__':
+    unittest.main()
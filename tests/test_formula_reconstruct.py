@@ -2,7 +2,7 @@ import context
 import unittest
 
 from sheets.lark_parser import LarkParser
-from sheets.formula_constructer import FormulaReconstructor
+from sheets.formula_constructer import FormulaReconstructor, formula_tree_to_string
 
 class TestFormulaReconstructor(unittest.TestCase):
     def test_reconstruct_formula(self):
@@ -55,5 +55,16 @@ class TestFormulaReconstructor(unittest.TestCase):
         formula = reconstructor.reconstruct_formula(tree)
         self.assertEqual(formula.replace(" ", ""), formula.replace(" ", ""))
 
+    def test_tree_to_string_matches_reconstructor(self):
+        reconstructor = FormulaReconstructor()
+        formulas = ["=A1 + B2 * C3", "=((A1 + B2) * C3) / D4", "=-A1", "=+(3)",
+                    "='Sheet 1'!A1 & \"a b\" & Sheet2!b2", "=#REF! + 1.50",
+                    "=\"x\"&(A1&\"y\")", "=1--2", "=SUM(A1:B2, 'S 2'!c3:D4) / count(A1)",
+                    "=max(Sheet1!A1:A9)&Sheet1!A1"]
+        for formula in formulas:
+            _, tree, _ = LarkParser().parse_formula(formula)
+            self.assertEqual("=" + formula_tree_to_string(tree),
+                             reconstructor.reconstruct_formula(tree))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,85 @@
+import context
+import gc
+import unittest
+from unittest import mock
+from decimal import Decimal
+from sheets import Workbook
+from sheets.formula_parser import FormulaParser
+from sheets.formula_table import formula_count, intern_formula
+
+
+class TestFormulaTable(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+
+    def formula(self, location):
+        return self.wb._get_cell("Sheet1", location).formula
+
+    def test_filled_formulas_are_shared(self):
+        for row in range(1, 101):
+            self.wb.set_cell_contents("Sheet1", f"A{row}", str(row))
+            self.wb.set_cell_contents("Sheet1", f"B{row}", f"=A{row}*2 + SUM(A{row}:A{row + 1})")
+        self.assertIs(self.formula("B1"), self.formula("B100"))
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "B37"), "=A37*2 + SUM(A37:A38)")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B3"), Decimal(13))
+        self.assertEqual(self.wb._get_cell("Sheet1", "B3").refs, [('A3',)])
+
+        # Filled across, and not filled at all.
+        self.wb.set_cell_contents("Sheet1", "C1", "=B1*2 + SUM(B1:B2)")
+        self.assertIs(self.formula("C1"), self.formula("B1"))
+        self.wb.set_cell_contents("Sheet1", "C2", "=A1*2 + SUM(A1:A2)")
+        self.assertIsNot(self.formula("C2"), self.formula("B2"))
+
+    def test_filled_formulas_take_one_entry(self):
+        gc.collect()
+        count = formula_count()
+        for row in range(1, 1001):
+            self.wb.set_cell_contents("Sheet1", f"B{row}", f"=A{row} + C{row + 1}")
+        self.assertEqual(formula_count(), count + 1)
+        # The entry goes with the last cell using it.
+        for row in range(1, 1001):
+            self.wb.set_cell_contents("Sheet1", f"B{row}", None)
+        self.assertEqual(formula_count(), count)
+
+    def test_text_is_kept_exactly(self):
+        for text in ["=a1 +  Sheet1!b2", "='My Sheet'!A1:B2 & \"A1\"", "=aB1+C1", "=sum(A1)"]:
+            self.wb.set_cell_contents("Sheet1", "D5", text)
+            self.wb.set_cell_contents("Sheet1", "E9", text)
+            self.assertEqual(self.wb.get_cell_contents("Sheet1", "D5"), text)
+            self.assertEqual(self.wb.get_cell_contents("Sheet1", "E9"), text)
+        # A reference in mixed case pins the formula to its cell.
+        self.wb.set_cell_contents("Sheet1", "D5", "=aB1+C1")
+        self.wb.set_cell_contents("Sheet1", "D6", "=aB2+C2")
+        self.assertIsNot(self.formula("D5"), self.formula("D6"))
+        self.assertIs(intern_formula("=a2 +  Sheet1!b3", (5, 3)),
+                      intern_formula("=a1 +  Sheet1!b2", (4, 3)))
+        self.assertIsNone(intern_formula("=A1+", (0, 0)))
+
+    def test_rename_shared_formula(self):
+        self.wb.new_sheet("Data")
+        for row in range(1, 11):
+            self.wb.set_cell_contents("Data", f"A{row}", str(row))
+            self.wb.set_cell_contents("Sheet1", f"A{row}", f"=Data!A{row} + data!A{row + 1}")
+        # The renamed formula is built from the renamed tree, not parsed again.
+        with mock.patch.object(FormulaParser, 'parse_formula') as parse_formula:
+            self.wb.rename_sheet("Data", "My Data")
+        parse_formula.assert_not_called()
+        self.assertIs(self.formula("A1"), self.formula("A10"))
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "A4"), "='My Data'!A4+'My Data'!A5")
+        self.wb.set_cell_contents("My Data", "A5", "50")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A4"), Decimal(54))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A5"), Decimal(56))
+
+    def test_edit_leaves_other_cells(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "B2", "=A2+1")
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1+2")
+        self.wb.set_cell_contents("Sheet1", "A2", "1")
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "B2"), "=A2+1")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B2"), Decimal(2))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B1"), Decimal(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
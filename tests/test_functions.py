@@ -0,0 +1,267 @@
+import context
+import unittest
+import unittest.mock
+from decimal import Decimal
+from sheets import Workbook, CellError, CellErrorType
+from sheets.column_buffers import ColumnBuffers, NUMBER, STRING, ERROR, EMPTY
+from sheets.functions import RangeArgument, IncrementalAggregate, call_function
+
+
+class TestColumnBuffers(unittest.TestCase):
+    def test_store_and_slices(self):
+        columns = ColumnBuffers()
+        columns.store((2, 1), Decimal(3))
+        columns.store((0, 1), "x")
+        columns.store((1, 3), CellError(CellErrorType.BAD_REFERENCE, ""))
+        columns.store((50, 7), None)
+        self.assertNotIn(7, columns.values)
+
+        slices = columns.get_slices(0, 0, 5, 5)
+        self.assertEqual(len(slices), 2)
+        values, kinds = slices[0]
+        self.assertEqual(values, ["x", None, Decimal(3)])
+        self.assertEqual(list(kinds), [STRING, EMPTY, NUMBER])
+        self.assertEqual(list(slices[1][1]), [EMPTY, ERROR])
+
+        columns.store((2, 1), None)
+        self.assertEqual(columns.get_slices(1, 1, 2, 1)[0][1], bytearray([EMPTY, EMPTY]))
+
+
+class TestFunctionSemantics(unittest.TestCase):
+    def range_arg(self, *columns):
+        buffers = ColumnBuffers()
+        for col, column in enumerate(columns):
+            for row, value in enumerate(column):
+                buffers.store((row, col), value)
+        return RangeArgument(buffers.get_slices(0, 0, 100, len(columns) - 1))
+
+    def test_first_error_is_row_major(self):
+        ref = CellError(CellErrorType.BAD_REFERENCE, "")
+        div = CellError(CellErrorType.DIVIDE_BY_ZERO, "")
+        arg = self.range_arg([Decimal(1), None, ref], [Decimal(2), div])
+        self.assertEqual(call_function("SUM", [arg]), "#DIV/0!")
+        self.assertEqual(call_function("SUM", ["#NAME?", arg]), "#NAME?")
+        # Errors win over text that isn't a number.
+        self.assertEqual(call_function("MAX", ["abc", arg]), "#DIV/0!")
+        self.assertEqual(call_function("COUNT", [arg, "#REF!"]), Decimal(2))
+
+    def test_text(self):
+        arg = self.range_arg([Decimal(1), "2.5", None])
+        self.assertEqual(call_function("SUM", [arg]), Decimal('3.5'))
+        self.assertEqual(call_function("COUNT", [arg]), Decimal(1))
+        self.assertEqual(call_function("SUM", [self.range_arg(["two"])]), "#VALUE!")
+        self.assertEqual(call_function("MIN", [Decimal(1), "nan"]), "#VALUE!")
+
+    def test_empty(self):
+        self.assertEqual(call_function("SUM", [None]), Decimal(0))
+        self.assertEqual(call_function("MIN", [self.range_arg([None])]), Decimal(0))
+        self.assertEqual(call_function("AVERAGE", [None]), "#DIV/0!")
+        self.assertEqual(call_function("nope", [None]), "#NAME?")
+
+
+class TestAggregateFunctions(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("Sheet2")
+        for i in range(1, 11):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", str(i))
+
+    def tearDown(self):
+        del self.wb
+
+    def value(self, location, sheet="Sheet1"):
+        return self.wb.get_cell_value(sheet, location)
+
+    def test_aggregates(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A10)")
+        self.wb.set_cell_contents("Sheet1", "B2", "=Average(A10:A1)")
+        self.wb.set_cell_contents("Sheet1", "B3", "=min(A3:A10) + MAX(A1:A4)")
+        self.wb.set_cell_contents("Sheet1", "B4", "=COUNT(A1:A20, 1, \"x\")")
+        self.wb.set_cell_contents("Sheet1", "B5", "=SUM(A1, A2:A3, 100) * 2")
+        self.assertEqual(self.value("B1"), Decimal(55))
+        self.assertEqual(self.value("B2"), Decimal('5.5'))
+        self.assertEqual(self.value("B3"), Decimal(7))
+        self.assertEqual(self.value("B4"), Decimal(11))
+        self.assertEqual(self.value("B5"), Decimal(212))
+
+    def test_range_changes_propagate(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A10)")
+        self.wb.set_cell_contents("Sheet1", "C1", "=B1 + 1")
+        changed = []
+        self.wb.notify_cells_changed(lambda wb, cells: changed.extend(cells))
+
+        self.wb.set_cell_contents("Sheet1", "A5", "105")
+        self.assertEqual(self.value("C1"), Decimal(156))
+        self.assertEqual(changed, [("Sheet1", "A5"), ("Sheet1", "B1"), ("Sheet1", "C1")])
+
+        self.wb.set_cell_contents("Sheet1", "A5", "oops")
+        self.assertEqual(self.value("C1").get_type(), CellErrorType.TYPE_ERROR)
+        self.wb.set_cell_contents("Sheet1", "A5", "=1/0")
+        self.assertEqual(self.value("B1").get_type(), CellErrorType.DIVIDE_BY_ZERO)
+        self.wb.set_cell_contents("Sheet1", "A5", None)
+        self.assertEqual(self.value("B1"), Decimal(50))
+
+    def test_cross_sheet_and_bad_ranges(self):
+        self.wb.set_cell_contents("Sheet2", "A1", "=MAX(Sheet1!A1:B10)")
+        self.assertEqual(self.value("A1", "Sheet2"), Decimal(10))
+        self.wb.set_cell_contents("Sheet2", "A2", "=SUM(Missing!A1:B10)")
+        self.assertEqual(self.value("A2", "Sheet2").get_type(), CellErrorType.BAD_REFERENCE)
+        self.wb.set_cell_contents("Sheet2", "A3", "=SUM(A1:A10000)")
+        self.assertEqual(self.value("A3", "Sheet2").get_type(), CellErrorType.BAD_REFERENCE)
+
+        self.wb.new_sheet("Missing")
+        self.wb.set_cell_contents("Missing", "B3", "4")
+        self.assertEqual(self.value("A2", "Sheet2"), Decimal(4))
+
+    def test_unknown_function(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=VLOOKUP(A1)")
+        self.assertEqual(self.value("B1").get_type(), CellErrorType.BAD_NAME)
+
+    def test_function_in_cycle(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A3)")
+        self.wb.set_cell_contents("Sheet1", "A2", "=B1")
+        self.assertEqual(self.value("B1").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(self.value("A2").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_copy_and_rename(self):
+        self.wb.set_cell_contents("Sheet2", "A1", "=SUM(Sheet1!A1:A3, A2:A3)")
+        self.wb.set_cell_contents("Sheet2", "A2", "10")
+        self.wb.rename_sheet("Sheet1", "Data")
+        self.assertEqual(self.wb.get_cell_contents("Sheet2", "A1"), "=SUM(Data!A1:A3,A2:A3)")
+        self.wb.copy_sheet("Sheet2")
+        self.wb.set_cell_contents("Sheet2_1", "A3", "5")
+        self.assertEqual(self.value("A1", "Sheet2_1"), Decimal(21))
+        self.assertEqual(self.value("A1", "Sheet2"), Decimal(16))
+
+    def test_lazy_mode(self):
+        wb = Workbook(eval_mode='lazy')
+        wb.new_sheet("Sheet1")
+        for i in range(1, 6):
+            wb.set_cell_contents("Sheet1", f"A{i}", f"={i}*2")
+        wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A5)")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(30))
+        wb.set_cell_contents("Sheet1", "A3", "=100")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(124))
+
+
+class TestIncrementalAggregates(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        for i in range(1, 11):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", str(i))
+
+    def tearDown(self):
+        del self.wb
+
+    def value(self, location, sheet="Sheet1"):
+        return self.wb.get_cell_value(sheet, location)
+
+    def test_state(self):
+        columns = ColumnBuffers()
+        for row in range(3):
+            columns.store((row, 0), Decimal(row + 1))
+        total = IncrementalAggregate('SUM')
+        self.assertEqual(total.reset([RangeArgument(columns.get_slices(0, 0, 9, 0))]), Decimal(6))
+        total.apply(Decimal(2), Decimal(20))
+        total.apply(None, Decimal(4))
+        self.assertEqual(total.result(), Decimal(28))
+        total.apply(Decimal(4), "x")
+        self.assertFalse(total.valid)
+
+        count = IncrementalAggregate('COUNT')
+        count.reset([RangeArgument(columns.get_slices(0, 0, 9, 0))])
+        count.apply(Decimal(1), "x")
+        count.apply(None, CellError(CellErrorType.TYPE_ERROR, ""))
+        self.assertTrue(count.valid)
+        self.assertEqual(count.result(), Decimal(2))
+
+        average = IncrementalAggregate('AVERAGE')
+        self.assertEqual(average.reset([RangeArgument([])]), "#DIV/0!")
+        self.assertTrue(average.valid)
+        average.apply(None, Decimal(3))
+        self.assertEqual(average.result(), Decimal(3))
+        self.assertEqual(average.reset(["#REF!"]), "#REF!")
+        self.assertFalse(average.valid)
+
+    def test_edits_skip_reading_ranges(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A10)")
+        self.wb.set_cell_contents("Sheet1", "B2", "=AVERAGE(A1:A10, A1:A2)")
+        self.wb.set_cell_contents("Sheet1", "B3", "=COUNT(A1:A20)")
+        with unittest.mock.patch.object(self.wb, '_get_range_columns',
+                                        wraps=self.wb._get_range_columns) as read:
+            self.wb.set_cell_contents("Sheet1", "A2", "12")
+            self.wb.set_cell_contents("Sheet1", "A15", "-1")
+            self.wb.set_cell_contents("Sheet1", "A3", None)
+            read.assert_not_called()
+        self.assertEqual(self.value("B1"), Decimal(62))
+        self.assertEqual(self.value("B2"), Decimal(75) / 11)
+        self.assertEqual(self.value("B3"), Decimal(10))
+
+    def test_results_match_a_full_computation(self):
+        contents = {"A1": "1.5", "A2": "1", "A3": "=0.25*4", "A4": "-2.75"}
+        edits = [("A1", "1"), ("A4", "3"), ("A3", "2.5"), ("A3", None), ("A1", "=2-0.5")]
+        formulas = {"B1": "=SUM(A1:A4)", "B2": "=AVERAGE(A1:A4)", "C1": "=B1&\"\"",
+                    "C2": "=B2&\"\""}
+        for location, text in list(contents.items()) + list(formulas.items()):
+            self.wb.set_cell_contents("Sheet1", location, text)
+        for location, text in edits:
+            self.wb.set_cell_contents("Sheet1", location, text)
+            contents[location] = text
+            fresh = Workbook()
+            fresh.new_sheet("Sheet1")
+            for cell, cell_text in list(contents.items()) + list(formulas.items()):
+                fresh.set_cell_contents("Sheet1", cell, cell_text)
+            for cell in formulas:
+                self.assertEqual(repr(self.value(cell)), repr(fresh.get_cell_value("Sheet1", cell)),
+                                 (location, text, cell))
+
+    def test_total_stays_exact(self):
+        # Adding and removing 10 would round away the last digit of 20/7.
+        self.wb.set_cell_contents("Sheet1", "A1", "=20/7")
+        self.wb.set_cell_contents("Sheet1", "A2", None)
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A2)")
+        self.wb.set_cell_contents("Sheet1", "A2", "10")
+        self.wb.set_cell_contents("Sheet1", "A2", None)
+        self.assertEqual(self.value("B1"), self.value("A1"))
+
+        # 1 + 1E29 has more digits than a Decimal keeps.
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "1E29")
+        self.wb.set_cell_contents("Sheet1", "A2", "0")
+        self.wb.set_cell_contents("Sheet1", "B2", "=A1+A2")
+        self.assertEqual(self.value("B1"), Decimal(1))
+        self.assertEqual(self.value("B2"), Decimal(1))
+
+    def test_fallback_on_text_and_errors(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A10)")
+        self.wb.set_cell_contents("Sheet1", "B2", "=COUNT(A1:A10)")
+        self.wb.set_cell_contents("Sheet1", "A1", "'7")
+        self.assertEqual(self.value("B1"), Decimal(61))
+        self.assertEqual(self.value("B2"), Decimal(9))
+        self.wb.set_cell_contents("Sheet1", "A1", "=#REF!")
+        self.assertEqual(self.value("B1").get_type(), CellErrorType.BAD_REFERENCE)
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.assertEqual(self.value("B1"), Decimal(55))
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1 * 10")
+        self.assertEqual(self.value("B1"), Decimal(63))
+        self.assertEqual(self.value("B2"), Decimal(10))
+
+    def test_formula_change_and_deleted_sheet(self):
+        wb = Workbook(eval_mode='lazy')
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("Data")
+        wb.set_cell_contents("Data", "A1", "5")
+        wb.set_cell_contents("Sheet1", "A1", "=SUM(Data!A1:A5)")
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(5))
+        wb.del_sheet("Data")
+        wb.new_sheet("Data")
+        wb.set_cell_contents("Data", "A2", "2")
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(2))
+        wb.set_cell_contents("Sheet1", "A1", "=COUNT(Data!A1:A5)")
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import context
+import unittest
+import random
+from decimal import Decimal
+from sheets import Workbook
+from sheets.cell import Cell
+from sheets.workbook_utility import pack_node, parse_cell_location_string
+
+
+class TestGarbageCollection(unittest.TestCase):
+    def node(self, wb, sheet_name, location):
+        return pack_node(wb._get_sheet(sheet_name).sheet_id, parse_cell_location_string(location))
+
+    def sizes(self, wb):
+        return (len(wb.graph.graph),
+                sum(len(wb._get_sheet(name).cell_map) for name in wb.list_sheets()))
+
+    def test_references_are_reclaimed(self):
+        for mode in ('eager', 'lazy'):
+            wb = Workbook(mode)
+            wb.new_sheet("Sheet1")
+            wb.new_sheet("Data")
+            wb.set_cell_contents("Sheet1", "A1", "1")
+            before = self.sizes(wb)
+
+            wb.set_cell_contents("Sheet1", "B1", "=A1 + Z99 + Data!C7 + Other!A1 + SUM(D1:D9)")
+            wb.set_cell_contents("Sheet1", "B2", "=Z99 * 2")
+            self.assertEqual(wb.get_cell_value("Sheet1", "B2"), Decimal(0))
+            self.assertEqual(wb.get_cell_value("Sheet1", "B1").get_type().name, 'BAD_REFERENCE')
+            wb.set_cell_contents("Sheet1", "B1", None)
+            # Z99 is still referenced by B2.
+            self.assertTrue(wb.graph.is_in_graph(self.node(wb, "Sheet1", "Z99")))
+            self.assertFalse(wb.graph.is_in_graph(self.node(wb, "Data", "C7")))
+            wb.set_cell_contents("Sheet1", "B2", "")
+            # B2 itself stays, since the extent still counts it.
+            self.assertEqual(self.sizes(wb), (before[0] + 1, before[1] + 1), mode)
+            self.assertEqual(wb.get_sheet_extent("Sheet1"), (2, 2))
+            self.assertEqual(wb.compact(), 0)
+
+            # The reclaimed cells work like cells that were never used.
+            wb.set_cell_contents("Sheet1", "B1", "=Z99 + A1")
+            wb.set_cell_contents("Sheet1", "Z99", "5")
+            self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(6))
+            self.assertEqual(wb.get_sheet_extent("Sheet1"), (26, 99))
+            wb.set_cell_contents("Sheet1", "Z99", None)
+            self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(1))
+            self.assertEqual(wb.get_sheet_extent("Sheet1"), (2, 2))
+
+    def test_cleared_cell_in_a_range(self):
+        for mode in ('eager', 'lazy'):
+            wb = Workbook(mode)
+            wb.new_sheet("Sheet1")
+            wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A2)")
+            wb.set_cell_contents("Sheet1", "A2", "5")
+            self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(5))
+            # A2 is reclaimed, but B1 still has to see it go.
+            wb.set_cell_contents("Sheet1", "A2", None)
+            self.assertIsNone(wb._get_cell("Sheet1", "A2"))
+            self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(0), mode)
+
+    def test_extent_and_saved_contents_are_unchanged(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        # A cell set to nothing where no cell was still counts in the extent.
+        wb.set_cell_contents("Sheet1", "C5", None)
+        wb.set_cell_contents("Sheet1", "A1", "=D14")
+        wb.set_cell_contents("Sheet1", "D14", "=D15")
+        self.assertEqual(wb.compact(), 0)
+        self.assertEqual(wb.get_sheet_extent("Sheet1"), (3, 5))
+        wb.set_cell_contents("Sheet1", "D15", "1")
+        wb.set_cell_contents("Sheet1", "D15", None)
+        wb.set_cell_contents("Sheet1", "D14", None)
+        wb.set_cell_contents("Sheet1", "A1", None)
+        self.assertIsNone(wb._get_cell("Sheet1", "D15"))
+        self.assertEqual(wb.get_sheet_extent("Sheet1"), (3, 5))
+        self.assertEqual(wb._get_sheet("Sheet1").serialize(), {})
+
+    def test_compact_sweeps_everything(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "=B1")
+        sheet = wb._get_sheet("Sheet1")
+        sheet.add_cell((5, 5), Cell(None, (5, 5)), is_implicit=True)
+        wb.graph.add_node(pack_node(sheet.sheet_id, (5, 5)))
+        wb.graph.add_node(pack_node(sheet.sheet_id, (6, 6)))
+        self.assertEqual(wb.compact(), 2)
+        self.assertEqual(self.sizes(wb), (2, 1))
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal(0))
+
+    def test_sizes_stay_flat(self):
+        rng = random.Random(1)
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("Data")
+        sizes = []
+        for step in range(3000):
+            location = f"A{rng.randint(1, 20)}"
+            if rng.random() < 0.3:
+                wb.set_cell_contents("Sheet1", location, None)
+            else:
+                refs = [f"{rng.choice(['', 'Data!'])}{rng.choice('BCDEFG')}{rng.randint(1, 9999)}"
+                        for _ in range(3)]
+                wb.set_cell_contents("Sheet1", location, "=" + " + ".join(refs))
+            if step % 1000 == 999:
+                sizes.append(self.sizes(wb))
+        self.assertEqual(wb.compact(), 0)
+        for graph_nodes, cells in sizes:
+            self.assertLessEqual(graph_nodes, 20 * 4)
+            self.assertLessEqual(cells, 20 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
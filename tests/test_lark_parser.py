@@ -1,7 +1,8 @@
 import unittest, context
+import random
 from decimal import Decimal
 from sheets.cell import Cell
-from sheets.lark_parser import LarkParser
+from sheets.lark_parser import LarkParser, get_lark_parser
 
 class TestLarkParser(unittest.TestCase):
 
@@ -23,6 +24,20 @@ class TestLarkParser(unittest.TestCase):
         self.assertIsNone(error)
         self.assertEqual(refs, [('A1', ), ('B2', )])
 
+    def test_parse_range(self):
+        formula = "=A1:b10 + 'My Sheet'!C3:A1"
+        refs, tree, error = self.parser.parse_formula(formula)
+        self.assertIsNone(error)
+        self.assertEqual(refs, [])
+        self.assertEqual(self.parser.cell_ref_finder.ranges, [('A1', 'B10'), ("'MY SHEET'", 'C3', 'A1')])
+
+        cell = Cell("=Sheet1!A1:A3 & B1")
+        self.assertEqual(cell.refs, [('B1',)])
+        self.assertEqual(cell.range_refs, [('SHEET1', 'A1', 'A3')])
+
+        refs, tree, error = LarkParser().parse_formula("=A1:Sheet2!B2")
+        self.assertEqual(error, "#ERROR!")
+
     def test_parse_formula_cross_sheet(self):
         formula = "=Sheet1!Z20+Sheet2!AA299 - sHeEt3!dd88"
         refs, tree, error = self.parser.parse_formula(formula)
@@ -62,5 +77,67 @@ class TestLarkParser(unittest.TestCase):
         self.assertIsNone(refs)
         self.assertIsNone(tree)
 
+    def test_parser_is_shared(self):
+        self.assertIs(LarkParser().parser, self.parser.parser)
+        self.parser.parse_formula("=A1:A2 + B1")
+        refs, tree, error = self.parser.parse_formula("=C1")
+        self.assertEqual(refs, [('C1', )])
+        self.assertEqual(self.parser.cell_ref_finder.ranges, [])
+        with self.assertRaises(ValueError):
+            LarkParser('cyk')
+
+
+class TestParserModes(unittest.TestCase):
+    """
+    The LALR parser must give exactly the trees (or errors) the Earley parser
+    gives for the same grammar.
+    """
+    FORMULAS = [
+        "=1", "=.5", "=1.", "=A1", "=a1", "=-A1", "=+3", "=A1+B2-C3", "=A1*B2/C3",
+        "=A1+B2*C3", "=(A1+B2)*C3", "=((1))", "=-(A1*2)", "=\"text\"", "=\"\"",
+        "=#REF!", "=#div/0!", "=#CIRCREF! + 1", "=Sheet1!A1", "=sheet_2!ZZ99",
+        "=_hidden!A1", "='My Sheet'!C3", "='a''b'!A1", "=Sheet1 ! A1",
+        "=A1:B10", "=Sheet1!A1:B10", "='My Sheet'!C3:A1", "=SUM(A1:A10)",
+        "=SUM(A1:A10, 5)", "=sum (A1, b2)", "=IF(A1, B1, C1)", "=IF(A1, SUM(B1:B3), -C1)",
+        "=A1(2)", "=A1!B2", "=SUM!A1", "=A1 & B1", "=A1 & \"x\" & Sheet2!B2",
+        "=(A1+1) & B1", "=SUM(A1 & B1, 2)", "=VERSION()",
+        # Not formulas
+        "=", "=A1+", "=++A1", "=A1+B1&C1", "=A1&-B1", "=Sheet 1!A1", "=A1:Sheet2!B2",
+        "=A0", "=A1B2", "=abc", "=SUM(", "=SUM()", "=SUM(A1,)", "=1e5", "=A1:B2:C3",
+        "=(A1", "=A1)", "=_f(1)", "=#N/A", "=\"open",
+    ]
+
+    def setUp(self):
+        self.lalr = LarkParser('lalr')
+        self.earley = LarkParser('earley')
+
+    def assertSameParse(self, formula):
+        lalr = self.lalr.parse_formula(formula)
+        earley = self.earley.parse_formula(formula)
+        self.assertEqual(lalr, earley, formula)
+        self.assertEqual(self.lalr.cell_ref_finder.ranges, self.earley.cell_ref_finder.ranges, formula)
+
+    def test_modes_give_the_same_trees(self):
+        for formula in self.FORMULAS:
+            self.assertSameParse(formula)
+        self.assertIsNotNone(self.lalr.parse_formula("=SUM(A1:A3, 'S 2'!B2) & C1")[1])
+
+    def test_modes_agree_on_random_formulas(self):
+        # Random strings of formula pieces; most don't parse, and the two modes
+        # must agree on which do.
+        pieces = ["A1", "b2", "Sheet1!", "'My Sheet'!", "SUM(", "IF(", ":", "1", "2.5",
+                  "\"s\"", "#REF!", "(", ")", "+", "-", "*", "/", "&", ",", " ", "!", "_x"]
+        rng = random.Random(0)
+        for _ in range(2000):
+            formula = "=" + "".join(rng.choice(pieces) for _ in range(rng.randint(1, 7)))
+            self.assertSameParse(formula)
+
+    def test_tokens_are_told_apart(self):
+        tree = get_lark_parser().parse("=A1(A1!A1)")
+        self.assertEqual(tree.data, 'function')
+        self.assertEqual(tree.children[0].type, 'FUNCTION_NAME')
+        self.assertEqual([token.type for token in tree.children[1].children],
+                         ['SHEET_NAME', 'CELLREF'])
+
 if __name__ == '__main__':
     unittest.main()
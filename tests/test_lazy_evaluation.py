@@ -0,0 +1,134 @@
+import context
+import unittest
+from decimal import Decimal
+from sheets import Workbook, CellError, CellErrorType
+
+
+class TestLazyEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook(eval_mode='lazy')
+        self.wb.new_sheet("Sheet1")
+        self.called_cells = []
+        self.wb.notify_cells_changed(self.on_cells_changed)
+
+    def tearDown(self):
+        del self.wb
+
+    def on_cells_changed(self, workbook, changed_cells):
+        self.called_cells.extend(changed_cells)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            Workbook(eval_mode='sometimes')
+
+    def test_values_computed_on_read(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "A3", "=A2*10")
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1')])
+
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A3"), Decimal('20'))
+        self.assertEqual(self.called_cells[1:], [('Sheet1', 'A2'), ('Sheet1', 'A3')])
+
+        self.called_cells = []
+        self.wb.set_cell_contents("Sheet1", "A1", "5")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A2"), Decimal('6'))
+        # A3 was not needed for A2, so it is still stale.
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1'), ('Sheet1', 'A2')])
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A3"), Decimal('60'))
+        self.assertEqual(self.called_cells[2:], [('Sheet1', 'A3')])
+
+    def test_only_required_cells_evaluated(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "C1", "=A1+2")
+        self.wb.get_cell_value("Sheet1", "B1")
+        self.assertIn(('Sheet1', 'B1'), self.called_cells)
+        self.assertNotIn(('Sheet1', 'C1'), self.called_cells)
+
+    def test_notifications_emitted_when_computed(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1+1")
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1')])
+
+        self.wb.get_cell_value("Sheet1", "A2")
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1'), ('Sheet1', 'A2')])
+
+        # Re-reading a clean cell doesn't notify again.
+        self.wb.get_cell_value("Sheet1", "A2")
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1'), ('Sheet1', 'A2')])
+
+    def test_recalculate(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "A3", "=A2+1")
+        self.wb.recalculate()
+        self.assertEqual(self.wb.dirty, set())
+        self.assertEqual(self.called_cells, [('Sheet1', 'A1'), ('Sheet1', 'A2'), ('Sheet1', 'A3')])
+
+    def test_cycle(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=B1")
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "C1", "=A1*2")
+
+        for loc in ["A1", "B1", "C1"]:
+            value = self.wb.get_cell_value("Sheet1", loc)
+            self.assertTrue(isinstance(value, CellError))
+            self.assertEqual(value.get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+        # Breaking the cycle recomputes the former members.
+        self.wb.set_cell_contents("Sheet1", "B1", "3")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "C1"), Decimal('6'))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal('3'))
+
+    def test_sheet_added_later(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=Sheet2!A1+1")
+        value = self.wb.get_cell_value("Sheet1", "A1")
+        self.assertEqual(value.get_type(), CellErrorType.BAD_REFERENCE)
+
+        self.wb.new_sheet("Sheet2")
+        self.wb.set_cell_contents("Sheet2", "A1", "4")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal('5'))
+
+    def test_quoted_sheet_reference_tracked(self):
+        self.wb.new_sheet("Other Sheet")
+        self.wb.set_cell_contents("Sheet1", "A1", "='Other Sheet'!A1+1")
+        self.wb.set_cell_contents("Other Sheet", "A1", "2")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal('3'))
+
+        eager = Workbook()
+        eager.new_sheet("Sheet1")
+        eager.new_sheet("Other Sheet")
+        eager.set_cell_contents("Sheet1", "A1", "='Other Sheet'!A1+1")
+        eager.set_cell_contents("Other Sheet", "A1", "=Sheet1!B1")
+        eager.set_cell_contents("Sheet1", "B1", "2")
+        self.assertEqual(eager.get_cell_value("Sheet1", "A1"), Decimal('3'))
+
+    def test_long_chain_does_not_recurse(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        # Deep enough that evaluating through nested get_cell_value() calls
+        # would exceed the default recursion limit.
+        for i in range(2, 401):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", f"=A{i-1}+1")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A400"), Decimal('400'))
+
+    def test_matches_eager(self):
+        eager = Workbook()
+        eager.new_sheet("Sheet1")
+        edits = [("A1", "2"), ("B1", "=A1*3"), ("C1", "=B1&\"x\""), ("D1", "=B1/A2"),
+                 ("A2", "4"), ("A1", "'text"), ("E1", "=D1+1"), ("A1", "7")]
+        for loc, contents in edits:
+            eager.set_cell_contents("Sheet1", loc, contents)
+            self.wb.set_cell_contents("Sheet1", loc, contents)
+
+        for loc in ["A1", "B1", "C1", "D1", "E1", "A2"]:
+            expected = eager.get_cell_value("Sheet1", loc)
+            actual = self.wb.get_cell_value("Sheet1", loc)
+            if isinstance(expected, CellError):
+                self.assertEqual(expected.get_type(), actual.get_type())
+            else:
+                self.assertEqual(expected, actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
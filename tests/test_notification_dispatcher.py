@@ -0,0 +1,145 @@
+import context
+import threading
+import unittest
+from sheets.workbook import Workbook
+from sheets.notification_dispatcher import NotificationDispatcher
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.called_cells = []
+
+    def tearDown(self):
+        self.wb.disable_async_notifications()
+        del self.wb
+
+    def on_cells_changed(self, workbook, changed_cells):
+        self.called_cells.append(list(changed_cells))
+
+    def raise_exception(self, workbook, changed_cells):
+        raise Exception("listener failure")
+
+    def test_async_delivery_preserves_order(self):
+        self.wb.notify_cells_changed(self.on_cells_changed)
+        self.wb.enable_async_notifications()
+
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1+1")
+        self.wb.set_cell_contents("Sheet1", "A1", "5")
+        self.assertTrue(self.wb.flush_notifications(timeout=5))
+
+        non_empty = [cells for cells in self.called_cells if cells]
+        self.assertEqual(non_empty, [[('Sheet1', 'A1')], [('Sheet1', 'A2')],
+                                     [('Sheet1', 'A1')], [('Sheet1', 'A2')]])
+
+    def test_exception_isolation(self):
+        self.wb.notify_cells_changed(self.raise_exception)
+        self.wb.notify_cells_changed(self.on_cells_changed)
+        self.wb.enable_async_notifications()
+
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.flush_notifications(timeout=5)
+
+        self.assertIn([('Sheet1', 'A1')], self.called_cells)
+        stats = self.wb.get_notification_stats()
+        self.assertGreater(stats[0].errors, 0)
+        self.assertEqual(stats[1].errors, 0)
+
+    def test_listener_stats_record_lag(self):
+        self.wb.notify_cells_changed(self.on_cells_changed)
+        self.wb.enable_async_notifications()
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.flush_notifications(timeout=5)
+
+        stats = self.wb.get_notification_stats()[0]
+        self.assertEqual(stats.delivered, len(self.called_cells))
+        self.assertGreaterEqual(stats.max_lag, stats.get_mean_lag())
+        self.assertGreaterEqual(stats.get_mean_lag(), 0)
+
+    def test_disable_delivers_pending_and_returns_to_inline(self):
+        self.wb.notify_cells_changed(self.on_cells_changed)
+        self.wb.enable_async_notifications()
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.disable_async_notifications()
+        self.assertIn([('Sheet1', 'A1')], self.called_cells)
+
+        self.called_cells.clear()
+        self.wb.set_cell_contents("Sheet1", "A2", "2")
+        self.assertIn([('Sheet1', 'A2')], self.called_cells)
+
+    def test_enable_twice_raises(self):
+        self.wb.enable_async_notifications()
+        with self.assertRaises(ValueError):
+            self.wb.enable_async_notifications()
+
+    def test_invalid_backpressure_policy(self):
+        with self.assertRaises(ValueError):
+            self.wb.enable_async_notifications(backpressure='explode')
+        self.assertIsNone(self.wb.notification_dispatcher)
+
+
+class TestBackpressure(unittest.TestCase):
+    def setUp(self):
+        self.called_cells = []
+        self.gate = threading.Event()
+
+    def slow_listener(self, workbook, changed_cells):
+        self.gate.wait(5)
+        self.called_cells.append(list(changed_cells))
+
+    def _submit(self, dispatcher, cells):
+        dispatcher.submit(None, [(0, self.slow_listener, cells)])
+
+    def _fill(self, dispatcher):
+        # The first batch is picked up by the worker and parks in the listener,
+        # the second one fills the queue.
+        self._submit(dispatcher, [('Sheet1', 'A1')])
+        while dispatcher.get_queue_depth() != 0:
+            pass
+        self._submit(dispatcher, [('Sheet1', 'A2')])
+
+    def test_drop_oldest(self):
+        dispatcher = NotificationDispatcher(max_queue_size=1, backpressure='drop_oldest')
+        dispatcher.start()
+        self._fill(dispatcher)
+        self._submit(dispatcher, [('Sheet1', 'A3')])
+        self.gate.set()
+        dispatcher.stop()
+
+        self.assertEqual(self.called_cells, [[('Sheet1', 'A1')], [('Sheet1', 'A3')]])
+        self.assertEqual(dispatcher.dropped_batches, 1)
+        self.assertEqual(dispatcher.get_listener_stats()[0].dropped, 1)
+
+    def test_coalesce(self):
+        dispatcher = NotificationDispatcher(max_queue_size=1, backpressure='coalesce')
+        dispatcher.start()
+        self._fill(dispatcher)
+        self._submit(dispatcher, [('Sheet1', 'A3'), ('Sheet1', 'A2')])
+        self.gate.set()
+        dispatcher.stop()
+
+        self.assertEqual(self.called_cells,
+                         [[('Sheet1', 'A1')], [('Sheet1', 'A2'), ('Sheet1', 'A3')]])
+        self.assertEqual(dispatcher.coalesced_batches, 1)
+
+    def test_block(self):
+        dispatcher = NotificationDispatcher(max_queue_size=1, backpressure='block')
+        dispatcher.start()
+        self._fill(dispatcher)
+
+        submitter = threading.Thread(target=self._submit, args=(dispatcher, [('Sheet1', 'A3')]))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+
+        self.gate.set()
+        submitter.join(5)
+        dispatcher.stop()
+        self.assertEqual(self.called_cells,
+                         [[('Sheet1', 'A1')], [('Sheet1', 'A2')], [('Sheet1', 'A3')]])
+
+
+if __name__ == '__main__':
+    unittest.main()
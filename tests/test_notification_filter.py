@@ -0,0 +1,97 @@
+import context
+import unittest
+from sheets import Workbook, NotificationFilter
+from sheets.notification_filter import NotificationRouter, parse_range_string
+
+
+class TestNotificationFilter(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("Sheet2")
+        self.all_cells = []
+        self.filtered_calls = []
+
+    def tearDown(self):
+        del self.wb
+
+    def on_all_cells(self, workbook, changed_cells):
+        self.all_cells.extend(changed_cells)
+
+    def on_filtered(self, workbook, changed_cells):
+        self.filtered_calls.append(list(changed_cells))
+
+    def test_parse_range_string(self):
+        self.assertEqual(parse_range_string("A1:C10"), ((0, 0), (9, 2)))
+        self.assertEqual(parse_range_string("c10:a1"), ((0, 0), (9, 2)))
+        self.assertEqual(parse_range_string("B2"), ((1, 1), (1, 1)))
+        with self.assertRaises(ValueError):
+            parse_range_string("A1:B2:C3")
+        for range_str in ["A1:A10000", "A20000", "ZZZZZ1:A1"]:
+            with self.assertRaises(ValueError):
+                parse_range_string(range_str)
+        self.assertEqual(parse_range_string("A9999:ZZZZ9999"), ((9998, 0), (9998, 475253)))
+
+    def test_empty_filter_raises(self):
+        with self.assertRaises(ValueError):
+            NotificationFilter()
+
+    def test_sheet_filter(self):
+        self.wb.notify_cells_changed(self.on_filtered, NotificationFilter(sheets=["sheet2"]))
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.assertEqual(self.filtered_calls, [])
+
+        self.wb.set_cell_contents("Sheet2", "A1", "=Sheet1!A1")
+        self.assertEqual(self.filtered_calls, [[('Sheet2', 'A1')]])
+
+        self.filtered_calls.clear()
+        self.wb.set_cell_contents("Sheet1", "A1", "2")
+        self.assertEqual(self.filtered_calls, [[('Sheet2', 'A1')]])
+
+    def test_range_filter_receives_only_matching_cells(self):
+        self.wb.notify_cells_changed(self.on_all_cells)
+        self.wb.notify_cells_changed(self.on_filtered,
+                                     NotificationFilter(ranges=[("Sheet1", "B2:C3")]))
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "B2", "=A1")
+        self.wb.set_cell_contents("Sheet1", "D4", "=A1")
+        self.wb.set_cell_contents("Sheet2", "B2", "=Sheet1!A1")
+        self.assertEqual(self.filtered_calls, [[('Sheet1', 'B2')]])
+
+        self.filtered_calls.clear()
+        self.wb.set_cell_contents("Sheet1", "A1", "2")
+        self.assertEqual(self.filtered_calls, [[('Sheet1', 'B2')]])
+        self.assertIn(('Sheet1', 'D4'), self.all_cells)
+
+    def test_cell_filter(self):
+        self.wb.notify_cells_changed(self.on_filtered,
+                                     NotificationFilter(cells=[("Sheet1", "a1"), ("Sheet2", "C5")]))
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.wb.set_cell_contents("Sheet1", "A2", "1")
+        self.wb.set_cell_contents("Sheet2", "C5", "1")
+        self.assertEqual(self.filtered_calls, [[('Sheet1', 'A1')], [('Sheet2', 'C5')]])
+
+    def test_unfiltered_listeners_unchanged(self):
+        self.wb.notify_cells_changed(self.on_all_cells)
+        self.wb.notify_cells_changed(self.on_filtered, NotificationFilter(sheets=["Sheet2"]))
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        self.assertEqual(self.all_cells, [('Sheet1', 'A1')])
+        self.assertEqual(self.filtered_calls, [])
+
+
+class TestNotificationRouter(unittest.TestCase):
+    def test_overlapping_ranges(self):
+        router = NotificationRouter()
+        router.add(0, NotificationFilter(ranges=[("Sheet1", "A1:A100")]))
+        router.add(1, NotificationFilter(ranges=[("Sheet1", "A50:B60"), ("Sheet1", "Z1:Z2")]))
+        router.add(2, NotificationFilter(ranges=[("Sheet1", "A200:A300")]))
+
+        routed = router.route([('Sheet1', 'A55'), ('Sheet1', 'A10'), ('Sheet1', 'B250'),
+                               ('Sheet1', 'Z2'), ('sheet1', 'A250')])
+        self.assertEqual(routed, {0: [('Sheet1', 'A55'), ('Sheet1', 'A10')],
+                                  1: [('Sheet1', 'A55'), ('Sheet1', 'Z2')],
+                                  2: [('sheet1', 'A250')]})
+
+
+if __name__ == '__main__':
+    unittest.main()
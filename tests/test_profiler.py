@@ -0,0 +1,120 @@
+import context
+import threading
+import unittest
+from sheets import Workbook
+from sheets.profiler import Profiler, OperationStats
+
+
+class TestProfiler(unittest.TestCase):
+    def test_nested_operations_count_once(self):
+        seen = []
+        profiler = Profiler(hook=seen.append)
+        with profiler.operation('outer'):
+            with profiler.operation('inner'):
+                profiler.add_time('parse_time', 0.5)
+            profiler.count_cells(3)
+        self.assertEqual([stats.name for stats in seen], ['outer'])
+        self.assertEqual(seen[0].parse_time, 0.5)
+        self.assertEqual(seen[0].cells_evaluated, 3)
+        self.assertEqual(list(profiler.operations), ['outer'])
+
+    def test_sampling(self):
+        profiler = Profiler(sample_every=3)
+        self.assertEqual([profiler.should_sample() for _ in range(6)],
+                         [False, False, True, False, False, True])
+        with self.assertRaises(ValueError):
+            Profiler(sample_every=0)
+
+    def test_operations_are_per_thread(self):
+        # E.g. a notify function calling back into the workbook on the
+        # dispatcher thread while the main thread is inside an operation.
+        seen = []
+        profiler = Profiler(hook=seen.append)
+
+        def listener():
+            with profiler.operation('get_cell_value'):
+                profiler.count_cells(2)
+
+        with profiler.operation('set_cell_contents'):
+            profiler.count_cells(1)
+            thread = threading.Thread(target=listener)
+            thread.start()
+            thread.join()
+            self.assertEqual(profiler.current.name, 'set_cell_contents')
+        self.assertIsNone(profiler.current)
+        self.assertEqual([(stats.name, stats.cells_evaluated) for stats in seen],
+                         [('get_cell_value', 2), ('set_cell_contents', 1)])
+
+    def test_hook_errors_are_ignored(self):
+        def hook(stats):
+            raise RuntimeError()
+        profiler = Profiler(hook=hook)
+        with profiler.operation('op'):
+            pass
+        self.assertEqual(profiler.operations['op'].calls, 1)
+
+
+class TestWorkbookProfiling(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+
+    def test_disabled_by_default(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=1+2")
+        self.assertEqual(self.wb.stats(), {'operations': {}, 'hot_cells': [], 'sample_every': 1})
+
+    def test_operation_stats(self):
+        seen = []
+        self.wb.notify_cells_changed(lambda wb, cells: None)
+        self.wb.enable_profiling(hook=seen.append)
+        self.wb.set_cell_contents("Sheet1", "A1", "1")
+        for i in range(2, 6):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", f"=A{i - 1} * 2")
+        self.wb.set_cell_contents("Sheet1", "A1", "3")
+        self.wb.get_cell_value("Sheet1", "A5")
+
+        self.assertEqual([stats.name for stats in seen],
+                         ['set_cell_contents'] * 6 + ['get_cell_value'])
+        self.assertIsInstance(seen[0], OperationStats)
+        last_edit = seen[5]
+        self.assertEqual(last_edit.cells_evaluated, 5)
+        self.assertEqual(last_edit.cells_sampled, 5)
+        self.assertGreater(last_edit.notify_time, 0)
+        self.assertGreater(last_edit.sort_time, 0)
+
+        operations = self.wb.stats()['operations']
+        self.assertEqual(set(operations), {'set_cell_contents', 'get_cell_value'})
+        edits = operations['set_cell_contents']
+        self.assertEqual(edits['calls'], 6)
+        self.assertGreater(edits['parse_time'], 0)
+        self.assertGreater(edits['graph_time'], 0)
+        self.assertGreater(edits['sort_time'], 0)
+        self.assertGreaterEqual(edits['total_time'], edits['parse_time'] + edits['eval_time'])
+
+    def test_hot_cells(self):
+        self.wb.enable_profiling(sample_every=2)
+        for i in range(1, 11):
+            self.wb.set_cell_contents("Sheet1", f"A{i}", f"={i}")
+        stats = self.wb.stats(hot_cells=3)
+        self.assertEqual(stats['sample_every'], 2)
+        self.assertEqual(len(stats['hot_cells']), 3)
+        times = [cell['time'] for cell in stats['hot_cells']]
+        self.assertEqual(times, sorted(times, reverse=True))
+        self.assertEqual(stats['hot_cells'][0]['sheet'], "Sheet1")
+        self.assertLess(stats['operations']['set_cell_contents']['cells_sampled'],
+                        stats['operations']['set_cell_contents']['cells_evaluated'])
+
+    def test_nested_and_disabled(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=Sheet1_1!A2")
+        self.wb.enable_profiling()
+        self.wb.copy_sheet("Sheet1")
+        self.wb.disable_profiling()
+        self.wb.set_cell_contents("Sheet1", "A2", "1")
+        operations = self.wb.stats()['operations']
+        self.assertEqual(list(operations), ['copy_sheet'])
+        self.assertEqual(operations['copy_sheet']['calls'], 1)
+        self.assertGreater(operations['copy_sheet']['cells_evaluated'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
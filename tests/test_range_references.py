@@ -0,0 +1,130 @@
+import context
+import unittest
+from decimal import Decimal
+from sheets import Workbook, CellErrorType
+from sheets.range_index import RangeIndex
+
+
+class TestRangeIndex(unittest.TestCase):
+    def test_query(self):
+        index = RangeIndex()
+        index.add(0, 0, 0, 9998, 0, "col A")
+        index.add(1, 4, 1, 9, 3, "B5:D10")
+        index.add(2, 9, 3, 9, 3, "D10")
+
+        self.assertEqual(index.query(50, 0), ["col A"])
+        self.assertEqual(index.query(50, 1), [])
+        self.assertEqual(sorted(index.query(9, 3)), ["B5:D10", "D10"])
+        self.assertEqual(index.query(3, 2), [])
+        self.assertEqual(len(index), 3)
+
+        index.remove(1)
+        self.assertEqual(index.query(9, 3), ["D10"])
+        self.assertNotIn(1, index)
+        with self.assertRaises(ValueError):
+            index.add(2, 0, 0, 0, 0, "again")
+
+    def test_matches_brute_force(self):
+        index = RangeIndex()
+        rects = {}
+        key = 0
+        for top in range(0, 40, 7):
+            for height in (0, 1, 5, 30):
+                for left, right in ((0, 0), (1, 4), (3, 9)):
+                    rects[key] = (top, left, top + height, right)
+                    index.add(key, top, left, top + height, right, key)
+                    key += 1
+        for key in list(rects)[::3]:
+            index.remove(key)
+            del rects[key]
+
+        for row in range(80):
+            for col in range(11):
+                expected = sorted(k for k, (t, l, b, r) in rects.items()
+                                  if t <= row <= b and l <= col <= r)
+                self.assertEqual(sorted(index.query(row, col)), expected)
+
+
+class TestRangeReferences(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("Sheet2")
+
+    def tearDown(self):
+        del self.wb
+
+    def test_range_is_one_index_entry(self):
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1:A9999")
+        self.assertEqual(len(self.wb.graph.get_all_nodes()), 1)
+        self.assertEqual(len(self.wb.graph.range_index[self.wb._get_sheet("Sheet1").sheet_id]), 1)
+
+        # A cell set inside the range later has the formula as a dependent.
+        self.wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A9999)")
+        changed = []
+        self.wb.notify_cells_changed(lambda wb, cells: changed.extend(cells))
+        self.wb.set_cell_contents("Sheet1", "A5000", "1")
+        self.wb.set_cell_contents("Sheet1", "B5000", "2")
+        self.assertEqual(changed, [("Sheet1", "A5000"), ("Sheet1", "B1"), ("Sheet1", "B5000")])
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B1"), Decimal(1))
+
+        # Changing the formula drops its range.
+        self.wb.set_cell_contents("Sheet1", "B1", "=A1")
+        self.assertEqual(self.wb.graph.range_index, {})
+
+    def test_bare_range_is_value_error(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=B1:C2")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1").get_type(), CellErrorType.TYPE_ERROR)
+
+    def test_bad_range(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=B1:ZZZZZ2")
+        self.assertEqual(self.wb._get_cell("Sheet1", "A1").range_nodes, [None])
+
+    def test_cycle_through_range(self):
+        self.wb.set_cell_contents("Sheet1", "A5", "=A1:A3")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A5+1")
+        for loc in ["A2", "A5"]:
+            self.assertEqual(self.wb.get_cell_value("Sheet1", loc).get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+        self.wb.set_cell_contents("Sheet1", "A2", "3")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A5").get_type(), CellErrorType.TYPE_ERROR)
+
+    def test_range_containing_its_own_cell(self):
+        self.wb.set_cell_contents("Sheet1", "B2", "=A1:C3")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B2").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_cross_sheet_range_rename_and_copy(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=Sheet2!A1:B2 & A2:A3")
+        self.wb.rename_sheet("Sheet2", "Data Sheet")
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "A1"), "='Data Sheet'!A1:B2&A2:A3")
+
+        self.wb.copy_sheet("Sheet1")
+        copied = self.wb._get_cell("Sheet1_1", "A1")
+        data_id = self.wb._get_sheet("Data Sheet").sheet_id
+        copy_id = self.wb._get_sheet("Sheet1_1").sheet_id
+        self.assertEqual(copied.range_nodes, [(data_id, 0, 0, 1, 1), (copy_id, 1, 0, 2, 0)])
+
+    def test_range_to_missing_sheet_resolved_later(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=SUM(Later!A1:A2)")
+        self.wb.new_sheet("Later")
+        self.wb.set_cell_contents("Later", "A2", "1")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal(1))
+
+    def test_lazy_range_precedents(self):
+        wb = Workbook(eval_mode='lazy')
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "1")
+        wb.set_cell_contents("Sheet1", "A2", "=A1+1")
+        wb.set_cell_contents("Sheet1", "B1", "=SUM(A1:A2)")
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(3))
+        changed = []
+        wb.notify_cells_changed(lambda wb, cells: changed.extend(cells))
+        wb.set_cell_contents("Sheet1", "A1", "5")
+        self.assertEqual(changed, [("Sheet1", "A1")])
+        # Reading B1 recomputes the cells of its range first.
+        self.assertEqual(wb.get_cell_value("Sheet1", "B1"), Decimal(11))
+        self.assertEqual(changed, [("Sheet1", "A1"), ("Sheet1", "A2"), ("Sheet1", "B1")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import unittest
 from decimal import Decimal
 from sheets.cell_error_type import CellErrorType, CellError
 from sheets.workbook import Workbook
+from sheets.workbook_utility import pack_node
 from sheets.formula_evaluator import FormulaEvaluator
 
 class TestRenameSheets(unittest.TestCase):
@@ -575,5 +576,51 @@ class TestRenameSheetSingleQuotes(unittest.TestCase):
         self.wb.rename_sheet("Sheet2-", "Sheet2)")
         self.assertEqual(self.wb.get_cell_contents("Sheet1", "A1"), "='Sheet2)'!A1")
 
+class TestRenameSheetReferenceIndex(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("Sheet2")
+
+    def test_reference_index_tracks_referencing_cells(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=Sheet2!A1 + 1")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1")
+        sheet2_id = self.wb._get_sheet("Sheet2").sheet_id
+        sheet1_id = self.wb._get_sheet("Sheet1").sheet_id
+        self.assertEqual(self.wb.sheet_references[sheet2_id], {pack_node(sheet1_id, (0, 0))})
+
+        self.wb.set_cell_contents("Sheet1", "A1", "=5")
+        self.assertEqual(self.wb.sheet_references[sheet2_id], set())
+
+    def test_rename_keeps_graph_nodes(self):
+        self.wb.set_cell_contents("Sheet2", "A1", "3")
+        self.wb.set_cell_contents("Sheet1", "A1", "=Sheet2!A1 + 1")
+        nodes = set(self.wb.graph.get_all_nodes())
+
+        self.wb.rename_sheet("Sheet2", "Other")
+        self.assertEqual(set(self.wb.graph.get_all_nodes()), nodes)
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "A1"), "=Other!A1+1")
+
+        self.wb.set_cell_contents("Other", "A1", "10")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal('11'))
+
+    def test_rename_matches_references_case_insensitively(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "=sHeEt2!A1")
+        self.wb.rename_sheet("SHEET2", "Renamed")
+        self.assertEqual(self.wb.get_cell_contents("Sheet1", "A1"), "=Renamed!A1")
+
+    def test_rename_to_previously_missing_name_recalculates_dependents(self):
+        self.wb.set_cell_contents("Sheet1", "A1", "='New Name'!B1 * 2")
+        self.wb.set_cell_contents("Sheet1", "A2", "=A1 + 1")
+        self.wb.set_cell_contents("Sheet2", "B1", "4")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A2").get_type(), CellErrorType.BAD_REFERENCE)
+
+        self.wb.rename_sheet("Sheet2", "New Name")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A1"), Decimal('8'))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A2"), Decimal('9'))
+
+        self.wb.set_cell_contents("New Name", "B1", "5")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "A2"), Decimal('11'))
+
 if __name__ == '__main__':
     unittest.main()
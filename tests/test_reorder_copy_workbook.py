@@ -1,5 +1,6 @@
 import context
 import unittest
+import unittest.mock
 from decimal import Decimal
 from sheets.cell_error_type import CellErrorType, CellError
 from sheets.workbook import Workbook
@@ -326,6 +327,73 @@ class TestWorkbookReorderCopy(unittest.TestCase):
         self.workbook.copy_sheet("Sheet2")
         self.assertEqual(self.workbook.get_cell_value("Sheet1", "A1").get_type(), CellErrorType.DIVIDE_BY_ZERO)
 
+    def test_copy_does_not_reparse_formulas(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.set_cell_contents("Sheet1", "A1", "5")
+        self.workbook.set_cell_contents("Sheet1", "B1", "=A1*2")
+        self.workbook.set_cell_contents("Sheet1", "C1", "=Sheet1!B1+B1")
+
+        with unittest.mock.patch('sheets.formula_table.FormulaParser') as parser:
+            self.workbook.copy_sheet("Sheet1")
+            parser.assert_not_called()
+
+        self.assertEqual(self.workbook.get_cell_value("Sheet1_1", "C1"), Decimal('20'))
+        # The copy shares the (immutable) Formula but resolves its references on
+        # its own, so editing either sheet leaves the other alone.
+        original = self.workbook._get_cell("Sheet1", "B1")
+        copied = self.workbook._get_cell("Sheet1_1", "B1")
+        self.assertIs(copied.formula, original.formula)
+        self.assertIsNot(original.ref_node_map, copied.ref_node_map)
+        self.workbook.set_cell_contents("Sheet1_1", "A1", "1")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1_1", "C1"), Decimal('12'))
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "C1"), Decimal('20'))
+
+    def test_copy_notifies_once(self):
+        calls = []
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.new_sheet("Sheet2")
+        self.workbook.set_cell_contents("Sheet1", "A1", "1")
+        self.workbook.set_cell_contents("Sheet1", "A2", "=A1+1")
+        self.workbook.set_cell_contents("Sheet1", "A3", "''")
+        self.workbook.set_cell_contents("Sheet2", "A1", "=Sheet1_1!A2")
+        self.workbook.notify_cells_changed(lambda wb, cells: calls.append(list(cells)))
+
+        self.workbook.copy_sheet("Sheet1")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(set(calls[0]), set([('Sheet1_1', 'A1'), ('Sheet1_1', 'A2'), ('Sheet1_1', 'A3'), ('Sheet2', 'A1')]))
+        self.assertEqual(self.workbook.get_cell_value("Sheet2", "A1"), Decimal('2'))
+
+    def test_copy_creates_cycle_through_other_sheet(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.new_sheet("Sheet2")
+        self.workbook.set_cell_contents("Sheet1", "A1", "=Sheet2!A1")
+        self.workbook.set_cell_contents("Sheet2", "A1", "=Sheet1_1!A1")
+
+        self.workbook.copy_sheet("Sheet1")
+        for sheet in ["Sheet1", "Sheet2", "Sheet1_1"]:
+            self.assertEqual(self.workbook.get_cell_value(sheet, "A1").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_copy_preserves_extent(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.set_cell_contents("Sheet1", "C5", "=D10+1")
+        self.workbook.set_cell_contents("Sheet1", "B2", "1")
+        self.workbook.copy_sheet("Sheet1")
+        self.assertEqual(self.workbook.get_sheet_extent("Sheet1_1"), (3, 5))
+
+        self.workbook.set_cell_contents("Sheet1_1", "C5", None)
+        self.assertEqual(self.workbook.get_sheet_extent("Sheet1_1"), (2, 2))
+        self.assertEqual(self.workbook.get_sheet_extent("Sheet1"), (3, 5))
+
+    def test_copy_in_lazy_mode(self):
+        workbook = Workbook(eval_mode='lazy')
+        workbook.new_sheet("Sheet1")
+        workbook.set_cell_contents("Sheet1", "A1", "3")
+        workbook.set_cell_contents("Sheet1", "B1", "=A1+1")
+        workbook.copy_sheet("Sheet1")
+        workbook.set_cell_contents("Sheet1_1", "A1", "10")
+        self.assertEqual(workbook.get_cell_value("Sheet1_1", "B1"), Decimal('11'))
+        self.assertEqual(workbook.get_cell_value("Sheet1", "B1"), Decimal('4'))
+
     def tearDown(self):
         del self.workbook
 
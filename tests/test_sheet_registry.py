@@ -0,0 +1,75 @@
+import context
+import unittest
+from decimal import Decimal
+from sheets.sheet_registry import SheetRegistry
+from sheets.worksheet import Worksheet
+from sheets.workbook import Workbook
+from sheets.workbook_utility import pack_node
+
+
+class TestSheetRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = SheetRegistry()
+
+    def test_ids_are_case_insensitive_and_stable(self):
+        sheet_id = self.registry.get_id("Sheet1")
+        self.assertEqual(self.registry.get_id("SHEET1"), sheet_id)
+        self.assertNotEqual(self.registry.get_id("Sheet2"), sheet_id)
+
+    def test_add_takes_over_reserved_id(self):
+        reserved = self.registry.get_id("Later")
+        self.assertIsNone(self.registry.find_sheet("later"))
+
+        sheet = Worksheet("Later")
+        self.registry.add(sheet)
+        self.assertEqual(sheet.sheet_id, reserved)
+        self.assertIs(self.registry.find_sheet("LATER"), sheet)
+        self.assertIs(self.registry.get_sheet(reserved), sheet)
+
+    def test_remove_keeps_id_reserved(self):
+        sheet = Worksheet("Sheet1")
+        self.registry.add(sheet)
+        self.registry.remove(sheet.sheet_id)
+        self.assertIsNone(self.registry.find_sheet("Sheet1"))
+        self.assertEqual(self.registry.get_id("Sheet1"), sheet.sheet_id)
+
+    def test_rename(self):
+        sheet = Worksheet("Sheet1")
+        self.registry.add(sheet)
+        self.assertIsNone(self.registry.rename(sheet.sheet_id, "Sheet1", "Other"))
+        self.assertIs(self.registry.find_sheet("other"), sheet)
+        self.assertIsNone(self.registry.find_sheet("Sheet1"))
+
+        reserved = self.registry.get_id("Third")
+        self.assertEqual(self.registry.rename(sheet.sheet_id, "Other", "Third"), reserved)
+        self.assertEqual(self.registry.get_id("Third"), sheet.sheet_id)
+
+
+class TestWorkbookSheetIds(unittest.TestCase):
+    def test_recreated_sheet_reuses_id(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.new_sheet("Sheet2")
+        wb.set_cell_contents("Sheet1", "A1", "=Sheet2!A1 + 1")
+        sheet2_id = wb._get_sheet("Sheet2").sheet_id
+
+        wb.del_sheet("Sheet2")
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1").get_error_type_string(), "#REF!")
+
+        wb.new_sheet("sheet2")
+        self.assertEqual(wb._get_sheet("Sheet2").sheet_id, sheet2_id)
+        wb.set_cell_contents("sheet2", "A1", "5")
+        self.assertEqual(wb.get_cell_value("Sheet1", "A1"), Decimal('6'))
+
+    def test_refs_resolved_to_nodes(self):
+        wb = Workbook()
+        wb.new_sheet("Sheet1")
+        wb.set_cell_contents("Sheet1", "A1", "=B1 + Missing!C3 + A10000")
+        cell = wb._get_cell("Sheet1", "A1")
+        self.assertEqual(cell.ref_nodes[0], pack_node(wb._get_sheet("Sheet1").sheet_id, (0, 1)))
+        self.assertIn(None, cell.ref_nodes)
+        self.assertEqual(len(cell.ref_nodes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
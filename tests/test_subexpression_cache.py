@@ -0,0 +1,109 @@
+import context
+import unittest
+import random
+from decimal import Decimal
+from sheets import Workbook, CellError
+
+
+def values(wb):
+    result = dict()
+    for sheet in wb.list_sheets():
+        for location in wb._get_sheet(sheet).cell_map:
+            value = wb._get_sheet(sheet).cell_map[location].value
+            if isinstance(value, CellError):
+                value = value.get_type()
+            result[sheet.lower(), location] = value
+    return result
+
+
+class TestSubexpressionCache(unittest.TestCase):
+    def setUp(self):
+        self.wb = Workbook()
+        self.wb.new_sheet("Sheet1")
+        self.wb.new_sheet("Inputs")
+        self.wb.set_cell_contents("Inputs", "A1", "3")
+        self.wb.set_cell_contents("Inputs", "A2", "4")
+        for row in range(1, 101):
+            self.wb.set_cell_contents("Sheet1", f"A{row}", str(row))
+            self.wb.set_cell_contents("Sheet1", f"B{row}", f"=(Inputs!A1*Inputs!A2)+A{row}")
+
+    def test_shared_subexpression_is_reused(self):
+        stats = self.wb.get_subexpression_stats()
+        self.assertEqual(stats['shared'], 1)
+
+        before = self.wb.get_subexpression_stats()
+        self.wb.set_cell_contents("Inputs", "A1", "5")
+        after = self.wb.get_subexpression_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 99)
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B7"), Decimal(27))
+
+        # Editing a cell outside the subexpression keeps its value.
+        self.wb.set_cell_contents("Sheet1", "A7", "10")
+        self.assertEqual(self.wb.get_subexpression_stats()['misses'], after['misses'])
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B7"), Decimal(30))
+        self.assertGreater(self.wb.get_subexpression_stats()['hit_rate'], 0.9)
+
+    def test_ranges_and_removed_users(self):
+        self.wb.set_cell_contents("Sheet1", "C1", "=SUM(Inputs!A1:A3) * 2 + 1")
+        self.wb.set_cell_contents("Sheet1", "C2", "=SUM(inputs!A1:A3) / 7")
+        self.wb.set_cell_contents("Inputs", "A3", "7")
+        self.assertEqual(self.wb.get_subexpression_stats()['shared'], 2)
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "C1"), Decimal(29))
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "C2"), Decimal(2))
+
+        for row in range(1, 101):
+            self.wb.set_cell_contents("Sheet1", f"B{row}", None)
+        self.wb.set_cell_contents("Sheet1", "C2", "=A1")
+        self.assertEqual(self.wb.get_subexpression_stats()['shared'], 0)
+        self.assertEqual(len(self.wb.subexpressions.entries), 1)
+        self.assertEqual((self.wb.subexpressions.by_node, self.wb.subexpressions.by_range), ({}, {}))
+
+    def test_deleted_and_recreated_sheet(self):
+        self.wb.del_sheet("Inputs")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B1").get_type().name, 'BAD_REFERENCE')
+        self.wb.new_sheet("Inputs")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B2"), Decimal(2))
+        self.wb.copy_sheet("Sheet1")
+        self.wb.del_sheet("Inputs")
+        self.wb.rename_sheet("Sheet1_1", "Inputs")
+        self.assertEqual(self.wb.get_cell_value("Sheet1", "B3"), Decimal(3 + 1 * 2))
+
+    def test_same_values_as_a_fresh_workbook(self):
+        rng = random.Random(0)
+        contents = ["1", "2", "'x", "#REF!", "=Inputs!A1+1", "=(Sheet1!A1*Sheet1!A2)",
+                    "=(A1*A2)+B1", "=(A1*A2)&\"s\"", "=SUM(A1:A3)+1", "=SUM(A1:A3)*C1",
+                    "=MIN(Inputs!A1, A2)-(A1*A2)", "=(A1*A2)"]
+        for mode in ('eager', 'lazy'):
+            wb = Workbook(mode)
+            wb.new_sheet("Sheet1")
+            wb.new_sheet("Inputs")
+            for step in range(300):
+                sheet = rng.choice(["Sheet1", "Inputs"])
+                location = rng.choice(["A1", "A2", "A3", "B1", "B2", "C1", "C2", "D1"])
+                wb.set_cell_contents(sheet, location, rng.choice(contents))
+                if step % 50 == 49:
+                    wb.del_sheet("Inputs")
+                    wb.new_sheet("Inputs")
+
+                fresh = Workbook()
+                for name in wb.list_sheets():
+                    fresh.new_sheet(name)
+                for name in wb.list_sheets():
+                    for (row, col), cell in wb._get_sheet(name).cell_map.items():
+                        if cell.content is not None:
+                            fresh.set_cell_contents(name, f"{chr(65 + col)}{row + 1}", cell.content)
+                for name in wb.list_sheets():
+                    for location in ["A1", "A2", "A3", "B1", "B2", "C1", "C2", "D1"]:
+                        wb.get_cell_value(name, location)
+                # Compared where both have a cell; either may have empty
+                # cells the other doesn't.
+                actual, expected = values(wb), values(fresh)
+                common = actual.keys() & expected.keys()
+                self.assertEqual({k: actual[k] for k in common}, {k: expected[k] for k in common},
+                                 (mode, step))
+            self.assertGreater(wb.get_subexpression_stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
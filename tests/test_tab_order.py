@@ -0,0 +1,88 @@
+import context
+import random
+import unittest
+from sheets.tab_order import TabOrder
+from sheets import Workbook
+
+
+class TestTabOrder(unittest.TestCase):
+    def test_append_get_index(self):
+        order = TabOrder()
+        for key in range(10):
+            order.append(key, f"sheet{key}")
+        self.assertEqual(len(order), 10)
+        self.assertEqual(list(order), [f"sheet{key}" for key in range(10)])
+        self.assertEqual(order.get(3), "sheet3")
+        self.assertEqual(order.index_of(7), 7)
+        self.assertIn(7, order)
+
+    def test_remove_and_move(self):
+        order = TabOrder()
+        for key in range(5):
+            order.append(key, key)
+        self.assertEqual(order.remove(1), 1)
+        self.assertEqual(list(order), [0, 2, 3, 4])
+        order.move(4, 0)
+        self.assertEqual(list(order), [4, 0, 2, 3])
+        order.move(4, 3)
+        self.assertEqual(list(order), [0, 2, 3, 4])
+        self.assertEqual(order.index_of(3), 2)
+
+        with self.assertRaises(IndexError):
+            order.move(0, 4)
+        with self.assertRaises(ValueError):
+            order.append(0, 0)
+
+    def test_matches_list(self):
+        rng = random.Random(1234)
+        order = TabOrder()
+        expected = []
+        next_key = 0
+        for _ in range(2000):
+            op = rng.random()
+            if op < 0.4 or not expected:
+                order.append(next_key, next_key)
+                expected.append(next_key)
+                next_key += 1
+            elif op < 0.6:
+                key = rng.choice(expected)
+                order.remove(key)
+                expected.remove(key)
+            else:
+                key = rng.choice(expected)
+                index = rng.randrange(len(expected))
+                order.move(key, index)
+                expected.remove(key)
+                expected.insert(index, key)
+        self.assertEqual(list(order), expected)
+        for index, key in enumerate(expected):
+            self.assertEqual(order.index_of(key), index)
+            self.assertEqual(order.get(index), key)
+
+
+class TestWorkbookTabOrder(unittest.TestCase):
+    def test_many_sheets(self):
+        wb = Workbook()
+        for i in range(200):
+            wb.new_sheet(f"Customer{i}")
+        wb.move_sheet("Customer150", 0)
+        wb.del_sheet("Customer3")
+        self.assertEqual(wb.num_sheets(), 199)
+        self.assertEqual(wb.list_sheets()[:3], ["Customer150", "Customer0", "Customer1"])
+        self.assertEqual(wb.list_sheets()[4], "Customer4")
+        self.assertEqual(wb.new_sheet("customer3"), (199, "customer3"))
+        self.assertEqual(wb.copy_sheet("CUSTOMER150"), (200, "Customer150_1"))
+
+    def test_rename_keeps_position(self):
+        wb = Workbook()
+        wb.new_sheet("A")
+        wb.new_sheet("B")
+        wb.new_sheet("C")
+        wb.rename_sheet("b", "Renamed")
+        self.assertEqual(wb.list_sheets(), ["A", "Renamed", "C"])
+        wb.move_sheet("renamed", 2)
+        self.assertEqual(wb.list_sheets(), ["A", "C", "Renamed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
+import unittest.mock
 from sheets.workbook import Workbook
 from sheets.cell_error_type import CellErrorType
+from sheets.workbook_utility import pack_node
 import sheets 
 from decimal import Decimal
 
@@ -134,6 +136,105 @@ class TestWorkbook(unittest.TestCase):
         with self.assertRaises(KeyError):
             self.workbook.del_sheet("NonExistentSheet")
     
+    def test_del_sheet_removes_its_subgraph(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.new_sheet("Sheet2")
+        self.workbook.set_cell_contents("Sheet2", "A1", "1")
+        self.workbook.set_cell_contents("Sheet2", "A2", "=A1+1")
+        self.workbook.set_cell_contents("Sheet2", "A3", "=A2+Sheet1!A1")
+        self.workbook.set_cell_contents("Sheet1", "B1", "=Sheet2!A2*2")
+        self.workbook.set_cell_contents("Sheet1", "B2", "=B1+1")
+        sheet2_id = self.workbook._get_sheet("Sheet2").sheet_id
+
+        calls = []
+        self.workbook.notify_cells_changed(lambda wb, cells: calls.append(list(cells)))
+        self.workbook.del_sheet("Sheet2")
+
+        # Only the referenced cell is left, for the formula that still names it.
+        self.assertEqual(self.workbook.graph.get_group(sheet2_id), {pack_node(sheet2_id, (1, 0))})
+        self.assertEqual(calls, [[("Sheet1", "B1"), ("Sheet1", "B2")]])
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "B2").get_type(), CellErrorType.BAD_REFERENCE)
+
+        # Re-creating the sheet reconnects the formula.
+        self.workbook.new_sheet("Sheet2")
+        self.workbook.set_cell_contents("Sheet2", "A2", "4")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "B2"), Decimal('9'))
+
+    def test_del_sheet_breaks_cycle(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.new_sheet("Sheet2")
+        self.workbook.set_cell_contents("Sheet1", "A1", "=Sheet2!A1")
+        self.workbook.set_cell_contents("Sheet2", "A1", "=Sheet1!A1")
+        self.workbook.set_cell_contents("Sheet1", "A2", "=A1&\"x\"")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A2").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+        self.workbook.del_sheet("Sheet2")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A1").get_type(), CellErrorType.BAD_REFERENCE)
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A2").get_type(), CellErrorType.BAD_REFERENCE)
+
+    def test_self_reference_in_expression(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.set_cell_contents("Sheet1", "B1", "2")
+        self.workbook.set_cell_contents("Sheet1", "A1", "=A1 * B1 + 1")
+        self.workbook.set_cell_contents("Sheet1", "C1", "=A1")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A1").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "C1").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+        self.workbook.set_cell_contents("Sheet1", "A1", "=B1 + 1")
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "C1"), Decimal(3))
+
+    def test_edit_only_analyzes_reachable_cells(self):
+        self.workbook.new_sheet("Sheet1")
+        for i in range(1, 6):
+            self.workbook.set_cell_contents("Sheet1", f"A{i + 1}", f"=A{i} + 1")
+            self.workbook.set_cell_contents("Sheet1", f"B{i + 1}", f"=B{i} + 1")
+        graph = self.workbook.graph
+        visited = set()
+        children = graph._children
+        def recording_children(node):
+            visited.add(node)
+            return children(node)
+        with unittest.mock.patch.object(graph, '_children', recording_children):
+            self.workbook.set_cell_contents("Sheet1", "B3", "=B2 * 10")
+            self.workbook.set_cell_contents("Sheet1", "B1", "=B6")
+        sheet_id = self.workbook._get_sheet("Sheet1").sheet_id
+        b_nodes = {pack_node(sheet_id, (row, 1)) for row in range(6)}
+        self.assertEqual(visited, b_nodes)
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A6"), Decimal(5))
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "B6").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_split_cycle_notifies_cells_leaving_it(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.set_cell_contents("Sheet1", "A1", "=B1")
+        self.workbook.set_cell_contents("Sheet1", "B1", "=A1 + C1")
+        self.workbook.set_cell_contents("Sheet1", "C1", "=B1")
+        self.workbook.set_cell_contents("Sheet1", "D1", "=C1 * 2")
+        changed = []
+        self.workbook.notify_cells_changed(lambda wb, cells: changed.extend(cells))
+
+        # {A1, B1, C1} splits into the cycle {A1, B1} and C1.
+        self.workbook.set_cell_contents("Sheet1", "C1", "5")
+        self.assertEqual(changed, [("Sheet1", "C1"), ("Sheet1", "D1")])
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A1").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "D1"), Decimal(10))
+
+        changed.clear()
+        self.workbook.set_cell_contents("Sheet1", "B1", "=C1 + 1")
+        self.assertEqual(sorted(changed), [("Sheet1", "A1"), ("Sheet1", "B1")])
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "A1"), Decimal(6))
+        self.assertEqual(self.workbook.circular, {})
+
+    def test_known_cycles_are_not_recomputed(self):
+        self.workbook.new_sheet("Sheet1")
+        self.workbook.set_cell_contents("Sheet1", "A1", "1")
+        for row in range(1, 4):
+            self.workbook.set_cell_contents("Sheet1", f"B{row}", f"=A1 + C{row}")
+            self.workbook.set_cell_contents("Sheet1", f"C{row}", f"=B{row}")
+        with unittest.mock.patch.object(self.workbook, '_evaluate_cell',
+                                        wraps=self.workbook._evaluate_cell) as evaluate:
+            self.workbook.set_cell_contents("Sheet1", "A1", "2")
+        self.assertEqual(evaluate.call_count, 1)
+        self.assertEqual(self.workbook.get_cell_value("Sheet1", "C3").get_type(), CellErrorType.CIRCULAR_REFERENCE)
+
     def test_del_sheet_bad_reference(self):
         self.workbook.new_sheet("Sheet1")
         self.workbook.new_sheet("Sheet2")
@@ -3,7 +3,8 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from sheets.workbook_utility import index_to_cell_location, parse_cell_location_string
+from sheets.workbook_utility import index_to_cell_location, parse_cell_location_string, \
+    pack_node, unpack_node, node_sheet_id
 
 class TestParseCellLocation(unittest.TestCase):
     def test_valid_cell_locations(self):
@@ -122,6 +123,16 @@ class TestGenerateCellLocation(unittest.TestCase):
     def test_index_to_cell_location_negative_column_index(self):
         with self.assertRaises(ValueError):
             index_to_cell_location(2, -1)
+
+    def test_pack_unpack_node_round_trip(self):
+        for sheet_id, loc in [(0, (0, 0)), (3, (9998, 475253)), (12345, (17, 702))]:
+            node = pack_node(sheet_id, loc)
+            self.assertEqual(unpack_node(node), (sheet_id, loc))
+            self.assertEqual(node_sheet_id(node), sheet_id)
+
+    def test_pack_node_is_unique(self):
+        nodes = set(pack_node(s, (r, c)) for s in range(3) for r in (0, 1, 9998) for c in (0, 1, 475253))
+        self.assertEqual(len(nodes), 27)
                     
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file